@@ -3,9 +3,33 @@ from __future__ import unicode_literals
 from .config import SQLConfig
 from .queue import SQLQueue
 from .engine import SQLEngineClass
+from .pool import SQLConnectionPool
+from .executor import SQLExecutor
+from .aio import AsyncSQLEngine
+from .cache import SQLResultCache
+from .catalog import SchemaCatalog
+from .statement import SQLStatementCache
+from .retry import RetryPolicy
+from .export import ResultExporter
+from .materializer import DtypeCache
+from .router import SQLEngineGroup
+from .registry import SQLEngineRegistry, get_sql_engine, dispose_sql_engines
 
 __all__ = [
     "SQLQueue",
     "SQLConfig",
-    "SQLEngineClass"
+    "SQLEngineClass",
+    "SQLConnectionPool",
+    "SQLExecutor",
+    "AsyncSQLEngine",
+    "SQLResultCache",
+    "SchemaCatalog",
+    "SQLStatementCache",
+    "RetryPolicy",
+    "ResultExporter",
+    "DtypeCache",
+    "SQLEngineGroup",
+    "SQLEngineRegistry",
+    "get_sql_engine",
+    "dispose_sql_engines"
 ]
\ No newline at end of file
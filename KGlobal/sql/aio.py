@@ -0,0 +1,357 @@
+from __future__ import unicode_literals
+
+from threading import Lock
+from functools import partial
+from time import monotonic
+from .executor import SQLExecutor
+from .materializer import ColumnarMaterializer, ChunkBuilder
+
+import asyncio
+import logging
+
+log = logging.getLogger(__name__)
+
+
+class PendingStatement(object):
+    """
+    State of a statement that an AsyncSQLEngine worker is running, shared with the event loop so a cancelled task can
+    cancel the statement on the server
+    """
+
+    __slots__ = ("engine", "raw_engine", "owns_raw", "cursor", "canceled", "lock")
+
+    def __init__(self):
+        self.engine = None
+        self.raw_engine = None
+        self.owns_raw = False
+        self.cursor = None
+        self.canceled = False
+        self.lock = Lock()
+
+    def attach(self, cursor):
+        """
+        :param cursor: Cursor the worker is about to run the statement on
+        :return: (True/False) if the statement may run or was cancelled before it started
+        """
+
+        with self.lock:
+            self.cursor = cursor
+            return not self.canceled
+
+    def cancel(self):
+        """
+        Cancels the running statement on the server. A statement that has not started yet will not start
+        """
+
+        from .engine import cancel_cursor
+
+        with self.lock:
+            self.canceled = True
+            cursor = self.cursor
+
+        if cursor is not None:
+            cancel_cursor(cursor, self.raw_engine)
+
+    def close(self, conn_pool, exhausted=True):
+        """
+        Closes the raw cursor and returns the connection to conn_pool
+
+        :param conn_pool: SQLConnectionPool the connection was borrowed from
+        :param exhausted: [Optional] (True/False) if the result set was read to the end
+        """
+
+        from .engine import cancel_cursor
+
+        if self.cursor is not None:
+            if not exhausted:
+                cancel_cursor(self.cursor)
+
+            try:
+                self.cursor.close()
+            except:
+                pass
+
+        if self.owns_raw and self.raw_engine is not None:
+            try:
+                self.raw_engine.close()
+            except:
+                pass
+
+        if self.engine is not None:
+            conn_pool.checkin(self.engine, validate=not exhausted)
+
+        self.engine = None
+        self.raw_engine = None
+        self.cursor = None
+
+
+class AsyncSQLEngine(object):
+    """
+    asyncio facade over SQLEngineClass. Statements run on a bounded SQLExecutor with connections borrowed from the
+    engine's SQLConnectionPool, so coroutines never block the event loop on the driver. Cancelling an awaiting task
+    cancels the statement on the server through the DB-API cursor and waits for the worker to unwind before the
+    connection is returned to the pool
+    """
+
+    def __init__(self, engine_class, max_concurrency=None, executor=None):
+        """
+        :param engine_class: SQLEngineClass instance that owns the connection pool
+        :param max_concurrency: [Optional] Statements running at one time DEFAULT is the engine's executor workers
+        :param executor: [Optional] SQLExecutor that runs statements DEFAULT is a private SQLExecutor
+        """
+
+        from .engine import SQLEngineClass
+
+        if not isinstance(engine_class, SQLEngineClass):
+            raise ValueError("'engine_class' %r is not an instance of SQLEngineClass" % engine_class)
+        if executor is not None and not isinstance(executor, SQLExecutor):
+            raise ValueError("'executor' %r is not an instance of SQLExecutor" % executor)
+
+        self.__engine_class = engine_class
+        self.__max_concurrency = max_concurrency or engine_class.executor.max_workers
+        self.__owns_executor = executor is None
+
+        if executor is None:
+            executor = SQLExecutor(max_workers=self.__max_concurrency, executor_id=engine_class.engine_id)
+
+        self.__executor = executor
+        self.__slots = None
+        self.__sql_queue = None
+
+    @classmethod
+    async def from_queue(cls, sql_queue, max_concurrency=None, executor=None, timeout=None):
+        """
+        Pops a SQLEngineClass from a SQLQueue without blocking the event loop. The engine is queued back by close()
+
+        :param sql_queue: SQLQueue instance
+        :param max_concurrency: [Optional] Statements running at one time
+        :param executor: [Optional] SQLExecutor that runs statements
+        :param timeout: [Optional] Seconds to wait for a SQL engine (None is infinity)
+        :return: AsyncSQLEngine
+        """
+
+        loop = asyncio.get_running_loop()
+        engine_class = await loop.run_in_executor(None, partial(sql_queue.pop_sql_engine_from_pool, timeout=timeout))
+
+        if engine_class is None:
+            raise ValueError("'sql_queue' %r did not return a SQL engine" % sql_queue)
+
+        async_engine = cls(engine_class, max_concurrency=max_concurrency, executor=executor)
+        async_engine.__sql_queue = sql_queue
+        return async_engine
+
+    @property
+    def engine_class(self):
+        """
+        :return: SQLEngineClass instance that statements run on
+        """
+
+        return self.__engine_class
+
+    @property
+    def max_concurrency(self):
+        """
+        :return: Statements running at one time
+        """
+
+        return self.__max_concurrency
+
+    async def execute(self, query_str, execute=False, params=None, many=False, columnar=True):
+        """
+        Execute or Query SQL query statement
+
+        :param query_str: Query string that is executed to connection
+        :param execute: [Optional] (True/False) Choose to execute or query results
+        :param params: [Optional] Bind parameters, or a list of parameter sets when many is True
+        :param many: [Optional] (True/False) executemany() query_str once per parameter set in params
+        :param columnar: [Optional] (True/False) Build result DataFrames from typed column arrays
+        :return: Completed SQLCursor holding results and errors
+        """
+
+        if not isinstance(query_str, str):
+            raise ValueError("'query_str' %r is not a String" % query_str)
+        if many and params is None:
+            raise ValueError("'params' must be provided when many is True")
+
+        pending = PendingStatement()
+        return await self.__run(partial(self.__execute, pending, query_str, execute, params, many, columnar),
+                                cancel=pending.cancel)
+
+    async def execute_all(self, statements, execute=False, return_exceptions=False):
+        """
+        Runs statements concurrently, bounded by max_concurrency
+
+        :param statements: List of query strings or (query string, params) tuples
+        :param execute: [Optional] (True/False) Choose to execute or query results
+        :param return_exceptions: [Optional] (True/False) Return errors in place of cursors instead of raising
+        :return: List of SQLCursor in the order of statements
+        """
+
+        coroutines = list()
+
+        for statement in statements:
+            if isinstance(statement, str):
+                coroutines.append(self.execute(statement, execute=execute))
+            else:
+                query_str, params = statement
+                coroutines.append(self.execute(query_str, execute=execute, params=params))
+
+        return await asyncio.gather(*coroutines, return_exceptions=return_exceptions)
+
+    async def stream(self, query_str, chunk_rows=ColumnarMaterializer.DEFAULT_FETCH_SIZE, as_dataframe=True,
+                     params=None):
+        """
+        Asynchronous generator that streams a query's result set in chunks. A pooled connection is borrowed for the
+        life of the iteration and each chunk is fetched on a worker when the consumer asks for it
+
+        :param query_str: Query string that is executed to connection
+        :param chunk_rows: [Optional] Number of rows per chunk
+        :param as_dataframe: [Optional] (True/False) Yield DataFrame chunks or lists of row records
+        :param params: [Optional] Bind parameters for the placeholders in query_str
+        :return: Asynchronous iterator of DataFrame chunks or lists of rows
+        """
+
+        if not isinstance(query_str, str):
+            raise ValueError("'query_str' %r is not a String" % query_str)
+        if not isinstance(chunk_rows, int) or chunk_rows < 1:
+            raise ValueError("'chunk_rows' %r must be a positive int" % chunk_rows)
+
+        pending = PendingStatement()
+        exhausted = False
+
+        try:
+            dataset = await self.__run(partial(self.__open_stream, pending, query_str, params), cancel=pending.cancel)
+
+            while True:
+                if dataset.description:
+                    materializer = ChunkBuilder(dataset, chunk_rows=chunk_rows, cache_key=query_str)
+                    batches = materializer.fetch_batches()
+                    row_start = 0
+
+                    while True:
+                        chunk = await self.__run(partial(self.__fetch_chunk, materializer, batches, row_start,
+                                                         as_dataframe), cancel=pending.cancel)
+
+                        if chunk is None:
+                            break
+
+                        yield chunk
+                        row_start += len(chunk)
+
+                if not hasattr(dataset, 'nextset') or not await self.__run(dataset.nextset, cancel=pending.cancel):
+                    break
+
+            exhausted = True
+        finally:
+            # Closing cancels an unfinished statement and waits on the driver, so it runs off the event loop. Shielded
+            # so a cancel while waiting cannot drop the close and leak the connection
+            close = partial(pending.close, self.__engine_class.conn_pool, exhausted)
+            await asyncio.shield(asyncio.get_running_loop().run_in_executor(None, close))
+
+    async def upload(self, dataframe, table_name, **params):
+        """
+        Uploads a DataFrame to a SQL table. Accepts the parameters of SQLEngineClass.sql_upload(). A cancelled upload
+        stops being awaited and finishes or rolls back on its worker
+
+        :param dataframe: pandas DataFrame
+        :param table_name: Table name
+        :return: Completed EngineCursor, or PartitionedUpload when parallelism or atomic is set
+        """
+
+        params.pop('queue_cursor', None)
+        params.pop('new_engine', None)
+        future = await self.__run(partial(self.__engine_class.sql_upload, dataframe, table_name, queue_cursor=True,
+                                          **params))
+        return await asyncio.wrap_future(future)
+
+    async def close(self):
+        """
+        Stops the private executor and queues the engine back to the SQLQueue it came from
+        """
+
+        if self.__owns_executor:
+            await asyncio.get_running_loop().run_in_executor(None, self.__executor.shutdown)
+
+        if self.__sql_queue is not None:
+            self.__engine_class.restore_to_pool()
+            self.__sql_queue = None
+
+    async def __run(self, fn, cancel=None):
+        if self.__slots is None:
+            self.__slots = asyncio.Semaphore(self.__max_concurrency)
+
+        async with self.__slots:
+            future = self.__executor.submit(fn)
+            waiter = asyncio.wrap_future(future)
+
+            try:
+                return await asyncio.shield(waiter)
+            except asyncio.CancelledError:
+                if not future.cancel() and cancel is not None:
+                    # The worker owns the connection until it unwinds from the cancelled statement
+                    log.debug('Async SQL Engine %s: Canceling running statement', self.__engine_class.engine_id)
+                    cancel()
+                    await asyncio.wait([waiter])
+
+                waiter.add_done_callback(self.__consume_result)
+                raise
+
+    @staticmethod
+    def __consume_result(waiter):
+        if not waiter.cancelled():
+            waiter.exception()
+
+    def __execute(self, pending, query_str, execute, params, many, columnar):
+        from .cursor import SQLCursor
+
+        conn_pool = self.__engine_class.conn_pool
+        start = monotonic()
+        engine, spid = conn_pool.checkout()
+        cursor = SQLCursor(engine_type=self.__engine_class.engine_type, engine=engine, spid=spid,
+                           keep_engine_alive=False, engine_pool=conn_pool,
+                           statement_cache=self.__engine_class.statement_cache, connect_time=monotonic() - start,
+                           query_stats=self.__engine_class.query_stats)
+
+        if not pending.attach(cursor):
+            cursor.close()
+            raise asyncio.CancelledError()
+
+        cursor.execute(query_str=query_str, execute=execute, params=params, many=many, columnar=columnar)
+        return cursor
+
+    def __open_stream(self, pending, query_str, params):
+        from .engine import raw_connection
+
+        pending.engine, spid = self.__engine_class.conn_pool.checkout()
+        pending.raw_engine, pending.owns_raw = raw_connection(pending.engine)
+
+        if not pending.attach(pending.raw_engine.cursor()):
+            raise asyncio.CancelledError()
+
+        log.debug("Streaming query on SPID %s", spid)
+
+        if params is None:
+            return pending.cursor.execute(query_str) or pending.cursor
+        else:
+            return pending.cursor.execute(query_str, params) or pending.cursor
+
+    @staticmethod
+    def __fetch_chunk(materializer, batches, row_start, as_dataframe):
+        rows = next(batches, None)
+
+        if rows is None:
+            return None
+        elif as_dataframe:
+            return materializer.build_dataframe(rows, row_start)
+        else:
+            return [tuple(row) for row in rows]
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    def __repr__(self):
+        return '%s(%s, concurrency=%s)' % (self.__class__.__name__, self.__engine_class.engine_id,
+                                           self.__max_concurrency)
@@ -0,0 +1,293 @@
+from __future__ import unicode_literals
+
+from threading import Event
+from time import monotonic
+from .materializer import materialize_dataframe, ColumnarMaterializer
+from .stats import CursorStats
+
+import logging
+
+log = logging.getLogger(__name__)
+
+
+def collect_results(cursor, result, columnar=True, stats=None):
+    """
+    Materializes every result set of an executed statement into result.results
+
+    :param cursor: DB-API cursor the statement was executed on
+    :param result: StatementResult the DataFrames are appended to
+    :param columnar: [Optional] (True/False) Build result DataFrames from typed column arrays
+    :param stats: [Optional] CursorStats that execute, fetch and build seconds, rows and bytes are added to
+    :return: Rows fetched plus rows affected by statements without a result set
+    """
+
+    rowcount = 0
+
+    while True:
+        if cursor.description:
+            df = materialize_dataframe(cursor, fetch_size=ColumnarMaterializer.DEFAULT_FETCH_SIZE, columnar=columnar,
+                                       stats=stats)
+            result.results.append(df)
+            rowcount += len(df)
+        elif cursor.rowcount is not None and cursor.rowcount > -1:
+            rowcount += cursor.rowcount
+
+        if not hasattr(cursor, 'nextset'):
+            break
+
+        # Later result sets are produced by the server while nextset() waits
+        start = monotonic()
+        more = cursor.nextset()
+
+        if stats is not None:
+            stats.execute += monotonic() - start
+
+        if not more:
+            break
+
+    return rowcount
+
+
+class StatementResult(object):
+    """
+    Outcome of one statement of an execute_batch() call
+    """
+
+    __slots__ = ("index", "query_str", "params", "results", "rowcount", "elapsed", "errors", "status", "spid",
+                 "timed_out", "attempts")
+
+    def __init__(self, index, query_str, params=None):
+        self.index = index
+        self.query_str = query_str
+        self.params = params
+        self.results = list()
+        self.rowcount = None
+        self.elapsed = None
+        self.errors = None
+        self.status = 'pending'
+        self.spid = None
+        self.timed_out = False
+        self.attempts = 0
+
+    @property
+    def ok(self):
+        """
+        :return: (True/False) if the statement ran without error
+        """
+
+        return self.status == 'ok'
+
+    def __repr__(self):
+        return '%s(%s, status=%s, rowcount=%s, elapsed=%s)' % (self.__class__.__name__, self.index, self.status,
+                                                              self.rowcount, self.elapsed)
+
+
+class SQLBatch(object):
+    """
+    Runs a list of statements and reports each one on its own StatementResult. Statements run in order on one pooled
+    connection, or are dealt round robin onto parallel lanes that each run on their own pooled connection. The calling
+    thread runs the first lane and the others run on the engine's SQLExecutor. Each statement is timed into the
+    engine's query_stats, cancelled once it runs past timeout and re-run when it was chosen as a deadlock victim
+    """
+
+    def __init__(self, engine_class, statements, execute=False, parallel=False, stop_on_error=True, columnar=True,
+                 timeout=None, retry=None):
+        """
+        :param engine_class: SQLEngineClass instance whose connection pool the statements run on
+        :param statements: List of query strings or (query string, params) tuples
+        :param execute: [Optional] (True/False) Commit after each statement or only query results
+        :param parallel: [Optional] (False/N) Number of connections statements are spread across
+        :param stop_on_error: [Optional] (True/False) Skip statements that have not started once one fails
+        :param columnar: [Optional] (True/False) Build result DataFrames from typed column arrays
+        :param timeout: [Optional] Seconds each statement may run before it is cancelled (None or 0 is infinity)
+        :param retry: [Optional] RetryPolicy deadlocked statements are re-run with DEFAULT runs each statement once
+        """
+
+        if parallel is True or parallel is None:
+            raise ValueError("'parallel' %r must be False or a number of connections" % parallel)
+
+        lanes = int(parallel or 1)
+
+        if lanes < 1:
+            raise ValueError("'parallel' %r must be a positive number" % parallel)
+
+        self.__engine_class = engine_class
+        self.__execute = execute
+        self.__stop_on_error = stop_on_error
+        self.__columnar = columnar
+        self.__timeout = timeout
+        self.__retry = retry
+        self.__results = list()
+        self.__failed = Event()
+
+        for index, statement in enumerate(statements):
+            if isinstance(statement, str):
+                query_str, params = statement, None
+            else:
+                query_str, params = statement
+
+            if not isinstance(query_str, str):
+                raise ValueError("'statements' item %r is not a String" % query_str)
+
+            self.__results.append(StatementResult(index, query_str, params))
+
+        self.__lanes = min(lanes, len(self.__results)) or 1
+
+    @property
+    def results(self):
+        """
+        :return: List of StatementResult in the order of statements
+        """
+
+        return self.__results
+
+    def run(self):
+        """
+        :return: List of StatementResult in the order of statements
+        """
+
+        lanes = [self.__results[i::self.__lanes] for i in range(self.__lanes)]
+        futures = [self.__engine_class.executor.submit(self.__run_lane, lane) for lane in lanes[1:]]
+
+        try:
+            self.__run_lane(lanes[0])
+        finally:
+            for future in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    log.debug('SQL Batch: Lane failed. %s', e)
+
+        for result in self.__results:
+            if result.status == 'pending':
+                result.status = 'skipped'
+
+        return self.__results
+
+    def __run_lane(self, lane):
+        from .engine import raw_connection
+
+        if not lane or self.__stopped():
+            return
+
+        conn_pool = self.__engine_class.conn_pool
+        start = monotonic()
+
+        try:
+            engine, spid = conn_pool.checkout()
+        except Exception as e:
+            for result in lane:
+                result.errors = [type(e).__name__, str(e)]
+                result.status = 'error'
+
+            self.__failed.set()
+            return
+
+        connect, failed = monotonic() - start, False
+
+        try:
+            raw_engine, owns_raw = raw_connection(engine)
+
+            try:
+                cursor = raw_engine.cursor()
+
+                try:
+                    for result in lane:
+                        if self.__stopped():
+                            break
+
+                        result.spid = spid
+
+                        if not self.__run_statement(raw_engine, cursor, result, connect):
+                            failed = True
+                            self.__failed.set()
+
+                        connect = 0.0
+                finally:
+                    try:
+                        cursor.close()
+                    except:
+                        pass
+            finally:
+                if owns_raw:
+                    raw_engine.close()
+        except:
+            failed = True
+            raise
+        finally:
+            conn_pool.checkin(engine, validate=failed)
+
+    def __run_statement(self, raw_engine, cursor, result, connect=0.0):
+        # Only deadlocks are re-run. The server rolled the victim back, while a dropped connection stays dropped
+        if self.__retry:
+            self.__retry.run(lambda: self.__attempt(raw_engine, cursor, result, connect),
+                             errors_fn=lambda ok: result.errors)
+        else:
+            self.__attempt(raw_engine, cursor, result, connect)
+
+        return result.status == 'ok'
+
+    def __attempt(self, raw_engine, cursor, result, connect):
+        from .engine import cancel_cursor
+        from .watchdog import StatementWatchdog
+
+        log.debug('SQL Batch: Running statement %s on SPID %s', result.index, result.spid)
+        stats = CursorStats('execute', result.query_str, result.spid, connect=connect)
+        start, watch_token = monotonic(), None
+        result.attempts += 1
+        result.results, result.errors, result.timed_out = list(), None, False
+
+        def deadline_passed():
+            log.debug('SQL Batch: Statement %s on SPID %s passed its deadline', result.index, result.spid)
+            result.timed_out = True
+            cancel_cursor(cursor, raw_engine)
+
+        try:
+            if self.__timeout:
+                watch_token = StatementWatchdog.default().watch(self.__timeout, deadline_passed)
+
+            try:
+                if result.params is None:
+                    cursor.execute(result.query_str)
+                else:
+                    cursor.execute(result.query_str, result.params)
+
+                stats.execute += monotonic() - start
+                rowcount = collect_results(cursor, result, columnar=self.__columnar, stats=stats)
+            finally:
+                if watch_token is not None:
+                    StatementWatchdog.default().unwatch(watch_token)
+
+            if self.__execute:
+                raw_engine.commit()
+            else:
+                raw_engine.rollback()
+
+            result.rowcount = rowcount
+            result.status = 'ok'
+        except Exception as e:
+            # Driver query timeouts (SQLSTATE HYT00) and watchdog cancels are both reported as timeouts
+            if getattr(e, 'args', None) and e.args[0] == 'HYT00':
+                result.timed_out = True
+
+            if result.timed_out:
+                result.errors = ['HYT00', 'Statement timed out after %s seconds' % self.__timeout]
+            else:
+                result.errors = [type(e).__name__, str(e)]
+
+            result.status = 'error'
+
+            try:
+                raw_engine.rollback()
+            except:
+                pass
+        finally:
+            result.elapsed = monotonic() - start
+            stats.finish(result.errors)
+            self.__engine_class.query_stats.record(stats)
+
+    def __stopped(self):
+        return self.__stop_on_error and self.__failed.is_set()
+
+    def __repr__(self):
+        return '%s(statements=%s, lanes=%s)' % (self.__class__.__name__, len(self.__results), self.__lanes)
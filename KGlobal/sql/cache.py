@@ -0,0 +1,425 @@
+from __future__ import unicode_literals
+
+from threading import Lock
+from collections import OrderedDict
+from concurrent.futures import Future
+from hashlib import sha1
+from time import monotonic
+
+import re
+import os
+import logging
+
+log = logging.getLogger(__name__)
+
+TABLE_PATTERN = re.compile(r'\b(?:FROM|JOIN|INTO|UPDATE|TABLE|MERGE|USING)\s+((?:[\[\]"`\w]+\.){0,3}[\[\]"`\w]+)',
+                           re.IGNORECASE)
+# Quoted literals and identifiers are matched whole so whitespace inside them is never collapsed
+QUOTED_OR_SPACE = re.compile(r"""('(?:[^']|'')*'|"(?:[^"]|"")*"|\[[^\]]*\]|`[^`]*`)|\s+""")
+
+
+def normalize_query(query_str):
+    """
+    :param query_str: SQL query string
+    :return: query_str with whitespace outside quoted literals and identifiers collapsed and trailing semicolons
+    removed
+    """
+
+    query_str = QUOTED_OR_SPACE.sub(lambda m: m.group(1) or ' ', query_str)
+    return query_str.strip().rstrip(';').rstrip()
+
+
+def query_tables(query_str):
+    """
+    :param query_str: SQL query string
+    :return: Set of lower case table names (without schema or database) that query_str reads or writes
+    """
+
+    return set(table_key(match) for match in TABLE_PATTERN.findall(query_str))
+
+
+def table_key(table_name):
+    """
+    :param table_name: Table name that may be qualified and quoted ([db].[schema].[table])
+    :return: Lower case unqualified table name
+    """
+
+    return re.sub(r'[\[\]"`]', '', table_name).split('.')[-1].lower()
+
+
+class CacheEntry(object):
+    """
+    Result sets of one cached query held in memory or spilled to disk
+    """
+
+    __slots__ = ("results", "paths", "nbytes", "expires", "tables")
+
+    def __init__(self, results, nbytes, expires, tables):
+        self.results = results
+        self.paths = None
+        self.nbytes = nbytes
+        self.expires = expires
+        self.tables = tables
+
+    def expired(self, now=None):
+        return self.expires is not None and (now or monotonic()) >= self.expires
+
+
+class CachedCursor(object):
+    """
+    Completed cursor returned by sql_execute(cache=True) when the results were served from SQLResultCache. It
+    mirrors the result interface of SQLCursor
+    """
+
+    def __init__(self, results, query_str=None):
+        """
+        :param results: List of DataFrames
+        :param query_str: [Optional] SQL query string that produced results
+        """
+
+        self.__results = results
+        self.__cursor_action = ['execute', dict(query_str=query_str, execute=False)]
+        self.cursor_id = sum(map(ord, str(os.urandom(100))))
+
+    @property
+    def cursor_action(self):
+        """
+        :return: Returns cursor action and parameters
+        """
+
+        return self.__cursor_action
+
+    @property
+    def results(self):
+        """
+        :return: List of DataFrame result sets
+        """
+
+        return self.__results
+
+    @property
+    def errors(self):
+        """
+        :return: Cached results never carry errors
+        """
+
+        return None
+
+    @property
+    def is_pending(self):
+        """
+        :return: Cached results are never pending
+        """
+
+        return False
+
+    @property
+    def cached(self):
+        """
+        :return: True, results were served from cache
+        """
+
+        return True
+
+    def close(self, write_log=True):
+        pass
+
+    def as_future(self):
+        """
+        :return: Completed Future resolving to this cursor, for queued callers
+        """
+
+        future = Future()
+        future.set_result(self)
+        return future
+
+
+class SQLResultCache(object):
+    """
+    Cache of query result sets keyed by SQLConfig, normalized query text and bind parameters. Entries expire after
+    their TTL and are evicted least recently used once the approximate DataFrame memory of all entries passes
+    max_bytes. Evicted entries are spilled to parquet files in spill_dir when it is set (requires pyarrow or
+    fastparquet) and read back on their next hit. Entries can be invalidated by the tables their query touched
+    """
+
+    DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+    DEFAULT_TTL = 300
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, ttl=DEFAULT_TTL, spill_dir=None, spill_max_bytes=None):
+        """
+        :param max_bytes: [Optional] Approximate memory (DataFrame.memory_usage(deep=True)) of cached result sets
+        :param ttl: [Optional] Seconds an entry is served for (0 or None is infinity)
+        :param spill_dir: [Optional] Directory that evicted entries are written to as parquet files
+        :param spill_max_bytes: [Optional] Bytes of spilled files kept in spill_dir (None is unlimited)
+        """
+
+        if max_bytes < 1:
+            raise ValueError("'max_bytes' %r must be a positive number" % max_bytes)
+        if spill_dir and not os.path.isdir(spill_dir):
+            raise ValueError("'spill_dir' %r is not a valid directory path" % spill_dir)
+
+        self.__max_bytes = max_bytes
+        self.__ttl = ttl
+        self.__spill_dir = spill_dir
+        self.__spill_max_bytes = spill_max_bytes
+        self.__entries = OrderedDict()
+        self.__spilled = OrderedDict()
+        self.__nbytes = 0
+        self.__spill_nbytes = 0
+        self.__stats = dict(hits=0, misses=0, evictions=0, spills=0, invalidations=0)
+        self.__cache_lock = Lock()
+
+    @property
+    def nbytes(self):
+        """
+        :return: Approximate memory of result sets held in memory
+        """
+
+        return self.__nbytes
+
+    @property
+    def stats(self):
+        """
+        :return: Dictionary of counters (hits, misses, evictions, spills, invalidations, entries, spilled, nbytes)
+        """
+
+        with self.__cache_lock:
+            stats = dict(self.__stats)
+            stats['entries'] = len(self.__entries)
+            stats['spilled'] = len(self.__spilled)
+            stats['nbytes'] = self.__nbytes
+
+        return stats
+
+    @staticmethod
+    def make_key(sql_config, query_str, params=None):
+        """
+        :param sql_config: SQLConfig instance class
+        :param query_str: SQL query string
+        :param params: [Optional] Bind parameters
+        :return: Cache key
+        """
+
+        if params is not None and not isinstance(params, (list, tuple, dict)):
+            params = tuple(params)
+
+        return sha1(repr((sql_config.config_key, normalize_query(query_str), params)).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """
+        :param key: Cache key from make_key()
+        :return: List of DataFrames the caller owns, or None when key is not cached or expired
+        """
+
+        with self.__cache_lock:
+            entry = self.__entries.get(key)
+
+            if entry is not None:
+                if entry.expired():
+                    self.__drop(key)
+                else:
+                    self.__entries.move_to_end(key)
+                    self.__stats['hits'] += 1
+                    return [df.copy(deep=True) for df in entry.results]
+
+            entry = self.__spilled.pop(key, None)
+
+            if entry is None:
+                self.__stats['misses'] += 1
+                return None
+
+            self.__spill_nbytes -= self.__file_bytes(entry.paths)
+
+        if entry.expired():
+            self.__remove_files(entry.paths)
+
+            with self.__cache_lock:
+                self.__stats['misses'] += 1
+
+            return None
+
+        results = self.__load(entry.paths)
+
+        if results is None:
+            with self.__cache_lock:
+                self.__stats['misses'] += 1
+
+            return None
+
+        with self.__cache_lock:
+            self.__stats['hits'] += 1
+
+        self.__remove_files(entry.paths)
+        # put() keeps its own copies, the frames read back from disk go to the caller
+        self.put(key, results, ttl=None, tables=entry.tables, expires=entry.expires)
+        return results
+
+    def put(self, key, results, ttl=None, tables=None, query_str=None, expires=None):
+        """
+        Caches copies of result sets, so the caller's DataFrames can be changed afterwards
+
+        :param key: Cache key from make_key()
+        :param results: List of DataFrames
+        :param ttl: [Optional] Seconds the entry is served for DEFAULT is the cache ttl
+        :param tables: [Optional] Table names the entry is invalidated by
+        :param query_str: [Optional] SQL query string that tables are read from when tables is not set
+        :param expires: [Optional] monotonic() time the entry expires at, overrides ttl
+        """
+
+        if tables is None:
+            tables = query_tables(query_str) if query_str else set()
+
+        if expires is None:
+            ttl = self.__ttl if ttl is None else ttl
+            expires = monotonic() + ttl if ttl else None
+
+        nbytes = sum(int(df.memory_usage(index=True, deep=True).sum()) for df in results)
+
+        if nbytes > self.__max_bytes:
+            log.debug('SQL Result Cache: Result of %s bytes is larger than the cache', nbytes)
+            return
+
+        results = [df.copy(deep=True) for df in results]
+
+        with self.__cache_lock:
+            self.__drop(key)
+            self.__entries[key] = CacheEntry(results, nbytes, expires, set(table_key(t) for t in tables))
+            self.__nbytes += nbytes
+            evicted = list()
+
+            while self.__nbytes > self.__max_bytes:
+                evicted_key, entry = self.__entries.popitem(last=False)
+                self.__nbytes -= entry.nbytes
+                self.__stats['evictions'] += 1
+                evicted.append([evicted_key, entry])
+
+        for evicted_key, entry in evicted:
+            self.__spill(evicted_key, entry)
+
+    def invalidate(self, table_name=None):
+        """
+        Drops cached entries
+
+        :param table_name: [Optional] Drop entries whose query touched this table DEFAULT drops every entry
+        """
+
+        paths = list()
+
+        with self.__cache_lock:
+            if table_name is None:
+                keys = list(self.__entries.keys()) + list(self.__spilled.keys())
+            else:
+                name = table_key(table_name)
+                keys = [k for k, e in list(self.__entries.items()) + list(self.__spilled.items()) if name in e.tables]
+
+            for key in keys:
+                paths.extend(self.__drop(key))
+
+            self.__stats['invalidations'] += len(keys)
+
+        self.__remove_files(paths)
+
+    def clear(self):
+        """
+        Drops every cached entry
+        """
+
+        self.invalidate()
+
+    def __drop(self, key):
+        # Caller holds the cache lock. Returns spilled files to remove
+        entry = self.__entries.pop(key, None)
+
+        if entry is not None:
+            self.__nbytes -= entry.nbytes
+
+        entry = self.__spilled.pop(key, None)
+
+        if entry is not None:
+            self.__spill_nbytes -= self.__file_bytes(entry.paths)
+            return entry.paths
+
+        return list()
+
+    def __spill(self, key, entry):
+        if not self.__spill_dir or entry.expired():
+            return
+
+        paths = list()
+
+        try:
+            for i, df in enumerate(entry.results):
+                path = os.path.join(self.__spill_dir, '%s_%s.parquet' % (key, i))
+                df.to_parquet(path)
+                paths.append(path)
+        except (ImportError, ValueError, OSError) as e:
+            log.debug('SQL Result Cache: Unable to spill entry %s. %s', key, e)
+            self.__remove_files(paths)
+            return
+
+        entry.results = None
+        entry.paths = paths
+        removed = list()
+
+        with self.__cache_lock:
+            self.__spilled[key] = entry
+            self.__spill_nbytes += self.__file_bytes(paths)
+            self.__stats['spills'] += 1
+
+            while self.__spill_max_bytes is not None and self.__spill_nbytes > self.__spill_max_bytes and \
+                    self.__spilled:
+                removed.extend(self.__drop(next(iter(self.__spilled))))
+
+        self.__remove_files(removed)
+
+    @staticmethod
+    def __load(paths):
+        from pandas import read_parquet
+
+        try:
+            return [read_parquet(path) for path in paths]
+        except (ImportError, ValueError, OSError) as e:
+            log.debug('SQL Result Cache: Unable to read spilled entry. %s', e)
+            return None
+
+    @staticmethod
+    def __file_bytes(paths):
+        nbytes = 0
+
+        for path in paths or list():
+            try:
+                nbytes += os.path.getsize(path)
+            except OSError:
+                pass
+
+        return nbytes
+
+    @staticmethod
+    def __remove_files(paths):
+        for path in paths or list():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def __getstate__(self):
+        # Cached DataFrames stay with the process and the lock cannot be pickled
+        state = self.__dict__.copy()
+        state['_SQLResultCache__entries'] = OrderedDict()
+        state['_SQLResultCache__spilled'] = OrderedDict()
+        state['_SQLResultCache__nbytes'] = 0
+        state['_SQLResultCache__spill_nbytes'] = 0
+        del state['_SQLResultCache__cache_lock']
+        return state
+
+    def __setstate__(self, state):
+        # Restore the lock
+        self.__dict__.update(state)
+        self.__cache_lock = Lock()
+
+    def __len__(self):
+        return len(self.__entries) + len(self.__spilled)
+
+    def __repr__(self):
+        return '%s(entries=%s, nbytes=%s, max=%s)' % (self.__class__.__name__, len(self.__entries), self.__nbytes,
+                                                       self.__max_bytes)
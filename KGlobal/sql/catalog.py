@@ -0,0 +1,389 @@
+from __future__ import unicode_literals
+
+from threading import Lock
+from collections.abc import MutableMapping
+from hashlib import sha1
+from time import monotonic
+from pandas import DataFrame
+
+import pickle
+import logging
+
+log = logging.getLogger(__name__)
+
+MSSQL_OBJECTS_QUERY = """SELECT DB_NAME(), s.name, o.name, o.type, o.modify_date
+FROM sys.objects o INNER JOIN sys.schemas s ON s.schema_id = o.schema_id
+WHERE o.type IN ('U', 'V')"""
+MSSQL_TABLE_TYPES = {'U': 'TABLE', 'V': 'VIEW'}
+TABLE_COLUMNS = ['Table_Type', 'Table_Cat', 'Table_Schema', 'Table_Name']
+
+
+def split_table_name(table_name, schema=None):
+    """
+    :param table_name: Table name that may be qualified and quoted ([schema].[table])
+    :param schema: [Optional] Schema name, overrides the schema in table_name
+    :return: [schema or None, table] in lower case
+    """
+
+    parts = [part.strip('[]"`') for part in table_name.split('.')]
+    table = parts[-1].lower()
+
+    if schema is None and len(parts) > 1:
+        schema = parts[-2]
+
+    return [schema.lower() if schema else None, table]
+
+
+class SchemaCatalog(object):
+    """
+    Cache of the tables, views and columns of a SQLConfig. Lookups are served from memory without a round trip to the
+    server. The catalog is loaded on first use and persisted to a DataConfig (or any MutableMapping) and/or a local
+    file so later runs start warm. On SQL Server refresh() is incremental: one query against sys.objects compares
+    modify_date with the cached catalog and only re-reads the columns of created or altered tables. Other backends
+    fall back to a full ODBC catalog walk
+    """
+
+    CATALOG_VERSION = 1
+
+    def __init__(self, engine_class, store=None, store_path=None, refresh_interval=None):
+        """
+        :param engine_class: SQLEngineClass instance whose connection pool the catalog is read with
+        :param store: [Optional] DataConfig or MutableMapping the catalog is persisted in
+        :param store_path: [Optional] File path the catalog is pickled to
+        :param refresh_interval: [Optional] Seconds after which a lookup triggers refresh(). None refreshes only once,
+        on the first lookup after the catalog was loaded from store or store_path
+        """
+
+        if store is not None and not isinstance(store, MutableMapping):
+            raise ValueError("'store' %r is not a DataConfig or MutableMapping instance" % store)
+
+        self.__engine_class = engine_class
+        self.__store = store
+        self.__store_path = store_path
+        self.__refresh_interval = refresh_interval
+        config_hash = sha1(repr(engine_class.sql_config.config_key).encode('utf-8')).hexdigest()
+        self.__store_key = 'sql_catalog_%s' % config_hash
+        self.__tables = None
+        self.__names = dict()
+        self.__incremental = True
+        self.__refreshed = None
+        self.__catalog_lock = Lock()
+        self.load()
+
+    @property
+    def loaded(self):
+        """
+        :return: (True/False) if the catalog holds a table listing
+        """
+
+        return self.__tables is not None
+
+    def load(self):
+        """
+        Loads a persisted catalog from store or store_path
+
+        :return: (True/False) if a persisted catalog was found
+        """
+
+        state = None
+
+        if self.__store is not None:
+            state = self.__store.get(self.__store_key)
+
+        if state is None and self.__store_path:
+            from ..data import file_read_bytes
+
+            data = file_read_bytes(self.__store_path)
+
+            if data:
+                state = pickle.loads(data)
+
+        if not isinstance(state, dict) or state.get('version') != self.CATALOG_VERSION:
+            return False
+
+        with self.__catalog_lock:
+            self.__set_tables(state['tables'])
+            self.__refreshed = None
+
+        log.debug('SQL Catalog: Loaded %s tables from persisted catalog', len(self.__tables))
+        return True
+
+    def save(self):
+        """
+        Persists the catalog to store and/or store_path
+        """
+
+        with self.__catalog_lock:
+            state = dict(version=self.CATALOG_VERSION, tables=dict(self.__tables or dict()))
+
+        if self.__store is not None:
+            self.__store[self.__store_key] = state
+
+            if hasattr(self.__store, 'sync'):
+                self.__store.sync()
+
+        if self.__store_path:
+            from ..data import file_write_bytes
+            file_write_bytes(self.__store_path, pickle.dumps(state))
+
+    def refresh(self, full=False, load_columns=False):
+        """
+        Brings the catalog up to date with the server and persists it
+
+        :param full: [Optional] (True/False) Discard the cached catalog and walk the whole catalog again
+        :param load_columns: [Optional] (True/False) Read the columns of every table now instead of on first lookup
+        :return: Number of tables created, altered or dropped since the last refresh
+        """
+
+        conn_pool = self.__engine_class.conn_pool
+        engine, spid = conn_pool.checkout()
+        failed = False
+
+        try:
+            from .engine import raw_connection
+            raw_engine, owns_raw = raw_connection(engine)
+
+            try:
+                with self.__catalog_lock:
+                    tables = dict() if full or self.__tables is None else dict(self.__tables)
+
+                changed = None
+
+                if self.__incremental:
+                    changed = self.__refresh_objects(raw_engine, tables)
+
+                if changed is None:
+                    changed = self.__refresh_odbc(raw_engine, tables)
+
+                if load_columns:
+                    self.__load_columns(raw_engine, tables, [key for key, t in tables.items() if t['columns'] is None])
+            finally:
+                if owns_raw:
+                    raw_engine.close()
+        except:
+            failed = True
+            raise
+        finally:
+            conn_pool.checkin(engine, validate=failed)
+
+        with self.__catalog_lock:
+            self.__set_tables(tables)
+            self.__refreshed = monotonic()
+
+        log.debug('SQL Catalog: Refreshed %s tables on SPID %s (%s changed)', len(tables), spid, changed)
+
+        if self.__store is not None or self.__store_path:
+            self.save()
+
+        return changed
+
+    def has_table(self, table_name, schema=None):
+        """
+        :param table_name: Table or view name, may be qualified with its schema
+        :param schema: [Optional] Schema name DEFAULT matches any schema
+        :return: (True/False) if the table exists
+        """
+
+        return self.__find(table_name, schema) is not None
+
+    def tables(self, table_type=None):
+        """
+        :param table_type: [Optional] Only list tables of this type (TABLE, VIEW)
+        :return: DataFrame of [Table_Type, Table_Cat, Table_Schema, Table_Name] like sql_tables()
+        """
+
+        self.__ensure_fresh()
+
+        with self.__catalog_lock:
+            rows = [[t['table_type'], t['table_cat'], t['table_schema'], t['table_name']]
+                    for t in self.__tables.values() if table_type is None or t['table_type'] == table_type]
+
+        return DataFrame(rows, columns=TABLE_COLUMNS)
+
+    def columns(self, table_name, schema=None):
+        """
+        :param table_name: Table or view name, may be qualified with its schema
+        :param schema: [Optional] Schema name DEFAULT matches any schema
+        :return: List of [Column_Name, Type_Name, Column_Size, Nullable] in ordinal order
+        """
+
+        key = self.__find(table_name, schema)
+
+        if key is None:
+            raise ValueError("'table_name' %r is not in the SQL catalog" % table_name)
+
+        with self.__catalog_lock:
+            columns = self.__tables[key]['columns']
+
+        if columns is None:
+            conn_pool = self.__engine_class.conn_pool
+            engine, spid = conn_pool.checkout()
+            failed = False
+
+            try:
+                from .engine import raw_connection
+                raw_engine, owns_raw = raw_connection(engine)
+
+                try:
+                    with self.__catalog_lock:
+                        tables = {key: dict(self.__tables[key])}
+
+                    self.__load_columns(raw_engine, tables, [key])
+                finally:
+                    if owns_raw:
+                        raw_engine.close()
+            except:
+                failed = True
+                raise
+            finally:
+                conn_pool.checkin(engine, validate=failed)
+
+            with self.__catalog_lock:
+                self.__tables[key] = tables[key]
+
+            columns = tables[key]['columns']
+
+            if self.__store is not None or self.__store_path:
+                self.save()
+
+        return [list(column) for column in columns]
+
+    def __ensure_fresh(self):
+        # A catalog loaded from store was never compared with the server, so its first lookup always refreshes
+        if self.__tables is None or self.__refreshed is None or \
+                (self.__refresh_interval is not None and monotonic() - self.__refreshed >= self.__refresh_interval):
+            self.refresh()
+
+    def __find(self, table_name, schema=None):
+        self.__ensure_fresh()
+        schema, table = split_table_name(table_name, schema)
+
+        with self.__catalog_lock:
+            if schema is not None:
+                return (schema, table) if (schema, table) in self.__tables else None
+
+            keys = self.__names.get(table)
+            return keys[0] if keys else None
+
+    def __set_tables(self, tables):
+        # Caller holds the catalog lock
+        names = dict()
+
+        for key in sorted(tables.keys()):
+            names.setdefault(key[1], list()).append(key)
+
+        self.__tables = tables
+        self.__names = names
+
+    def __refresh_objects(self, raw_engine, tables):
+        # Incremental refresh from sys.objects modify dates. Returns None when the backend has no sys.objects
+        cursor = raw_engine.cursor()
+
+        try:
+            rows = cursor.execute(MSSQL_OBJECTS_QUERY).fetchall()
+        except Exception as e:
+            log.debug('SQL Catalog: Incremental refresh is not supported. %s', e)
+            self.__incremental = False
+            return None
+        finally:
+            try:
+                cursor.close()
+            except:
+                pass
+
+        seen = set()
+        changed = 0
+
+        for table_cat, table_schema, table_name, table_type, modified in rows:
+            key = (table_schema.lower(), table_name.lower())
+            seen.add(key)
+            cached = tables.get(key)
+
+            if cached is None or cached['modified'] is None or cached['modified'] != modified:
+                tables[key] = dict(table_type=MSSQL_TABLE_TYPES.get(table_type.strip(), table_type),
+                                   table_cat=table_cat, table_schema=table_schema, table_name=table_name,
+                                   modified=modified, columns=None)
+                changed += 1
+
+        for key in [key for key in tables.keys() if key not in seen]:
+            del tables[key]
+            changed += 1
+
+        return changed
+
+    @staticmethod
+    def __refresh_odbc(raw_engine, tables):
+        # Full ODBC catalog walk. Column lists of tables that still exist are kept
+        cursor = raw_engine.cursor()
+
+        try:
+            if not hasattr(cursor, 'tables'):
+                raise ValueError("SQL driver does not support ODBC catalog functions")
+
+            rows = [[t.table_type, t.table_cat, t.table_schem, t.table_name] for t in cursor.tables()]
+        finally:
+            try:
+                cursor.close()
+            except:
+                pass
+
+        previous = dict(tables)
+        tables.clear()
+
+        for table_type, table_cat, table_schema, table_name in rows:
+            key = ((table_schema or '').lower(), table_name.lower())
+            cached = previous.get(key)
+            tables[key] = dict(table_type=table_type, table_cat=table_cat, table_schema=table_schema,
+                               table_name=table_name, modified=None,
+                               columns=cached['columns'] if cached else None)
+
+        return len(set(previous.keys()) ^ set(tables.keys()))
+
+    @staticmethod
+    def __load_columns(raw_engine, tables, keys):
+        if not keys:
+            return
+
+        cursor = raw_engine.cursor()
+
+        try:
+            if not hasattr(cursor, 'columns'):
+                raise ValueError("SQL driver does not support ODBC catalog functions")
+
+            if len(keys) == 1:
+                table = tables[keys[0]]
+                rows = cursor.columns(table=table['table_name'], schema=table['table_schema']).fetchall()
+            else:
+                # One catalog walk is cheaper than a round trip per table
+                rows = cursor.columns().fetchall()
+
+            columns = dict()
+
+            for c in sorted(rows, key=lambda c: c.ordinal_position):
+                columns.setdefault(((c.table_schem or '').lower(), c.table_name.lower()), list()).append(
+                    (c.column_name, c.type_name, c.column_size, bool(c.nullable)))
+
+            for key in keys:
+                tables[key]['columns'] = columns.get(key, list())
+        finally:
+            try:
+                cursor.close()
+            except:
+                pass
+
+    def __getstate__(self):
+        # The lock cannot be pickled
+        state = self.__dict__.copy()
+        del state['_SchemaCatalog__catalog_lock']
+        return state
+
+    def __setstate__(self, state):
+        # Restore the lock
+        self.__dict__.update(state)
+        self.__catalog_lock = Lock()
+
+    def __len__(self):
+        return len(self.__tables or dict())
+
+    def __repr__(self):
+        return '%s(%s, tables=%s)' % (self.__class__.__name__, str(self.__engine_class.sql_config), len(self))
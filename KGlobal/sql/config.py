@@ -154,6 +154,23 @@ class SQLConfig(BaseSQLConfig, PickleMixIn):
         self.accdb_fp = None
         self.dsn_name = None
 
+    @property
+    def config_key(self):
+        """
+        Stable identity of this connection configuration. Equal configurations produce equal keys without decrypting
+        credentials
+
+        :return: Tuple of configuration elements
+        """
+
+        if self.credentials:
+            credentials = (self.credentials.class_name, self.credentials.class_id)
+        else:
+            credentials = None
+
+        return (self.config_type, self.conn_type, self.server, self.database, credentials, self.accdb_fp,
+                self.dsn_name, self.conn_str)
+
     def gen_conn_str(self):
         """
         Generates a connection string for sql, accdb, and dsn connections
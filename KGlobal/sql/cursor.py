@@ -1,12 +1,18 @@
 from __future__ import unicode_literals
 
 from threading import Thread, Lock
-from sqlalchemy.engine import Engine
+from sqlalchemy.engine import Engine, Connection
 from sqlalchemy.exc import SQLAlchemyError
 from pyodbc import Error as PYODBCError
 from pandas import DataFrame
+from .materializer import materialize_dataframe, ColumnarMaterializer, ChunkBuilder
+from .upload import BulkUploader, UpsertUploader, is_dataset_source, iter_dataset_frames
+from .export import ResultExporter
+from .retry import is_disconnect
+from .stats import CursorStats
 from csv import writer as csv_writer, QUOTE_ALL
 from types import FunctionType, BuiltinFunctionType, MethodType, BuiltinMethodType
+from time import monotonic
 
 import logging
 import os
@@ -17,7 +23,8 @@ log = logging.getLogger(__name__)
 class SQLCursor(Thread):
     """
     A SQLCursor class to handle SQLEngine's cursor's when executing queries or retrieving server tables
-    -   Class is threaded thus multiple cursors can be executing in a queue at the same time
+    -   Queued cursors are run() on SQLEngine's SQLExecutor worker pool thus multiple cursors can be executing in a
+        queue at the same time
     """
 
     __cursor = None
@@ -25,7 +32,7 @@ class SQLCursor(Thread):
     __cursor_action = None
 
     def __init__(self, engine_type, engine, spid, keep_engine_alive=True, engine_class=None, action=None,
-                 action_params=None):
+                 action_params=None, engine_pool=None, statement_cache=None, connect_time=0.0, query_stats=None):
         """
         Creates a SQLCursor class instance that handles engine cursor operations
 
@@ -33,6 +40,10 @@ class SQLCursor(Thread):
         :param engine_class: SQLEngine class instance
         :param action: [execute, tables]
         :param action_params: Action parameters according to execute or tables command below
+        :param engine_pool: (Optional) SQLConnectionPool that engine was borrowed from and is returned to on close
+        :param statement_cache: (Optional) SQLStatementCache that parameterized statements are prepared in
+        :param connect_time: (Optional) Seconds spent acquiring engine before this cursor was created
+        :param query_stats: (Optional) QueryStats that the cursor's stats are recorded in once it closes
         """
 
         if engine_type not in ['alchemy', 'pyodbc']:
@@ -45,19 +56,31 @@ class SQLCursor(Thread):
         self.__spid = spid
         self.engine_class = engine_class
         self.__raw_engine = None
+        self.__owns_raw_engine = False
         self.__keep_engine_alive = keep_engine_alive
+        self.__engine_pool = engine_pool
+        self.__statement_cache = statement_cache
+        self.__statement = None
+        self.__query_stats = query_stats
+        self.__stats = CursorStats(action, spid=spid, connect=connect_time)
 
-        if engine_type == 'alchemy':
-            self.__raw_engine = self.__engine.raw_connection()
-            engine = self.__raw_engine
-        else:
-            engine = self.__engine
+        try:
+            from .engine import raw_connection
+            self.__raw_engine, self.__owns_raw_engine = raw_connection(self.__engine)
+            self.__cursor = self.__raw_engine.cursor()
+            self.__stats.connect += monotonic() - self.__stats.started - connect_time
+        except:
+            if engine_pool:
+                engine_pool.checkin(self.__engine, discard=True)
+
+            raise
 
-        self.__cursor = engine.cursor()
         if action:
             self.__cursor_action = [action, action_params]
         self.__execute_errors = None
         self.__execute_results = None
+        self.__export_stats = None
+        self.__timed_out = False
         self.__is_pending = Lock()
         self.__is_closing = Lock()
         self.cursor_id = sum(map(ord, str(os.urandom(100))))
@@ -87,6 +110,30 @@ class SQLCursor(Thread):
 
         return self.__execute_errors
 
+    @property
+    def export_stats(self):
+        """
+        :return: Returns rows, bytes_written, elapsed and rows_per_second of the last csv_path export or None
+        """
+
+        return self.__export_stats
+
+    @property
+    def timed_out(self):
+        """
+        :return: Returns True/False when the statement was cancelled because it passed its deadline
+        """
+
+        return self.__timed_out
+
+    @property
+    def stats(self):
+        """
+        :return: Returns CursorStats of queue_wait, connect, execute, fetch and build seconds, rows and bytes
+        """
+
+        return self.__stats
+
     @property
     def is_pending(self):
         """
@@ -117,6 +164,8 @@ class SQLCursor(Thread):
         Run operator that is executed upon creation of this SQLCursor class instance
         """
 
+        self.__stats.mark_run()
+
         if self.__cursor_action:
             function, params = self.__cursor_action
 
@@ -126,12 +175,16 @@ class SQLCursor(Thread):
                 if 'execute' not in params.keys():
                     params['execute'] = None
 
-                if 'handlers' in params.keys():
-                    for handler, buffer, csv_path, delimiter, quotechar in params['handlers']:
+                execute_params = {k: params[k] for k in ('params', 'many', 'csv_path', 'csv_replace', 'delimiter',
+                                                         'quotechar', 'quoting', 'columnar', 'export_format', 'timeout')
+                                  if k in params.keys()}
+
+                if params.get('handlers'):
+                    for handler, buffer in params['handlers']:
                         self.execute(query_str=params['query_str'], execute=params['execute'], handler=handler,
-                                     buffer=buffer, csv_path=csv_path, delimiter=delimiter, quotechar=quotechar)
+                                     buffer=buffer, **execute_params)
                 else:
-                    self.execute(query_str=params['query_str'], execute=params['execute'])
+                    self.execute(query_str=params['query_str'], execute=params['execute'], **execute_params)
             elif function == 'tables':
                 self.tables()
             elif function is not None:
@@ -146,7 +199,10 @@ class SQLCursor(Thread):
         """
 
         with self.__is_closing:
-            if self.__cursor and hasattr(self.__cursor, 'cancel'):
+            # A canceled cursor is not handed back to the statement cache
+            self.__statement = None
+
+            if self.__cursor:
                 try:
                     if write_log:
                         if self.__engine_class:
@@ -155,12 +211,25 @@ class SQLCursor(Thread):
                         else:
                             log.debug('Canceling & Closing SQL cursor %s transaction', self.cursor_id)
 
-                    self.__cursor.cancel()
+                    if hasattr(self.__cursor, 'cancel'):
+                        self.__cursor.cancel()
                 except:
                     pass
                 finally:
                     self.__close()
 
+    def cancel(self):
+        """
+        Cancels the statement running on this cursor from another thread. The executing thread records the cancel as
+        an error, rolls back and closes the cursor
+        """
+
+        from .engine import cancel_cursor
+
+        if self.__cursor:
+            log.debug('Canceling SQL cursor %s statement on SPID %s', self.cursor_id, self.__spid)
+            cancel_cursor(self.__cursor, self.__raw_engine)
+
     def rollback(self, write_log=True):
         """
         Rollsback cursor comm and executes close() operations within SQLCursor class instance
@@ -169,7 +238,7 @@ class SQLCursor(Thread):
         """
 
         with self.__is_closing:
-            if self.__cursor and hasattr(self.__cursor, 'rollback'):
+            if self.__cursor:
                 try:
                     if write_log:
                         if self.__engine_class:
@@ -178,7 +247,7 @@ class SQLCursor(Thread):
                         else:
                             log.debug('Rollback & Close SQL cursor %s transaction', self.cursor_id)
 
-                    self.__cursor.rollback()
+                    self.__transact('rollback')
                 except:
                     pass
                 finally:
@@ -193,7 +262,7 @@ class SQLCursor(Thread):
 
         try:
             with self.__is_closing:
-                if self.__cursor and hasattr(self.__cursor, 'commit'):
+                if self.__cursor:
                     if write_log:
                         if self.__engine_class:
                             log.debug('SQL Connection (%s): Commit & Close SQL cursor %s transaction',
@@ -201,23 +270,47 @@ class SQLCursor(Thread):
                         else:
                             log.debug('Commit & Close SQL cursor %s transaction', self.cursor_id)
 
-                    self.__cursor.commit()
+                    start = monotonic()
+                    self.__transact('commit')
+                    self.__stats.execute += monotonic() - start
                     self.__close()
         except:
             self.rollback()
             pass
 
+    def __transact(self, action):
+        # pyodbc commits and rolls back on the cursor, other DB-API drivers (ie sqlite3) only on the connection
+        if hasattr(self.__cursor, action):
+            getattr(self.__cursor, action)()
+        elif self.__raw_engine is not None and hasattr(self.__raw_engine, action):
+            getattr(self.__raw_engine, action)()
+
     def __close(self):
-        from .engine import close_engine
+        from .engine import close_engine, invalidate_engine
+
+        if self.__stats.total is None:
+            self.__stats.finish(self.__execute_errors)
+
+            if self.__query_stats is not None:
+                self.__query_stats.record(self.__stats)
 
-        if self.__cursor and hasattr(self.__cursor, 'close'):
+        if self.__cursor and self.__statement is not None and not self.__execute_errors and \
+                (self.__keep_engine_alive or self.__engine_pool):
+            self.__statement_cache.checkin(self.__engine, self.__statement, self.__cursor)
+        elif self.__cursor and hasattr(self.__cursor, 'close'):
             try:
                 self.__cursor.close()
             except:
                 pass
 
-        if not self.__keep_engine_alive:
-            log.debug('Closed connection on SPID %s', spid)
+        if self.__owns_raw_engine and self.__raw_engine and hasattr(self.__raw_engine, 'close'):
+            try:
+                self.__raw_engine.close()
+            except:
+                pass
+
+        if not self.__keep_engine_alive and not self.__engine_pool:
+            log.debug('Closed connection on SPID %s', self.__spid)
             close_engine(self.__engine)
 
         if self.__engine_class:
@@ -226,9 +319,20 @@ class SQLCursor(Thread):
 
             self.__engine_class.rem_cursor(self)
 
+        if self.__engine_pool:
+            disconnected = is_disconnect(self.__execute_errors)
+
+            if disconnected:
+                # A dead link is replaced instead of being handed to the next cursor
+                invalidate_engine(self.__engine)
+
+            log.debug('Returned connection on SPID %s to pool', self.__spid)
+            self.__engine_pool.checkin(self.__engine, validate=bool(self.__execute_errors), discard=disconnected)
+
         self.__engine = None
         self.__raw_engine = None
         self.__cursor = None
+        self.__statement = None
 
     def tables(self):
         """
@@ -243,8 +347,13 @@ class SQLCursor(Thread):
 
                 with self.__is_pending:
                     log.debug("Retreiving tables on SPID %s" % self.__spid)
+                    self.__stats.action = 'tables'
                     self.__execute_results = list()
+                    start = monotonic()
                     tables = [[t.table_type, t.table_cat, t.table_schem, t.table_name] for t in self.__cursor.tables()]
+                    self.__stats.fetch += monotonic() - start
+                    self.__stats.rows += len(tables)
+                    start = monotonic()
 
                     if tables:
                         self.__execute_results.append(DataFrame(tables, columns=['Table_Type', 'Table_Cat',
@@ -252,6 +361,8 @@ class SQLCursor(Thread):
                     else:
                         self.__execute_results.append(DataFrame())
 
+                    self.__stats.build += monotonic() - start
+
                     self.__close()
             except SQLAlchemyError as e:
                 self.__execute_errors = [e.code, e.__dict__['orig']]
@@ -266,7 +377,8 @@ class SQLCursor(Thread):
             raise Exception("Cursor is closed. Cannot pull tables")
 
     def execute(self, query_str, execute=False, handler=None, buffer=1000, csv_path=None, csv_replace=False,
-                delimiter=',', quotechar='"', quoting=QUOTE_ALL):
+                delimiter=',', quotechar='"', quoting=QUOTE_ALL, columnar=True, params=None, many=False,
+                export_format=None, timeout=None):
         """
         Requests sql connection to execute or query a sql query string. Execution of TSQL queries will follow
         commit and rollback commands when necessary. Results are appended to the results and/or errors attributes
@@ -275,13 +387,27 @@ class SQLCursor(Thread):
         :param execute: (Optional) [True/False] Default is False
         :param handler: (Optional) Function or Class Function handler
         :param buffer: (Optional) [handler only] Number of lines per chunk to store in dataframe
-        :param csv_path: (Optional) [handler only] File path where data is stored at for csv file
+        :param csv_path: (Optional) File path where data is stored at. Without a handler rows are streamed to the file
+        in batches and never held in a DataFrame
         :param csv_replace: (Optional) [True/False] Replace csv file if exists
-        :param delimiter: (Optional) [handler only] Data seperator to delimit columns
-        :param quotechar: (Optional) [handler only] Quote Character to wrap values with
+        :param delimiter: (Optional) Data seperator to delimit columns
+        :param quotechar: (Optional) Quote Character to wrap values with
         :param quoting: (Optional) csv quoting variable
+        :param columnar: (Optional) [True/False] Build result DataFrames from typed column arrays fetched in batches
+        instead of row tuples
+        :param params: (Optional) Bind parameters for the placeholders in query_str, or a list of parameter sets when
+        many is True
+        :param many: (Optional) [True/False] executemany() query_str once per parameter set in params
+        :param export_format: (Optional) [csv, gzip, zstd, parquet] File format of csv_path without a handler
+        Default is inferred from the csv_path extension
+        :param timeout: (Optional) Seconds the statement may run before the watchdog cancels it (None or 0 is infinity)
         """
 
+        exporter = None
+
+        if many and params is None:
+            raise ValueError("'params' must be provided when many is True")
+
         if handler:
             if not isinstance(handler, (FunctionType, BuiltinFunctionType, MethodType, BuiltinMethodType)):
                 raise ValueError("'handler' %r is not a function" % handler)
@@ -309,6 +435,18 @@ class SQLCursor(Thread):
 
             if csv_path and os.path.exists(csv_path):
                 raise ValueError("'csv_path' %r file exists already" % csv_path)
+        elif csv_path:
+            if not isinstance(csv_path, str):
+                raise ValueError("'csv_path' %r is not a str" % csv_path)
+
+            exporter = ResultExporter(csv_path, export_format=export_format, delimiter=delimiter, quotechar=quotechar,
+                                      quoting=quoting)
+
+            if csv_replace and os.path.exists(csv_path):
+                try:
+                    os.remove(csv_path)
+                except:
+                    pass
 
         if self.__cursor:
             if not isinstance(query_str, str):
@@ -316,101 +454,197 @@ class SQLCursor(Thread):
 
             try:
                 if not self.__cursor_action:
-                    self.__cursor_action = ['execute', dict(query_str=query_str, execute=execute)]
+                    self.__cursor_action = ['execute', dict(query_str=query_str, execute=execute, params=params,
+                                                            many=many)]
 
                 with self.__is_pending:
                     log.debug("Executing query on SPID %s" % self.__spid)
+                    self.__stats.action, self.__stats.query_str = 'execute', query_str
                     self.__execute_results = list()
-                    result = self.__cursor.execute(query_str)
+                    watch_token = self.__watch(timeout)
 
-                    if handler:
-                        self.__stream_dataset(result, handler, buffer, csv_path, delimiter, quotechar, quoting)
-                    else:
-                        self.__store_dataset(result, csv_path, delimiter, quotechar, quoting)
+                    try:
+                        start = monotonic()
+
+                        if params is not None:
+                            self.__prepare_statement(query_str)
 
-                    while result.nextset():
-                        if handler:
-                            self.__stream_dataset(result, handler, buffer, csv_path, delimiter, quotechar, quoting)
+                        if many:
+                            if hasattr(self.__cursor, 'fast_executemany'):
+                                self.__cursor.fast_executemany = True
+
+                            self.__cursor.executemany(query_str, params)
+                            self.__stats.execute += monotonic() - start
                         else:
-                            self.__store_dataset(result, csv_path, delimiter, quotechar, quoting)
+                            if params is None:
+                                result = self.__cursor.execute(query_str)
+                            else:
+                                result = self.__cursor.execute(query_str, params)
+
+                            self.__stats.execute += monotonic() - start
+
+                            if handler:
+                                self.__stream_dataset(result, query_str, handler, buffer, csv_path, delimiter,
+                                                      quotechar, quoting)
+                            elif exporter:
+                                self.__export_dataset(result, exporter)
+                            else:
+                                self.__store_dataset(result, columnar)
+
+                            while self.__next_set(result):
+                                if handler:
+                                    self.__stream_dataset(result, query_str, handler, buffer, csv_path, delimiter,
+                                                          quotechar, quoting)
+                                elif exporter:
+                                    self.__export_dataset(result, exporter)
+                                else:
+                                    self.__store_dataset(result, columnar)
+                    finally:
+                        self.__unwatch(watch_token)
 
                     if execute:
                         self.commit()
                     else:
                         self.__close()
             except SQLAlchemyError as e:
-                self.__execute_errors = [e.code, e.__dict__['orig']]
+                self.__execute_errors = self.__timeout_errors(e, timeout) or [e.code, e.__dict__['orig']]
                 self.rollback()
             except PYODBCError as e:
-                self.__execute_errors = [e.args[0], e.args[1]]
+                self.__execute_errors = self.__timeout_errors(e, timeout) or [e.args[0], e.args[1]]
                 self.rollback()
             except (AttributeError, Exception) as e:
                 from traceback import format_exc
                 print(format_exc())
-                self.__execute_errors = [type(e).__name__, str(e)]
+                self.__execute_errors = self.__timeout_errors(e, timeout) or [type(e).__name__, str(e)]
                 self.rollback()
+            finally:
+                if exporter:
+                    exporter.close()
+                    self.__export_stats = exporter.stats
         else:
             raise Exception("Cursor is closed. Cannot execute query")
 
-    def __store_dataset(self, dataset, csv_path, delimiter, quotechar, quoting):
-        try:
-            data = [tuple(t) for t in dataset.fetchall()]
-            cols = [column[0] for column in dataset.description]
-            df = DataFrame(data, columns=cols)
-
-            if csv_path:
-                if os.path.exists(csv_path):
-                    df.to_csv(path_or_buf=csv_path, sep=delimiter, quotechar=quotechar, mode='a', index=False,
-                              quoting=quoting)
-                else:
-                    df.to_csv(path_or_buf=csv_path, sep=delimiter, quotechar=quotechar, mode='w', index=False,
-                              quoting=quoting)
-            else:
-                self.__execute_results.append(df)
-        except:
-            pass
+    def __watch(self, timeout):
+        # Deadline is enforced by cancelling the statement from the watchdog thread
+        if not timeout:
+            return None
 
-    def __stream_dataset(self, dataset, handler, buffer, csv_path, delimiter, quotechar, quoting):
-        try:
-            cols = [column[0] for column in dataset.description]
-            buffer_list = list()
-            row_num = 0
+        from .watchdog import StatementWatchdog
+
+        self.__timed_out = False
+        return StatementWatchdog.default().watch(timeout, self.__deadline_passed)
+
+    @staticmethod
+    def __unwatch(watch_token):
+        if watch_token is not None:
+            from .watchdog import StatementWatchdog
+            StatementWatchdog.default().unwatch(watch_token)
+
+    def __deadline_passed(self):
+        log.debug('SQL cursor %s statement on SPID %s passed its deadline', self.cursor_id, self.__spid)
+        self.__timed_out = True
+        self.cancel()
+
+    def __timeout_errors(self, error, timeout):
+        # Driver query timeouts (SQLSTATE HYT00) and watchdog cancels are both reported as timeouts
+        orig = getattr(error, 'orig', error)
+
+        if getattr(orig, 'args', None) and orig.args[0] == 'HYT00':
+            self.__timed_out = True
 
-            for row in dataset:
-                buffer_list.append(tuple(row))
+        if self.__timed_out:
+            return ['HYT00', 'Statement timed out after %s seconds' % timeout]
 
-                if buffer <= len(buffer_list):
-                    self.__handle_buffer(row_num, cols, buffer_list, handler, csv_path, delimiter, quotechar, quoting)
-                    buffer_list.clear()
+    def __prepare_statement(self, query_str):
+        # Swap in the cursor that already has query_str prepared on this connection
+        if self.__statement_cache is None:
+            return
 
-                row_num += 1
+        cursor = self.__statement_cache.checkout(self.__engine, query_str)
+
+        if cursor is not None:
+            try:
+                self.__cursor.close()
+            except:
+                pass
+
+            self.__cursor = cursor
+
+        self.__statement = query_str
+
+    def __next_set(self, dataset):
+        # Later result sets are produced by the server while nextset() waits. sqlite3 has a single result set
+        if not hasattr(dataset, 'nextset'):
+            return False
+
+        start = monotonic()
+
+        try:
+            return dataset.nextset()
+        finally:
+            self.__stats.execute += monotonic() - start
+
+    def __store_dataset(self, dataset, columnar=True):
+        try:
+            if not dataset.description:
+                return
 
-            self.__handle_buffer(row_num - 1, cols, buffer_list, handler, csv_path, delimiter, quotechar, quoting)
+            df = materialize_dataframe(dataset, fetch_size=ColumnarMaterializer.DEFAULT_FETCH_SIZE, columnar=columnar,
+                                       stats=self.__stats)
+            self.__execute_results.append(df)
         except:
             pass
 
-    @staticmethod
-    def __handle_buffer(row_num, cols, buffer_list, handler, csv_path, delimiter, quotechar, quoting):
-        if buffer_list:
-            df = DataFrame(buffer_list, columns=cols)
+    def __export_dataset(self, dataset, exporter):
+        # Rows go from fetchmany() batches straight to the file so memory stays flat for any result size
+        start = monotonic()
+        exporter.write_dataset(dataset)
+        self.__stats.fetch += monotonic() - start
+        self.__export_stats = exporter.stats
+        self.__stats.rows, self.__stats.bytes = self.__export_stats['rows'], self.__export_stats['bytes_written']
+        log.debug("Exported %s rows from SPID %s (%.0f rows/sec)", self.__export_stats['rows'], self.__spid,
+                  self.__export_stats['rows_per_second'])
+
+    def __stream_dataset(self, dataset, query_str, handler, buffer, csv_path, delimiter, quotechar, quoting):
+        if not dataset.description:
+            return
+
+        # Chunks are built from typed column buffers with the dtypes this query settled on in earlier runs
+        builder = ChunkBuilder(dataset, chunk_rows=buffer, cache_key=query_str)
+        row_start = 0
+
+        for rows in builder.fetch_batches():
+            df = builder.build_dataframe(rows)
+            self.__stats.rows += len(df)
+            self.__stats.bytes += int(df.memory_usage(index=False).sum())
+            self.__handle_buffer(df, row_start, handler, csv_path, delimiter, quotechar, quoting)
+            row_start += len(df)
+
+        # Time spent in handlers is the caller's and is left out of fetch and build
+        self.__stats.fetch += builder.fetch_time
+        self.__stats.build += builder.build_time
 
-            if csv_path:
-                hreturn = handler(df, row_num - len(buffer_list) + 1, row_num)
+    @staticmethod
+    def __handle_buffer(df, row_start, handler, csv_path, delimiter, quotechar, quoting):
+        row_end = row_start + len(df) - 1
 
-                if hreturn and isinstance(hreturn, DataFrame):
-                    df = hreturn
+        if csv_path:
+            hreturn = handler(df, row_start, row_end)
 
-                if row_num - len(buffer_list) + 1 == 0:
-                    mode = 'w'
-                    header = True
-                else:
-                    mode = 'a'
-                    header = False
+            if isinstance(hreturn, DataFrame):
+                df = hreturn
 
-                df.to_csv(path_or_buf=csv_path, sep=delimiter, quotechar=quotechar, mode=mode, index=False,
-                          header=header, quoting=quoting)
+            if row_start == 0:
+                mode = 'w'
+                header = True
             else:
-                handler(df, row_num - len(buffer_list) + 1, row_num)
+                mode = 'a'
+                header = False
+
+            df.to_csv(path_or_buf=csv_path, sep=delimiter, quotechar=quotechar, mode=mode, index=False,
+                      header=header, quoting=quoting)
+        else:
+            handler(df, row_start, row_end)
 
 
 class EngineCursor(Thread):
@@ -421,18 +655,22 @@ class EngineCursor(Thread):
     __engine = None
     __engine_class = None
 
-    def __init__(self, alch_engine, spid, keep_engine_alive=True, engine_class=None, action=None, action_params=None):
+    def __init__(self, alch_engine, spid, keep_engine_alive=True, engine_class=None, action=None, action_params=None,
+                 engine_pool=None, connect_time=0.0, query_stats=None):
         """
         Creates a EngineCursor class instance and run an action with parameters upon class creation
 
-        :param alch_engine: SQLAlchemy engine
+        :param alch_engine: SQLAlchemy engine or connection
         :param engine_class: (Optional) SQLEngine instance class
         :param action: (Optional) [upload]
         :param action_params: (Optional) upload_df() command parameters
+        :param engine_pool: (Optional) SQLConnectionPool that engine was borrowed from and is returned to on close
+        :param connect_time: (Optional) Seconds spent acquiring alch_engine before this cursor was created
+        :param query_stats: (Optional) QueryStats that the cursor's stats are recorded in once it closes
         """
 
-        if not isinstance(alch_engine, Engine):
-            raise ValueError("'alch_engine' %r is not an Alchemy Engine instance" % alch_engine)
+        if not isinstance(alch_engine, (Engine, Connection)):
+            raise ValueError("'alch_engine' %r is not an Alchemy Engine or Connection instance" % alch_engine)
 
         if action and action != 'upload_df':
             raise ValueError("'action' is not upload_df")
@@ -441,10 +679,14 @@ class EngineCursor(Thread):
         self.__engine = alch_engine
         self.__spid = spid
         self.__keep_engine_alive = keep_engine_alive
+        self.__engine_pool = engine_pool
         self.__cursor_action = [action, action_params]
         self.__is_pending = Lock()
         self.__is_closing = Lock()
         self.__errors = None
+        self.__upload_counts = None
+        self.__query_stats = query_stats
+        self.__stats = CursorStats(action, spid=spid, connect=connect_time)
         self.cursor_id = sum(map(ord, str(os.urandom(100))))
         super(EngineCursor, self).__init__()
 
@@ -472,6 +714,22 @@ class EngineCursor(Thread):
 
         return self.__errors
 
+    @property
+    def upload_counts(self):
+        """
+        :return: Dictionary of inserted, updated and unchanged row counts of an upsert upload_df()
+        """
+
+        return self.__upload_counts
+
+    @property
+    def stats(self):
+        """
+        :return: Returns CursorStats of queue_wait, connect and execute (upload) seconds, rows and bytes uploaded
+        """
+
+        return self.__stats
+
     @property
     def is_pending(self):
         """
@@ -498,6 +756,8 @@ class EngineCursor(Thread):
         Run operator that is executed upon creation of this SQLCursor class instance
         """
 
+        self.__stats.mark_run()
+
         if self.__cursor_action:
             function, params = self.__cursor_action
 
@@ -506,18 +766,8 @@ class EngineCursor(Thread):
                     raise ValueError("'dataframe' was not provided as action_param when class ran")
                 if 'table_name' not in params.keys():
                     raise ValueError("'table_name' was not provided as action_param when class ran")
-                if 'table_schema' not in params.keys():
-                    params['table_schema'] = None
-                if 'if_exists' not in params.keys():
-                    params['if_exists'] = None
-                if 'index' not in params.keys():
-                    params['index'] = None
-                if 'index_label' not in params.keys():
-                    params['index_label'] = None
-
-                self.upload_df(dataframe=params['dataframe'], table_name=params['table_name'],
-                               table_schema=params['table_schema'], if_exists=params['if_exists'],
-                               index=params['index'], index_label=params['index_label'])
+
+                self.upload_df(**params)
             elif function is not None:
                 raise ValueError("'function' %s is an invalid function command" % function)
 
@@ -541,57 +791,122 @@ class EngineCursor(Thread):
 
                 self.__close()
 
-    def upload_df(self, dataframe, table_name, table_schema=None, if_exists='append', index=True, index_label='ID'):
+    def upload_df(self, dataframe, table_name, table_schema=None, if_exists='append', index=True, index_label='ID',
+                  method=None, chunksize=None, stage_dir=None, mode='insert', keys=None):
         """
-        Uploads a pandas DataFrame to a sql table
+        Uploads a pandas DataFrame to a sql table. A Parquet/Arrow dataset is uploaded one record batch at a time,
+        the first batch honours if_exists and later batches append. mode='upsert' loads rows into a session temp
+        table and merges them into the table, updating rows whose keys exist and inserting the rest
 
-        :param dataframe: pandas Dataframe
+        :param dataframe: pandas Dataframe, or Parquet/Arrow file or directory path or pyarrow Dataset
         :param table_name: SQL table name
         :param table_schema: (Optional) SQL table schema
         :param if_exists: (Optional) [append, replace]
         :param index: (Optional) [True, False] Default is True
         :param index_label: (Optional) Default is ID
+        :param method: (Optional) [None, fast_executemany, multirow, csv] None uses DataFrame.to_sql()
+        :param chunksize: (Optional) Fixed rows per round trip. DEFAULT is adaptive for bulk methods
+        :param stage_dir: (Optional) [csv only] Directory for staged csv files. Must be readable by the SQL server
+        :param mode: (Optional) [insert, upsert] Default is insert
+        :param keys: (Optional) [upsert only] Column name or list of column names that identify a row
         """
 
         if self.__engine:
-            if not isinstance(dataframe, DataFrame):
-                raise ValueError("'dataframe' %r is not an pandas Dataframe instance" % dataframe)
+            if not isinstance(dataframe, DataFrame) and not is_dataset_source(dataframe):
+                raise ValueError("'dataframe' %r is not an pandas Dataframe instance or dataset path" % dataframe)
             if not isinstance(table_name, str):
                 raise ValueError("'table_name' %r is not a String" % table_name)
             if not isinstance(table_schema, (str, type(None))):
                 raise ValueError("'table_schema' %r is not a String" % table_schema)
 
+            if method is not None and method not in BulkUploader.METHODS:
+                raise ValueError("'method' %r must be either (%s)" % (method, ', '.join(BulkUploader.METHODS)))
+            if mode not in ('insert', 'upsert'):
+                raise ValueError("'mode' %r must be either (insert, upsert)" % mode)
+            if mode == 'upsert' and not keys:
+                raise ValueError("'keys' must be provided for mode 'upsert'")
+            if mode == 'upsert' and if_exists == 'replace':
+                raise ValueError("'if_exists' replace cannot be combined with mode 'upsert'")
+
             if not self.__cursor_action:
                 params = dict(dataframe=dataframe, table_name=table_name, table_schema=table_schema,
-                              if_exists=if_exists, index=index, index_label=index_label)
+                              if_exists=if_exists, index=index, index_label=index_label, method=method,
+                              chunksize=chunksize, stage_dir=stage_dir, mode=mode, keys=keys)
                 self.__cursor_action = ['upload_df', params]
 
             with self.__is_pending:
                 log.debug("SQL Upload on SPID {0} to [{1}.{2}]".format(self.__spid, table_schema, table_name))
+                self.__stats.action = 'upload_df'
+                self.__stats.query_str = '%s.%s' % (table_schema, table_name) if table_schema else table_name
+                start = monotonic()
 
                 try:
-                    dataframe.to_sql(
-                        table_name,
-                        self.__engine,
-                        schema=table_schema,
-                        if_exists=if_exists,
-                        index=index,
-                        index_label=index_label,
-                        chunksize=1000
-                    )
+                    if mode == 'upsert':
+                        self.__upload_counts = dict(inserted=0, updated=0, unchanged=0)
+                        frames = [dataframe] if isinstance(dataframe, DataFrame) else iter_dataset_frames(dataframe)
+
+                        for frame in frames:
+                            counts = UpsertUploader(self.__engine, frame, table_name, keys, table_schema=table_schema,
+                                                    index=index, index_label=index_label,
+                                                    method=method or 'fast_executemany', chunksize=chunksize,
+                                                    stage_dir=stage_dir).upload()
+                            self.__count_frame(frame)
+
+                            for k, v in counts.items():
+                                self.__upload_counts[k] += v
+                    elif isinstance(dataframe, DataFrame):
+                        self.__upload_frame(dataframe, table_name, table_schema, if_exists, index, index_label, method,
+                                            chunksize, stage_dir)
+                    else:
+                        for frame in iter_dataset_frames(dataframe):
+                            self.__upload_frame(frame, table_name, table_schema, if_exists, index, index_label,
+                                                method, chunksize, stage_dir)
+                            if_exists = 'append'
                 except SQLAlchemyError as e:
                     self.__errors = [e.code, e.__dict__['orig']]
+                    self.__stats.execute += monotonic() - start
                     self.close()
                 except (AttributeError, Exception) as e:
                     self.__errors = [type(e).__name__, str(e)]
+                    self.__stats.execute += monotonic() - start
                     self.close()
                 else:
+                    self.__stats.execute += monotonic() - start
                     self.__close()
         else:
             raise ValueError('Engine is closed. Unable to upload dataframe')
 
+    def __count_frame(self, dataframe):
+        self.__stats.rows += len(dataframe)
+        self.__stats.bytes += int(dataframe.memory_usage(index=False).sum())
+
+    def __upload_frame(self, dataframe, table_name, table_schema, if_exists, index, index_label, method, chunksize,
+                       stage_dir):
+        if method:
+            BulkUploader(self.__engine, dataframe, table_name, table_schema=table_schema, if_exists=if_exists,
+                         index=index, index_label=index_label, method=method, chunksize=chunksize,
+                         stage_dir=stage_dir).upload()
+        else:
+            dataframe.to_sql(
+                table_name,
+                self.__engine,
+                schema=table_schema,
+                if_exists=if_exists,
+                index=index,
+                index_label=index_label,
+                chunksize=chunksize or 1000
+            )
+
+        self.__count_frame(dataframe)
+
     def __close(self):
-        from .engine import close_engine
+        from .engine import close_engine, invalidate_engine
+
+        if self.__stats.total is None:
+            self.__stats.finish(self.__errors)
+
+            if self.__query_stats is not None:
+                self.__query_stats.record(self.__stats)
 
         if self.__engine_class:
             if self.__errors:
@@ -599,8 +914,16 @@ class EngineCursor(Thread):
 
             self.__engine_class.rem_cursor(self)
 
-        if not self.__keep_engine_alive:
-            log.debug('Closed connection on SPID %s', spid)
+        if self.__engine_pool:
+            disconnected = is_disconnect(self.__errors)
+
+            if disconnected:
+                invalidate_engine(self.__engine)
+
+            log.debug('Returned connection on SPID %s to pool', self.__spid)
+            self.__engine_pool.checkin(self.__engine, validate=bool(self.__errors), discard=disconnected)
+        elif not self.__keep_engine_alive:
+            log.debug('Closed connection on SPID %s', self.__spid)
             close_engine(self.__engine)
 
         self.__engine = None
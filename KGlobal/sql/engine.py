@@ -1,13 +1,22 @@
 from __future__ import unicode_literals
 
 from ..data.picklemixin import PickleMixIn
-from threading import Lock
-from datetime import datetime, timedelta
-from time import sleep
-from sqlalchemy import create_engine, exc, event, select
-from sqlalchemy.engine import Engine
+from .pool import SQLConnectionPool
+from .executor import SQLExecutor
+from .materializer import ColumnarMaterializer, ChunkBuilder
+from .registry import SQLEngineRegistry, get_sql_engine
+from .statement import SQLStatementCache
+from .cache import SQLResultCache, CachedCursor, query_tables
+from .retry import RetryPolicy, RetryingCursor
+from .validator import ConnectionValidator
+from .stats import QueryStats
+from threading import Lock, Condition
+from time import monotonic
+from concurrent.futures import Future, FIRST_COMPLETED, ALL_COMPLETED
+from sqlalchemy import exc
+from sqlalchemy.engine import Engine, Connection
 from pyodbc import Connection as Engine2, connect as create_engine2, Error, SQL_MAX_CONCURRENT_ACTIVITIES
-from future.moves.queue import LifoQueue, Empty
+from future.moves.queue import LifoQueue, Empty, Full
 from traceback import format_exc
 from csv import QUOTE_ALL
 
@@ -32,11 +41,22 @@ class SQLEngineClass(BaseSQLEngineClass, PickleMixIn):
     CONN_DEFAULT_TIMEOUT = 3
     QUERY_DEFAULT_TIMEOUT = 0
     DEFAULT_CONNECTION_SIZE = 10
+    CONN_DEFAULT_IDLE_TIMEOUT = SQLConnectionPool.DEFAULT_IDLE_TIMEOUT
+    CONN_DEFAULT_MAX_AGE = SQLConnectionPool.DEFAULT_MAX_AGE
+    FIRST_COMPLETED = FIRST_COMPLETED
+    ALL_COMPLETED = ALL_COMPLETED
 
     __slots__ = ("engine_type", "engine_id")
 
     def __init__(self, sql_config, conn_max_pool_size=DEFAULT_CONNECTION_SIZE, conn_timeout=CONN_DEFAULT_TIMEOUT,
-                 query_timeout=QUERY_DEFAULT_TIMEOUT):
+                 query_timeout=QUERY_DEFAULT_TIMEOUT, conn_idle_timeout=CONN_DEFAULT_IDLE_TIMEOUT,
+                 conn_max_age=CONN_DEFAULT_MAX_AGE, executor=None, executor_workers=None, executor_block=True,
+                 engine_pool_size=None, engine_max_overflow=SQLEngineRegistry.DEFAULT_MAX_OVERFLOW,
+                 engine_pool_recycle=SQLEngineRegistry.DEFAULT_POOL_RECYCLE,
+                 engine_pool_pre_ping=SQLEngineRegistry.DEFAULT_POOL_PRE_PING,
+                 statement_cache_size=SQLStatementCache.DEFAULT_MAX_STATEMENTS, result_cache=None, retry_policy=None,
+                 ping_query=None, validate_interval=ConnectionValidator.DEFAULT_VALIDATE_INTERVAL,
+                 slow_query_threshold=None):
         """
         SQL Engine class initialization for SQL
 
@@ -44,12 +64,37 @@ class SQLEngineClass(BaseSQLEngineClass, PickleMixIn):
         :param conn_max_pool_size: [Optional] Pool size for multi-threaded connections
         :param conn_timeout: [Optional] Connection timeout for connecting to SQL Server, DSN, or Access Database
         :param query_timeout: [Optional] Query timeout for querying data DEFAULT is Infinity
+        :param conn_idle_timeout: [Optional] Seconds a pooled connection may sit idle before it is closed (0 is inf)
+        :param conn_max_age: [Optional] Seconds a pooled connection may live before it is closed (0 is infinity)
+        :param executor: [Optional] SQLExecutor or concurrent.futures Executor that runs queued cursors
+        :param executor_workers: [Optional] Number of worker threads for queued cursors DEFAULT is conn_max_pool_size
+        :param executor_block: [Optional] (True/False) Block when saturated or return a rejected Future
+        :param engine_pool_size: [Optional] (alchemy only) Pool size of the SQLAlchemy engine shared by every
+        SQLEngineClass of this SQLConfig DEFAULT is conn_max_pool_size + 1
+        :param engine_max_overflow: [Optional] (alchemy only) Connections allowed above engine_pool_size DEFAULT is no
+        limit, the shared engine then serves the connections every SQLEngineClass of the SQLConfig holds in its own pool
+        :param engine_pool_recycle: [Optional] (alchemy only) Seconds before a connection is recycled (-1 is never)
+        :param engine_pool_pre_ping: [Optional] (alchemy only) (True/False) Test connections on checkout
+        :param statement_cache_size: [Optional] Prepared parameterized statements kept open across pooled connections
+        (0 disables the statement cache)
+        :param result_cache: [Optional] SQLResultCache that sql_execute(cache=True) results are kept in. A cache may
+        be shared by several SQLEngineClass instances. DEFAULT is a SQLResultCache created on first use
+        :param retry_policy: [Optional] RetryPolicy that sql_execute() and sql_upload() retry transient errors (deadlock
+        victims, dropped connections, login timeouts) with DEFAULT is no retries
+        :param ping_query: [Optional] Query string or function(DB-API connection) returning the spid that checks a
+        connection is alive DEFAULT is per SQLConfig type (SELECT @@SPID, no query for Access, SELECT 1 for sqlite)
+        :param validate_interval: [Optional] Seconds a connection's cached SPID is trusted before it is pinged again.
+        Connections are also pinged after a statement on them failed
+        :param slow_query_threshold: [Optional] Seconds a cursor action must take to be written to the
+        KGlobal.sql.stats.slow logger with its phase timings DEFAULT is None (no slow query log)
         """
 
         from ..sql.config import SQLConfig
 
         if not isinstance(sql_config, SQLConfig):
             raise ValueError("'sql_config' %r is not an SQLConfig instance" % sql_config)
+        if retry_policy is not None and not isinstance(retry_policy, RetryPolicy):
+            raise ValueError("'retry_policy' %r is not a RetryPolicy instance" % retry_policy)
 
         self.__sql_config = sql_config
         self.engine_type = self.__sql_config.conn_type
@@ -58,8 +103,39 @@ class SQLEngineClass(BaseSQLEngineClass, PickleMixIn):
         self.__query_timeout = query_timeout
         self.__cursors = LifoQueue(maxsize=conn_max_pool_size)
         self.__conn_max_pool_size = conn_max_pool_size
+        self.__conn_idle_timeout = conn_idle_timeout
+        self.__conn_max_age = conn_max_age
+        self.__engine_pool_size = engine_pool_size or conn_max_pool_size + 1
+        self.__engine_max_overflow = engine_max_overflow
+        self.__engine_pool_recycle = engine_pool_recycle
+        self.__engine_pool_pre_ping = engine_pool_pre_ping
+
+        if statement_cache_size:
+            self.__statement_cache = SQLStatementCache(max_statements=statement_cache_size)
+        else:
+            self.__statement_cache = None
+
+        self.__result_cache = result_cache
+        self.__retry_policy = retry_policy
+        self.__schema_catalog = None
+        self.__validate_interval = validate_interval
+        self.__validator = ConnectionValidator.for_config(sql_config, ping_query=ping_query,
+                                                          validate_interval=validate_interval,
+                                                          validator_id=self.engine_id)
+        self.__conn_pool = self.__create_conn_pool()
+        self.__query_stats = QueryStats(slow_query_threshold=slow_query_threshold, stats_id=self.engine_id)
+
+        if isinstance(executor, SQLExecutor):
+            self.__executor = executor
+        else:
+            self.__executor = SQLExecutor(max_workers=executor_workers or conn_max_pool_size, block=executor_block,
+                                          executor=executor, executor_id=self.engine_id)
+
         self.__engine_lock = Lock()
+        self.__cursors_cond = Condition(Lock())
         self.__cursor_results = list()
+        self.__delivered = set()
+        self.__attempts = dict()
         self.__sql_handlers = list()
         self.__engine_sql_class = None
         self.__main_engine = None
@@ -67,9 +143,13 @@ class SQLEngineClass(BaseSQLEngineClass, PickleMixIn):
 
     @property
     def engine_spid(self):
-        self.__main_engine, self.__main_spid = self.__validate_engine(self.__main_engine)
+        main_engine = self.__main_engine
+        self.__main_engine, self.__main_spid = self.__validator.validate(main_engine)
 
         if not self.__main_engine:
+            if main_engine is not None and self.__statement_cache is not None:
+                self.__statement_cache.discard(main_engine)
+
             self.__main_engine, self.__main_spid = self.connect()
 
         return [self.__main_engine, self.__main_spid]
@@ -82,6 +162,96 @@ class SQLEngineClass(BaseSQLEngineClass, PickleMixIn):
 
         return list(self.__cursors.queue)
 
+    @property
+    def conn_pool(self):
+        """
+        :return: SQLConnectionPool of re-usable connections that queued cursors borrow from
+        """
+
+        return self.__conn_pool
+
+    @property
+    def validation_stats(self):
+        """
+        :return: Dictionary of connection validations (pings sent), cached (pings saved) and failures
+        """
+
+        return self.__validator.stats
+
+    @property
+    def query_stats(self):
+        """
+        :return: QueryStats of every cursor run on this class. snapshot() returns the totals and averages per phase and
+        slow_query_threshold can be changed at any time
+        """
+
+        return self.__query_stats
+
+    @property
+    def retry_policy(self):
+        """
+        :return: RetryPolicy of sql_execute() and sql_upload() or None when transient errors are not retried
+        """
+
+        return self.__retry_policy
+
+    @property
+    def statement_cache(self):
+        """
+        :return: SQLStatementCache of prepared parameterized statements or None when disabled
+        """
+
+        return self.__statement_cache
+
+    @property
+    def result_cache(self):
+        """
+        :return: SQLResultCache of sql_execute(cache=True) results
+        """
+
+        if self.__result_cache is None:
+            self.__result_cache = SQLResultCache()
+
+        return self.__result_cache
+
+    def schema_catalog(self, store=None, store_path=None, refresh_interval=None):
+        """
+        Schema catalog of this SQLConfig that answers has_table(), columns() and tables() lookups from memory. The
+        catalog is created on the first call, later calls return the same catalog
+
+        :param store: [Optional] DataConfig or MutableMapping the catalog is persisted in
+        :param store_path: [Optional] File path the catalog is pickled to
+        :param refresh_interval: [Optional] Seconds after which a lookup triggers an incremental refresh. None refreshes
+        only on the first lookup after a persisted catalog was loaded
+        :return: SchemaCatalog instance class
+        """
+
+        from .catalog import SchemaCatalog
+
+        if self.__schema_catalog is None:
+            self.__schema_catalog = SchemaCatalog(self, store=store, store_path=store_path,
+                                                  refresh_interval=refresh_interval)
+
+        return self.__schema_catalog
+
+    def invalidate_cache(self, table_name=None):
+        """
+        Drops cached query results
+
+        :param table_name: [Optional] Drop results of queries that touched this table DEFAULT drops every result
+        """
+
+        if self.__result_cache is not None:
+            self.__result_cache.invalidate(table_name)
+
+    @property
+    def executor(self):
+        """
+        :return: SQLExecutor worker pool that runs queued cursors
+        """
+
+        return self.__executor
+
     @property
     def sql_config(self):
         """
@@ -123,6 +293,7 @@ class SQLEngineClass(BaseSQLEngineClass, PickleMixIn):
             * results
             * errors
             * is_pending
+            * timed_out (SQLCursor only) True when the statement was cancelled at its deadline
 
         :return: List of completed SQLCursor or EngineCursor class objects
         """
@@ -137,43 +308,27 @@ class SQLEngineClass(BaseSQLEngineClass, PickleMixIn):
         :return: (True/False) if test connection was successful. No return result for regular connection
         """
 
-        if self.engine_type == 'alchemy':
-            engine = create_engine(
-                self.__sql_config.gen_conn_str(), connect_args={
-                    'timeout': self.__conn_timeout, 'connect_timeout': self.__conn_timeout,
-                    'options': '-c statement_timeout=%s' % self.__query_timeout}
-            )
-
-            @event.listens_for(engine, "engine_connect")
-            def ping_connection(connection, branch):
-                if branch:
-                    return
+        # pyodbc.connect() only knows the login timeout, the query timeout is set on each connection below
+        connect_args = {'timeout': self.__conn_timeout}
 
-                try:
-                    connection.scalar(select([1]))
-                except exc.DBAPIError as err:
-                    if err.connection_invalidated:
-                        try:
-                            connection.scalar(select([1]))
-                        except exc.DBAPIError as err:
-                            raise ValueError('Unable to connect %s' % err)
-                    else:
-                        raise ValueError('Unable to connect %s' % err)
+        if self.engine_type == 'alchemy':
+            try:
+                engine = get_sql_engine(self.__sql_config, pool_size=self.__engine_pool_size,
+                                        max_overflow=self.__engine_max_overflow,
+                                        pool_recycle=self.__engine_pool_recycle,
+                                        pool_pre_ping=self.__engine_pool_pre_ping, connect_args=connect_args)
+                engine = engine.connect()
+            except exc.SQLAlchemyError as e:
+                # DBAPIError for failed logins, TimeoutError when a bounded shared engine pool is exhausted
+                if test_conn:
+                    return False
                 else:
-                    if test_conn:
-                        close_engine(engine)
-                        return False
-
-            engine.connect()
+                    raise ValueError('Unable to connect %s' % e)
         else:
             engine = None
 
             try:
-                engine = create_engine2(
-                    self.__sql_config.gen_conn_str(), connect_args={
-                        'timeout': self.__conn_timeout, 'connect_timeout': self.__conn_timeout,
-                        'options': '-c statement_timeout=%s' % self.__query_timeout}
-                )
+                engine = create_engine2(SQLEngineRegistry.conn_str(self.__sql_config), **connect_args)
                 engine.commit()
             except Error as e:
                 close_engine(engine)
@@ -187,11 +342,12 @@ class SQLEngineClass(BaseSQLEngineClass, PickleMixIn):
             close_engine(engine)
             return True
         else:
-            if self.engine_type == 'alchemy' and not isinstance(engine, Engine):
-                raise ValueError("'engine' %r is not an Engine instance of SQLAlchemy Engine" % engine)
+            if self.engine_type == 'alchemy' and not isinstance(engine, Connection):
+                raise ValueError("'engine' %r is not a Connection instance of SQLAlchemy Engine" % engine)
             if self.engine_type == 'pyodbc' and not isinstance(engine, Engine2):
                 raise ValueError("'engine' %r is not an Engine instance of PYODBC Connection" % engine)
 
+            set_query_timeout(engine, self.__query_timeout)
             engine, spid = self.__validate_engine(engine)
             log.debug('SQL Engine %s: Created connection (%s) on SPID %s', self.engine_id, str(self.__sql_config), spid)
             return [engine, spid]
@@ -229,64 +385,160 @@ class SQLEngineClass(BaseSQLEngineClass, PickleMixIn):
         return registerhandler
 
     def sql_execute(self, query_str, execute=False, queue_cursor=False, new_engine=False, csv_path=None,
-                    csv_replace=False, delimiter=',', quotechar='"', quoting=QUOTE_ALL):
+                    csv_replace=False, delimiter=',', quotechar='"', quoting=QUOTE_ALL, columnar=True, params=None,
+                    many=False, cache=False, cache_ttl=None, export_format=None, parquet_path=None, timeout=None,
+                    retry=None, idempotent=None):
         """
         Execute or Query SQL query statement. This command can be multi-threaded in a cursor queue
 
-        :param query_str: Query string that is executed to connection
+        :param query_str: Query string that is executed to connection. Use driver placeholders (? for pyodbc) with
+        params instead of formatting values into the string so the server can re-use the statement plan
         :param execute: [Optional] (True/False) Choose to execute or query results
         :param queue_cursor: [Optional] (True/False) Add to multi-thread queue
         :param new_engine: [Optional] (True/False) creates new engine for threading
-        :param csv_path: File path where data is stored at for csv file
+        :param csv_path: File path where data is stored at for csv file. Rows are streamed from the cursor to the file
+        in batches without building a DataFrame. Export counters are on the returned cursor's export_stats
         :param csv_replace: (Optional) [True/False] Replace csv file if exists
         :param delimiter: Data seperator to delimit columns
         :param quotechar: Quote Character to wrap values with
         :param quoting: csv quote mode
-
-        :return: Returns Cursor class if queue_cursor is set to False
+        :param columnar: [Optional] (True/False) Build result DataFrames from typed column arrays fetched in batches.
+        False falls back to building DataFrames from row tuples
+        :param params: [Optional] Bind parameters for the placeholders in query_str, or a list of parameter sets when
+        many is True. Parameterized statements are prepared once per pooled connection and re-used
+        :param many: [Optional] (True/False) executemany() query_str once per parameter set in params
+        :param cache: [Optional] (True/False) Serve the results from result_cache when the same query and params were
+        run on this SQLConfig before, otherwise cache the results. Ignored when executing, streaming to handlers or
+        writing to csv_path. Executed statements invalidate cached results of the tables they touch
+        :param cache_ttl: [Optional] Seconds the cached results are served for DEFAULT is the result_cache ttl
+        :param export_format: [Optional] (csv, gzip, zstd, parquet) File format of csv_path DEFAULT is inferred from the
+        csv_path extension (.gz, .zst, .parquet) and csv otherwise. zstd requires zstandard and parquet requires pyarrow
+        :param parquet_path: [Optional] File path result sets are written to as Parquet, one row group per fetched
+        batch. Shorthand for csv_path with export_format parquet. Later result sets go to name_1.parquet, ...
+        :param timeout: [Optional] Seconds the statement may run before it is cancelled on the server DEFAULT is
+        query_timeout (0 is infinity). Timed out cursors have timed_out set and errors of ['HYT00', message]
+        :param retry: [Optional] RetryPolicy for transient errors, or False to disable DEFAULT is retry_policy. Not
+        applied when streaming to handlers or appending to an existing csv_path (csv_replace is False)
+        :param idempotent: [Optional] (True/False) Running the statement twice is harmless, so dropped connections are
+        retried as well as deadlocks DEFAULT is True for queries and False for executed statements
+
+        :return: Returns Cursor class if queue_cursor is set to False, otherwise a Future that resolves to the Cursor.
+        Cached results are returned as a CachedCursor
         """
 
-        if new_engine or queue_cursor:
-            engine, spid = self.connect()
-            keep_engine_alive = False
+        if many and params is None:
+            raise ValueError("'params' must be provided when many is True")
+
+        if parquet_path:
+            if csv_path:
+                raise ValueError("'csv_path' and 'parquet_path' cannot both be set")
+
+            csv_path, export_format = parquet_path, 'parquet'
+
+        if timeout is None:
+            timeout = self.__query_timeout
+
+        cache_key = None
+
+        if execute:
+            if self.__result_cache is not None:
+                for table_name in query_tables(query_str):
+                    self.__result_cache.invalidate(table_name)
+        elif cache and not many and not csv_path and not self.__sql_handlers:
+            cache_key = self.result_cache.make_key(self.__sql_config, query_str, params)
+            results = self.__result_cache.get(cache_key)
+
+            if results is not None:
+                log.debug('SQL Engine %s: Served query from result cache', self.engine_id)
+                cursor = CachedCursor(results, query_str)
+                return cursor.as_future() if queue_cursor else cursor
+
+        retry = self.__retry_policy if retry is None else retry
+        args = (new_engine, queue_cursor, query_str, execute, csv_path, csv_replace, delimiter, quotechar, quoting,
+                columnar, params, many, export_format, timeout)
+
+        if retry and not self.__sql_handlers and (not csv_path or csv_replace):
+            if idempotent is None:
+                idempotent = not execute
+
+            if queue_cursor:
+                cursor = self.__run_retries(retry, lambda chain: self.__run_execute(*args, chain=chain), idempotent)
+            else:
+                cursor = retry.run(lambda: self.__run_execute(*args), idempotent=idempotent)
         else:
-            engine, spid = self.engine_spid
-            keep_engine_alive = True
+            cursor = self.__run_execute(*args)
+
+        if cache_key is not None:
+            self.__cache_results(cursor, cache_key, query_str, cache_ttl)
+
+        return cursor
+
+    def __run_execute(self, new_engine, queue_cursor, query_str, execute, csv_path, csv_replace, delimiter, quotechar,
+                      quoting, columnar, params, many, export_format, timeout, chain=None):
+        start = monotonic()
+
+        try:
+            engine, spid, keep_engine_alive = self.__acquire_engine(new_engine, queue_cursor)
+        except ValueError as e:
+            if queue_cursor:
+                return SQLExecutor.rejected(e)
+
+            raise
+
+        connect_time = monotonic() - start
 
         if new_engine:
-            self.__execute_sql(engine, spid, keep_engine_alive, query_str, execute, queue_cursor, csv_path,
-                               csv_replace, delimiter, quotechar, quoting)
+            cursor = self.__execute_sql(engine, spid, keep_engine_alive, query_str, execute, queue_cursor, csv_path,
+                                        csv_replace, delimiter, quotechar, quoting, columnar, params, many,
+                                        export_format, timeout, connect_time, chain)
         else:
             with self.__engine_lock:
-                self.__execute_sql(engine, spid, keep_engine_alive, query_str, execute, queue_cursor, csv_path,
-                                   csv_replace, delimiter, quotechar, quoting)
+                cursor = self.__execute_sql(engine, spid, keep_engine_alive, query_str, execute, queue_cursor,
+                                            csv_path, csv_replace, delimiter, quotechar, quoting, columnar, params,
+                                            many, export_format, timeout, connect_time, chain)
+
+        return self.__check_main_engine(engine, keep_engine_alive, cursor)
+
+    def __cache_results(self, cursor, cache_key, query_str, cache_ttl):
+        def store(completed):
+            if completed is not None and not completed.errors and completed.results is not None:
+                self.__result_cache.put(cache_key, completed.results, ttl=cache_ttl, query_str=query_str)
+
+        if isinstance(cursor, Future):
+            cursor.add_done_callback(lambda f: f.cancelled() or f.exception() is not None or store(f.result()))
+        else:
+            store(cursor)
 
     def __execute_sql(self, engine, spid, keep_engine_alive, query_str, execute=False, queue_cursor=False,
-                      csv_path=None, csv_replace=False, delimiter=',', quotechar='"', quoting=QUOTE_ALL):
+                      csv_path=None, csv_replace=False, delimiter=',', quotechar='"', quoting=QUOTE_ALL,
+                      columnar=True, params=None, many=False, export_format=None, timeout=None, connect_time=0.0,
+                      chain=None):
         from ..sql.cursor import SQLCursor
 
         if queue_cursor:
-            params = dict(query_str=query_str, execute=execute, handlers=self.__sql_handlers, csv_path=csv_path,
-                          csv_replace=csv_replace, delimiter=delimiter, quotechar=quotechar, quoting=quoting)
+            action_params = dict(query_str=query_str, execute=execute, handlers=self.__sql_handlers,
+                                 csv_path=csv_path, csv_replace=csv_replace, delimiter=delimiter, quotechar=quotechar,
+                                 quoting=quoting, columnar=columnar, params=params, many=many,
+                                 export_format=export_format, timeout=timeout)
             cursor = SQLCursor(engine_type=self.engine_type, engine=engine, spid=spid, engine_class=self,
-                               action="execute", action_params=params, keep_engine_alive=keep_engine_alive)
+                               action="execute", action_params=action_params, keep_engine_alive=keep_engine_alive,
+                               engine_pool=self.__cursor_pool(keep_engine_alive),
+                               statement_cache=self.__statement_cache, connect_time=connect_time,
+                               query_stats=self.__query_stats)
 
-            try:
-                self.__cursors.put(cursor, block=False)
-                cursor.start()
-            except:
-                cursor.close()
+            return self.__submit_cursor(cursor, chain)
         elif self.__sql_handlers:
             for handler, buffer in self.__sql_handlers:
                 cursor = SQLCursor(engine_type=self.engine_type, engine=engine, spid=spid,
-                                   keep_engine_alive=keep_engine_alive)
+                                   keep_engine_alive=keep_engine_alive,
+                                   engine_pool=self.__cursor_pool(keep_engine_alive),
+                                   statement_cache=self.__statement_cache, connect_time=connect_time,
+                                   query_stats=self.__query_stats)
 
                 try:
-                    cursor.start()
                     cursor.execute(query_str=query_str, execute=execute, handler=handler, buffer=buffer,
                                    csv_path=csv_path, csv_replace=csv_replace, delimiter=delimiter,
-                                   quotechar=quotechar, quoting=quoting)
-                    cursor.join()
+                                   quotechar=quotechar, quoting=quoting, params=params, many=many, timeout=timeout)
                 except Exception as e:
                     cursor.close()
                     log.debug(format_exc())
@@ -294,25 +546,161 @@ class SQLEngineClass(BaseSQLEngineClass, PickleMixIn):
                     return cursor
         else:
             cursor = SQLCursor(engine_type=self.engine_type, engine=engine, spid=spid,
-                               keep_engine_alive=keep_engine_alive)
+                               keep_engine_alive=keep_engine_alive,
+                               engine_pool=self.__cursor_pool(keep_engine_alive),
+                               statement_cache=self.__statement_cache, connect_time=connect_time,
+                               query_stats=self.__query_stats)
 
             try:
-                cursor.start()
                 cursor.execute(query_str=query_str, execute=execute, csv_path=csv_path, csv_replace=csv_replace,
-                               delimiter=delimiter, quotechar=quotechar, quoting=quoting)
-                cursor.join()
+                               delimiter=delimiter, quotechar=quotechar, quoting=quoting, columnar=columnar,
+                               params=params, many=many, export_format=export_format, timeout=timeout)
             except:
                 cursor.close()
                 log.debug(format_exc())
             else:
                 return cursor
 
+    def execute_batch(self, statements, execute=False, parallel=False, stop_on_error=True, columnar=True, timeout=None,
+                      retry=None):
+        """
+        Runs a list of statements and times each one. Statements run in order on one pooled connection, or are spread
+        across parallel pooled connections
+
+        :param statements: List of query strings or (query string, params) tuples
+        :param execute: [Optional] (True/False) Commit after each statement or only query results
+        :param parallel: [Optional] (False/N) Number of pooled connections statements are spread across
+        :param stop_on_error: [Optional] (True/False) Skip statements that have not started once one fails
+        :param columnar: [Optional] (True/False) Build result DataFrames from typed column arrays
+        :param timeout: [Optional] Seconds each statement may run before it is cancelled DEFAULT is query_timeout (0 is
+        infinity). Timed out statements have timed_out set and errors of ['HYT00', message]
+        :param retry: [Optional] RetryPolicy deadlocked statements are re-run with, or False to disable DEFAULT is
+        retry_policy
+        :return: List of StatementResult (status, results, rowcount, elapsed, errors, spid) in the order of statements
+        """
+
+        from ..sql.batch import SQLBatch
+
+        if timeout is None:
+            timeout = self.__query_timeout
+
+        retry = self.__retry_policy if retry is None else retry
+        batch = SQLBatch(self, statements, execute=execute, parallel=parallel, stop_on_error=stop_on_error,
+                         columnar=columnar, timeout=timeout, retry=retry or None)
+
+        if execute and self.__result_cache is not None:
+            for result in batch.results:
+                for table_name in query_tables(result.query_str):
+                    self.__result_cache.invalidate(table_name)
+
+        log.debug('SQL Engine %s: Running batch of %s statements', self.engine_id, len(batch.results))
+        return batch.run()
+
+    def transaction(self, timeout=None):
+        """
+        Pins one pooled connection for a transaction that spans many statements and uploads and commits once
+
+            with engine.transaction() as tx:
+                tx.execute("DELETE FROM stage WHERE load_id = ?", params=[load_id])
+                tx.upload(df, 'stage', method='fast_executemany')
+
+                with tx.savepoint():
+                    tx.execute("EXEC dbo.optional_step")
+
+        Leaving the with block commits and an exception rolls back. An exception inside a savepoint block only rolls
+        back to the savepoint and is re-raised
+
+        :param timeout: [Optional] Seconds to wait for a pooled connection (None is infinity)
+        :return: SQLTransaction
+        """
+
+        from ..sql.transaction import SQLTransaction
+
+        return SQLTransaction(self, timeout=timeout)
+
+    def iter_query(self, query_str, chunk_rows=ColumnarMaterializer.DEFAULT_FETCH_SIZE, as_dataframe=True,
+                   timeout=None, params=None):
+        """
+        Generator that streams a query's result set in chunks. A pooled connection is borrowed when iteration starts
+        and is returned when the generator is exhausted, closed or garbage collected. Errors are raised to the
+        consumer. Chunks are only fetched when the consumer asks for the next one
+
+        :param query_str: Query string that is executed to connection
+        :param chunk_rows: [Optional] Number of rows per chunk
+        :param as_dataframe: [Optional] (True/False) Yield DataFrame chunks or lists of row records
+        :param timeout: [Optional] Seconds to wait for a pooled connection (None is infinity)
+        :param params: [Optional] Bind parameters for the placeholders in query_str
+        :return: Iterator of DataFrame chunks (index is the row number of the result set) or lists of rows
+        """
+
+        if not isinstance(query_str, str):
+            raise ValueError("'query_str' %r is not a String" % query_str)
+        if not isinstance(chunk_rows, int) or chunk_rows < 1:
+            raise ValueError("'chunk_rows' %r must be a positive int" % chunk_rows)
+
+        engine, spid = self.__conn_pool.checkout(timeout=timeout)
+        raw_engine = None
+        owns_raw = False
+        cursor = None
+        exhausted = False
+        failed = False
+
+        try:
+            raw_engine, owns_raw = raw_connection(engine)
+            cursor = raw_engine.cursor()
+
+            log.debug("Streaming query on SPID %s", spid)
+            if params is None:
+                dataset = cursor.execute(query_str) or cursor
+            else:
+                dataset = cursor.execute(query_str, params) or cursor
+
+            while True:
+                if dataset.description:
+                    materializer = ChunkBuilder(dataset, chunk_rows=chunk_rows, cache_key=query_str)
+                    row_start = 0
+
+                    for rows in materializer.fetch_batches():
+                        if as_dataframe:
+                            yield materializer.build_dataframe(rows, row_start)
+                        else:
+                            yield [tuple(row) for row in rows]
+
+                        row_start += len(rows)
+
+                if not hasattr(dataset, 'nextset') or not dataset.nextset():
+                    break
+
+            exhausted = True
+        except GeneratorExit:
+            raise
+        except:
+            failed = True
+            raise
+        finally:
+            if cursor is not None and not exhausted and hasattr(cursor, 'cancel'):
+                try:
+                    cursor.cancel()
+                except:
+                    pass
+
+            for closable in (cursor, raw_engine if owns_raw else None):
+                if closable is not None:
+                    try:
+                        closable.close()
+                    except:
+                        pass
+
+            self.__conn_pool.checkin(engine, validate=failed or not exhausted)
+
     def sql_upload(self, dataframe, table_name, table_schema=None, if_exists='append', index=True, index_label='ID',
-                   queue_cursor=False, new_engine=False):
+                   queue_cursor=False, new_engine=False, method=None, chunksize=None, stage_dir=None, parallelism=1,
+                   atomic=False, retry=None, idempotent=None, mode='insert', keys=None):
         """
         SQL Alchemy's command to upload a Dataframe to the SQL connection
 
-        :param dataframe: Panda's Dataframe
+        :param dataframe: Panda's Dataframe, or a Parquet/Arrow (.arrow, .feather) file or directory path or pyarrow
+        Dataset that is read and uploaded one record batch at a time (requires pyarrow)
         :param table_name: Table name in destination
         :param table_schema: Table schema in destination
         :param if_exists: [Optional] (append/replace) If table exists, should I append or replace table?
@@ -320,126 +708,378 @@ class SQLEngineClass(BaseSQLEngineClass, PickleMixIn):
         :param index_label: [Optional] What is the index column name (Use when Index is True)
         :param queue_cursor: [Optional] (True/False) Add to multi-thread queue
         :param new_engine: [Optional] (True/False) creates new engine for threading
-        :return: Returns Cursor class if queue_cursor is set to False
+        :param method: [Optional] (None/fast_executemany/multirow/csv) Insert method. None uses DataFrame.to_sql()
+            * fast_executemany - executemany() with pyodbc fast_executemany enabled
+            * multirow - multi-row INSERT ... VALUES statements sized under the driver parameter limit
+            * csv - stage rows through csv files and bulk-load them (mssql BULK INSERT, sqlite for testing)
+        :param chunksize: [Optional] Fixed rows per round trip. DEFAULT is sized from column count and round trip time
+        :param stage_dir: [Optional] (csv only) Directory for staged csv files. Must be readable by the SQL server
+        :param parallelism: [Optional] Split dataframe into this many row partitions uploaded concurrently on pooled
+        connections. Per-partition progress and errors are reported in cursor_results
+        :param atomic: [Optional] (True/False) Load partitions into a staging table and move them into the table in one
+        transaction once every partition succeeded
+        :param retry: [Optional] RetryPolicy for transient errors, or False to disable DEFAULT is retry_policy. Not
+        applied to partitioned uploads, which report errors per partition
+        :param idempotent: [Optional] (True/False) Uploading twice is harmless, so dropped connections are retried as
+        well as deadlocks DEFAULT is True when if_exists is replace or mode is upsert. Dataset paths commit per batch
+        and are only retried when idempotent is True
+        :param mode: [Optional] (insert/upsert) upsert bulk-loads rows into a session temp table and merges them into
+        the table (MERGE on mssql, INSERT ... ON CONFLICT on sqlite). Cursor upload_counts reports inserted, updated and
+        unchanged rows
+        :param keys: [Optional] (upsert only) Column name or list of column names that identify a row. On sqlite they
+        must be the primary key or a unique index
+        :return: Returns Cursor class if queue_cursor is set to False, otherwise a Future that resolves to the Cursor.
+        Partitioned uploads return a PartitionedUpload class (or a Future that resolves to it) instead
         """
 
+        from ..sql.upload import BulkUploader, PartitionedUpload, is_dataset_source
+
+        if method is not None and method not in BulkUploader.METHODS:
+            raise ValueError("'method' %r must be either (%s)" % (method, ', '.join(BulkUploader.METHODS)))
+        if (parallelism > 1 or atomic) and is_dataset_source(dataframe):
+            raise ValueError("'parallelism' and 'atomic' require a pandas DataFrame, not a dataset path")
+        if mode not in ('insert', 'upsert'):
+            raise ValueError("'mode' %r must be either (insert, upsert)" % mode)
+        if mode == 'upsert' and not keys:
+            raise ValueError("'keys' must be provided for mode 'upsert'")
+        if mode == 'upsert' and (if_exists == 'replace' or parallelism > 1 or atomic):
+            raise ValueError("mode 'upsert' cannot be combined with if_exists replace, 'parallelism' or 'atomic'")
+
+        self.invalidate_cache(table_name)
+
         if self.engine_type == 'alchemy':
-            if new_engine or queue_cursor:
-                engine, spid = self.connect()
-                keep_engine_alive = False
-            else:
-                engine, spid = self.engine_spid
-                keep_engine_alive = True
+            params = dict(dataframe=dataframe, table_name=table_name, table_schema=table_schema,
+                          if_exists=if_exists, index=index, index_label=index_label, method=method,
+                          chunksize=chunksize, stage_dir=stage_dir)
 
-            if new_engine:
-                self.__sql_upload(engine, spid, keep_engine_alive, dataframe, table_name, table_schema, if_exists,
-                                  index, index_label, queue_cursor)
-            else:
-                with self.__engine_lock:
-                    self.__sql_upload(engine, spid, keep_engine_alive, dataframe, table_name, table_schema, if_exists,
-                                      index, index_label, queue_cursor)
+            if parallelism > 1 or atomic:
+                upload = PartitionedUpload(self, parallelism, atomic=atomic, **params)
+                future = upload.start()
 
-    def __sql_upload(self, engine, spid, keep_engine_alive, dataframe, table_name, table_schema=None,
-                     if_exists='append', index=True, index_label='ID', queue_cursor=False):
+                if queue_cursor:
+                    return future
+                else:
+                    return future.result()
+
+            if mode == 'upsert':
+                params.update(mode=mode, keys=keys)
+
+            retry = self.__retry_policy if retry is None else retry
+
+            if idempotent is None:
+                idempotent = if_exists == 'replace' or mode == 'upsert'
+
+            if retry and (idempotent or not is_dataset_source(dataframe)):
+                if queue_cursor:
+                    return self.__run_retries(retry, lambda chain: self.__run_upload(new_engine, queue_cursor, params,
+                                                                                     chain), idempotent)
+                else:
+                    return retry.run(lambda: self.__run_upload(new_engine, queue_cursor, params),
+                                     idempotent=idempotent)
+
+            return self.__run_upload(new_engine, queue_cursor, params)
+
+    def __run_upload(self, new_engine, queue_cursor, params, chain=None):
+        start = monotonic()
+
+        try:
+            engine, spid, keep_engine_alive = self.__acquire_engine(new_engine, queue_cursor)
+        except ValueError as e:
+            if queue_cursor:
+                return SQLExecutor.rejected(e)
+
+            raise
+
+        connect_time = monotonic() - start
+
+        if new_engine:
+            cursor = self.__sql_upload(engine, spid, keep_engine_alive, params, queue_cursor, connect_time, chain)
+        else:
+            with self.__engine_lock:
+                cursor = self.__sql_upload(engine, spid, keep_engine_alive, params, queue_cursor, connect_time,
+                                           chain)
+
+        return self.__check_main_engine(engine, keep_engine_alive, cursor)
+
+    def __check_main_engine(self, engine, keep_engine_alive, cursor):
+        # A failed statement on the main engine makes the next engine_spid ping it instead of trusting the cache
+        if keep_engine_alive and (cursor is None or cursor.errors):
+            self.__validator.invalidate(engine)
+
+        return cursor
+
+    def __sql_upload(self, engine, spid, keep_engine_alive, params, queue_cursor=False, connect_time=0.0, chain=None):
         from ..sql.cursor import EngineCursor
 
         if queue_cursor:
-            params = dict(dataframe=dataframe, table_name=table_name, table_schema=table_schema,
-                          if_exists=if_exists, index=index, index_label=index_label)
             cursor = EngineCursor(alch_engine=engine, spid=spid, engine_class=self, action='upload_df',
-                                  action_params=params, keep_engine_alive=keep_engine_alive)
+                                  action_params=params, keep_engine_alive=keep_engine_alive,
+                                  engine_pool=self.__cursor_pool(keep_engine_alive), connect_time=connect_time,
+                                  query_stats=self.__query_stats)
 
-            try:
-                self.__cursors.put(cursor, block=False)
-                cursor.start()
-            except:
-                cursor.close()
+            return self.__submit_cursor(cursor, chain)
         else:
-            cursor = EngineCursor(alch_engine=engine, spid=spid, keep_engine_alive=keep_engine_alive)
+            cursor = EngineCursor(alch_engine=engine, spid=spid, keep_engine_alive=keep_engine_alive,
+                                  engine_pool=self.__cursor_pool(keep_engine_alive), connect_time=connect_time,
+                                  query_stats=self.__query_stats)
 
             try:
-                cursor.start()
-                cursor.upload_df(dataframe, table_name, table_schema, if_exists, index, index_label)
-                cursor.join()
+                cursor.upload_df(**params)
             except:
                 cursor.close()
                 log.debug(format_exc())
             else:
                 return cursor
 
-    def sql_tables(self, queue_cursor=False, new_engine=False):
+    def sql_tables(self, queue_cursor=False, new_engine=False, cache=False, cache_ttl=None):
         """
         Retreive full table list from the SQL connection
 
         :param queue_cursor: (True/False) Add to multi-thread queue
         :param new_engine: [Optional] (True/False) creates new engine for threading
-        :return: Returns Cursor class if queue_cursor is set to False
+        :param cache: [Optional] (True/False) Serve the table list from result_cache when it was retrieved before
+        :param cache_ttl: [Optional] Seconds the cached table list is served for DEFAULT is the result_cache ttl
+        :return: Returns Cursor class if queue_cursor is set to False, otherwise a Future that resolves to the Cursor
         """
 
-        if new_engine or queue_cursor:
-            engine, spid = self.connect()
-            keep_engine_alive = False
-        else:
-            engine, spid = self.engine_spid
-            keep_engine_alive = True
+        cache_key = None
+
+        if cache:
+            cache_key = self.result_cache.make_key(self.__sql_config, 'sql_tables()')
+            results = self.__result_cache.get(cache_key)
+
+            if results is not None:
+                cursor = CachedCursor(results)
+                return cursor.as_future() if queue_cursor else cursor
+
+        start = monotonic()
+
+        try:
+            engine, spid, keep_engine_alive = self.__acquire_engine(new_engine, queue_cursor)
+        except ValueError as e:
+            if queue_cursor:
+                return SQLExecutor.rejected(e)
+
+            raise
+
+        connect_time = monotonic() - start
 
         if new_engine:
-            self.__sql_tables(engine, spid, keep_engine_alive, queue_cursor)
+            cursor = self.__sql_tables(engine, spid, keep_engine_alive, queue_cursor, connect_time)
         else:
             with self.__engine_lock:
-                self.__sql_tables(engine, spid, keep_engine_alive, queue_cursor)
+                cursor = self.__sql_tables(engine, spid, keep_engine_alive, queue_cursor, connect_time)
+
+        if cache_key is not None:
+            self.__cache_results(cursor, cache_key, None, cache_ttl)
+
+        return cursor
 
-    def __sql_tables(self, engine, spid, keep_engine_alive, queue_cursor=False):
+    def __sql_tables(self, engine, spid, keep_engine_alive, queue_cursor=False, connect_time=0.0):
         from ..sql.cursor import SQLCursor
 
-        cursor = SQLCursor(engine_type=self.engine_type, engine=engine, spid=spid, keep_engine_alive=keep_engine_alive)
+        if queue_cursor:
+            cursor = SQLCursor(engine_type=self.engine_type, engine=engine, spid=spid, engine_class=self,
+                               action='tables', keep_engine_alive=keep_engine_alive,
+                               engine_pool=self.__cursor_pool(keep_engine_alive), connect_time=connect_time,
+                               query_stats=self.__query_stats)
 
-        try:
-            if queue_cursor:
-                cursor.start()
-                cursor.engine_class = self
-                self.__cursors.put(cursor, block=False)
+            return self.__submit_cursor(cursor)
+        else:
+            cursor = SQLCursor(engine_type=self.engine_type, engine=engine, spid=spid,
+                               keep_engine_alive=keep_engine_alive,
+                               engine_pool=self.__cursor_pool(keep_engine_alive), connect_time=connect_time,
+                               query_stats=self.__query_stats)
+
+            try:
                 cursor.tables()
+            except:
+                cursor.close()
+                log.debug(format_exc())
             else:
-                cursor.start()
-                cursor.tables()
-                cursor.join()
-        except:
+                return cursor
+
+    def __acquire_engine(self, new_engine, queue_cursor):
+        if new_engine or queue_cursor:
+            if queue_cursor and not self.__executor.block:
+                engine, spid = self.__conn_pool.checkout(timeout=0)
+            else:
+                engine, spid = self.__conn_pool.checkout()
+
+            return [engine, spid, False]
+        else:
+            engine, spid = self.engine_spid
+            return [engine, spid, True]
+
+    def __submit_cursor(self, cursor, chain=None):
+        if chain is None:
+            try:
+                self.__cursors.put(cursor, block=False)
+            except Full:
+                cursor.close()
+                return SQLExecutor.rejected(ValueError("Cursor queue is full. Cursor %s was rejected" %
+                                                       cursor.cursor_id))
+        else:
+            # Retry attempts are queued through their chain, their results are held until the last attempt is known
+            with self.__cursors_cond:
+                chain.cursor = cursor
+                chain.attempts.append(cursor)
+                self.__attempts[id(cursor)] = chain
+
+        future = self.__executor.submit(self.__run_cursor, cursor)
+
+        if future.done() and future.exception() is not None:
             cursor.close()
-            log.debug(format_exc())
         else:
-            if not queue_cursor and cursor:
-                return cursor
+            future.add_done_callback(lambda f: f.cancelled() and cursor.close())
+
+        return future
+
+    def __run_retries(self, retry, attempt_fn, idempotent):
+        # The chain holds the statement's place in the cursor queue until its last attempt finished
+        chain = RetryingCursor()
+
+        try:
+            self.__cursors.put(chain, block=False)
+        except Full:
+            return SQLExecutor.rejected(ValueError("Cursor queue is full. Cursor %s was rejected" % chain.cursor_id))
 
-    def wait_for_cursors(self, timeout=0):
+        def attempt():
+            if chain.closed:
+                return SQLExecutor.rejected(ValueError("Cursor %s was closed before it was retried" % chain.cursor_id))
+
+            return attempt_fn(chain)
+
+        chain.future = retry.run_future(attempt, idempotent=idempotent)
+        chain.future.add_done_callback(lambda f: self.__finish_retries(chain))
+        return chain.future
+
+    def __finish_retries(self, chain):
+        final = chain.result()
+
+        with self.__cursors_cond:
+            for cursor in chain.attempts:
+                self.__attempts.pop(id(cursor), None)
+
+            if final is not None and any(cursor is final for cursor in chain.held):
+                self.__cursor_results.append(final)
+
+            if chain in self.__cursors.queue:
+                self.__cursors.queue.remove(chain)
+
+            self.__cursors_cond.notify_all()
+
+    @staticmethod
+    def __run_cursor(cursor):
+        try:
+            cursor.run()
+        except:
+            cursor.close()
+            raise
+
+        return cursor
+
+    def wait_for_cursors(self, timeout=0, return_when=ALL_COMPLETED):
         """
-        Waits for all cursors to be completed and returns result sets
+        Waits for cursors to be completed and returns result sets. Waiters are woken the moment a cursor completes
 
         :param timeout: [Optional] Seconds to wait before timing out (0 is infinity)
+        :param return_when: [Optional] (ALL_COMPLETED/FIRST_COMPLETED) Wait for every queued cursor or return as soon
+        as any cursor that was queued at the time of the call completes
         :return: Cursor Result listset
         """
 
-        if self.__cursors.qsize() > 0:
-            if timeout < 0:
-                raise ValueError("'timeout' must be a non-negative number")
+        if timeout < 0:
+            raise ValueError("'timeout' must be a non-negative number")
+        if return_when not in (FIRST_COMPLETED, ALL_COMPLETED):
+            raise ValueError("'return_when' %r is not FIRST_COMPLETED or ALL_COMPLETED" % return_when)
 
-            with self.__engine_lock:
-                curr_time = datetime.now()
-                end_time = datetime.now() + timedelta(seconds=timeout)
+        end_time = monotonic() + timeout if timeout else None
+
+        with self.__cursors_cond:
+            pending = list(self.__cursors.queue)
+
+            if return_when == FIRST_COMPLETED:
+                def is_complete():
+                    return not pending or any(c not in self.__cursors.queue for c in pending)
+            else:
+                def is_complete():
+                    return self.__cursors.qsize() == 0
+
+            while not is_complete():
+                remaining = None if end_time is None else end_time - monotonic()
+
+                if remaining is not None and remaining <= 0:
+                    break
+
+                self.__cursors_cond.wait(remaining)
+
+            completed = is_complete()
+
+        if completed:
+            with self.__cursors_cond:
+                self.__delivered = set(id(c) for c in self.__cursor_results)
 
-                try:
-                    while (curr_time < end_time or timeout == 0) and len(self.cursors) > 0:
-                        curr_time = datetime.now()
-                        sleep(1)
-
-                    if len(self.cursors) > 0:
-                        raise ValueError("Not all cursors are complete. Operation timed out")
-                    else:
-                        return self.__cursor_results
-                except:
-                    self.__release_coms()
-        else:
             return self.__cursor_results
+        else:
+            log.debug('SQL Connection (%s): Not all cursors are complete. Operation timed out', self.engine_id)
+            self.__release_coms()
+
+    def as_completed(self, timeout=0):
+        """
+        Iterator that yields queued SQLCursor or EngineCursor instance classes as they complete, so results can be
+        processed while the other cursors are still running. Cursors that completed since the last as_completed() or
+        wait_for_cursors() call are yielded first, like concurrent.futures.as_completed() yields futures that are
+        already done. Cursors are only yielded once
+
+        :param timeout: [Optional] Seconds to wait for all cursors before timing out (0 is infinity)
+        :return: Iterator of completed SQLCursor or EngineCursor instance classes
+        """
+
+        if timeout < 0:
+            raise ValueError("'timeout' must be a non-negative number")
+
+        end_time = monotonic() + timeout if timeout else None
+
+        with self.__cursors_cond:
+            pending = list(self.__cursors.queue)
+            # Only cursors still in cursor_results are remembered, so their ids cannot be re-used
+            live = set(id(c) for c in self.__cursor_results)
+            self.__delivered &= live
+            finished = [c for c in self.__cursor_results if id(c) not in self.__delivered and c not in pending]
+            self.__delivered |= set(id(c) for c in finished)
+
+        for cursor in finished:
+            yield cursor
+
+        while pending:
+            with self.__cursors_cond:
+                while True:
+                    done = [c for c in pending if c not in self.__cursors.queue]
+
+                    if done:
+                        break
+
+                    remaining = None if end_time is None else end_time - monotonic()
+
+                    if remaining is not None and remaining <= 0:
+                        raise ValueError("%s cursors are not complete. Operation timed out" % len(pending))
+
+                    self.__cursors_cond.wait(remaining)
+
+            for cursor in done:
+                pending.remove(cursor)
+
+                if isinstance(cursor, RetryingCursor):
+                    cursor = cursor.result()
+
+                    if cursor is None:
+                        continue
+
+                with self.__cursors_cond:
+                    self.__delivered.add(id(cursor))
+
+                yield cursor
 
     def close_connections(self, destroy_self=False, enable_log=True):
         """
@@ -454,17 +1094,36 @@ class SQLEngineClass(BaseSQLEngineClass, PickleMixIn):
 
         self.__release_coms(enable_log=enable_log, kill_main_engine=True)
 
+        if destroy_self:
+            self.__executor.shutdown(wait=False)
+
         if destroy_self and self.__engine_sql_class:
             self.__engine_sql_class.remove_engine_from_pool(self)
 
+    def dispose_engine(self):
+        """
+        Closes all cursors and connections of this class and disposes the shared SQLAlchemy engine of its SQLConfig,
+        closing every pooled connection that other SQLEngineClass instances of the same SQLConfig hold
+        """
+
+        self.__release_coms(kill_main_engine=True)
+        SQLEngineRegistry.dispose(self.__sql_config)
+
     def add_cursor_result(self, cursor_result):
         """
-         Adds SQLCursor or EngineCursor instance class results to list
+         Adds SQLCursor or EngineCursor instance class results to list. Results of retry attempts are held until the
+        last attempt of their statement is known
 
         :param cursor_result: SQLCursor or EngineCursor instance class
         """
 
-        self.__cursor_results.append(cursor_result)
+        with self.__cursors_cond:
+            chain = self.__attempts.get(id(cursor_result))
+
+            if chain is not None:
+                chain.held.append(cursor_result)
+            else:
+                self.__cursor_results.append(cursor_result)
 
     def rem_cursor(self, cursor):
         """
@@ -472,39 +1131,45 @@ class SQLEngineClass(BaseSQLEngineClass, PickleMixIn):
         :param cursor: SQLCursor or EngineCursor instance class
         """
 
-        if len(self.__cursors.queue) > 0:
-            self.__cursors.queue.remove(cursor)
-
-    def __validate_engine(self, engine):
-        spid = None
-
-        if engine is not None:
-            if self.engine_type == 'alchemy':
-                raw_engine = engine.raw_connection()
-            else:
-                raw_engine = engine
-
-            cursor = raw_engine.cursor()
+        with self.__cursors_cond:
+            if cursor in self.__cursors.queue:
+                self.__cursors.queue.remove(cursor)
 
-            try:
-                dataset = cursor.execute("SELECT @@SPID")
-                spid = [tuple(t) for t in dataset.fetchall()][0]
-            except:
-                engine = None
-                pass
-            finally:
-                try:
-                    cursor.close()
-                except:
-                    pass
+            self.__cursors_cond.notify_all()
 
-        return [engine, spid]
+    def __validate_engine(self, engine):
+        # New connections and pool checkouts that passed the pool's own interval always ping
+        return self.__validator.validate(engine, force=True)
+
+    def __create_conn_pool(self):
+        return SQLConnectionPool(connect=self.connect, validate=self.__validate_engine, close=self.__close_engine,
+                                 max_size=self.__conn_max_pool_size, idle_timeout=self.__conn_idle_timeout,
+                                 max_age=self.__conn_max_age, validate_interval=self.__validate_interval,
+                                 pool_id=self.engine_id)
+
+    def __close_engine(self, engine):
+        # Prepared cursors hold the connection open and must be closed first
+        if self.__statement_cache is not None and engine is not None:
+            self.__statement_cache.discard(engine)
+
+        self.__validator.forget(engine)
+        close_engine(engine)
+
+    def __cursor_pool(self, keep_engine_alive):
+        if keep_engine_alive:
+            return None
+        else:
+            return self.__conn_pool
 
     def __release_coms(self, enable_log=True, kill_main_engine=False):
-        if self.__cursors.qsize() > 0:
+        if kill_main_engine:
+            self.__conn_pool.close_all()
+
+        # The main engine is closed even when no cursors are left so its prepared statements are purged with it
+        if kill_main_engine or self.__cursors.qsize() > 0:
             with self.__engine_lock:
                 if kill_main_engine:
-                    close_engine(self.__main_engine)
+                    self.__close_engine(self.__main_engine)
 
                 self.__main_engine = None
                 self.__main_spid = None
@@ -517,6 +1182,7 @@ class SQLEngineClass(BaseSQLEngineClass, PickleMixIn):
 
     def __del__(self):
         self.__release_coms(kill_main_engine=True)
+        self.__executor.shutdown(wait=False)
 
     def __getstate__(self):
         # The pool and lock cannot be pickled
@@ -529,13 +1195,23 @@ class SQLEngineClass(BaseSQLEngineClass, PickleMixIn):
         if state and '__engine_lock' in state.keys():
             del state['__engine_lock']
 
+        if state and '_SQLEngineClass__conn_pool' in state.keys():
+            del state['_SQLEngineClass__conn_pool']
+
+        if state and '_SQLEngineClass__cursors_cond' in state.keys():
+            del state['_SQLEngineClass__cursors_cond']
+
+        # Retry chains hold Futures and end with this process
+        state['_SQLEngineClass__attempts'] = dict()
         return state
 
     def __setstate__(self, state):
         # Restore the pool and lock
         self.__dict__.update(state)
         self.__cursors = LifoQueue(maxsize=self.__conn_max_pool_size)
+        self.__conn_pool = self.__create_conn_pool()
         self.__engine_lock = Lock()
+        self.__cursors_cond = Condition(Lock())
         self.connect()
 
     def __eq__(self, other):
@@ -555,7 +1231,111 @@ class SQLEngineClass(BaseSQLEngineClass, PickleMixIn):
         return str(self.engine_id)
 
 
+def raw_connection(engine):
+    """
+    :param engine: SQLAlchemy Connection or Engine, or PYODBC Connection
+    :return: [DB-API connection, (True/False) if the caller owns the DB-API connection and must close it]
+    """
+
+    if isinstance(engine, Connection):
+        return [engine.connection, False]
+    elif isinstance(engine, Engine):
+        return [engine.raw_connection(), True]
+    else:
+        return [engine, False]
+
+
+def dbapi_connection(engine):
+    """
+    :param engine: SQLAlchemy Connection, pooled DB-API connection proxy or PYODBC Connection
+    :return: Driver connection underneath any SQLAlchemy wrappers
+    """
+
+    if isinstance(engine, Connection):
+        engine = engine.connection
+
+    for attr in ('dbapi_connection', 'connection'):
+        inner = getattr(engine, attr, None)
+
+        if inner is not None:
+            return inner
+
+    return engine
+
+
+def invalidate_engine(engine):
+    """
+    Marks a connection that failed with a dropped link as dead so SQLAlchemy's pool does not hand it out again
+
+    :param engine: SQLAlchemy Connection or PYODBC Connection
+    """
+
+    if engine is not None and hasattr(engine, 'invalidate'):
+        try:
+            engine.invalidate()
+        except:
+            pass
+
+
+def set_query_timeout(engine, seconds):
+    """
+    Sets the query timeout of a connection. pyodbc applies it (SQL_ATTR_QUERY_TIMEOUT) to cursors created afterwards
+
+    :param engine: SQLAlchemy Connection or PYODBC Connection
+    :param seconds: Seconds a statement may run (0 is infinity)
+    :return: (True/False) if the driver supports a connection query timeout
+    """
+
+    conn = dbapi_connection(engine)
+
+    if conn is None or not hasattr(conn, 'timeout'):
+        return False
+
+    try:
+        conn.timeout = int(seconds or 0)
+        return True
+    except Exception as e:
+        log.debug('Unable to set query timeout. %s', e)
+        return False
+
+
+def cancel_cursor(cursor, engine=None):
+    """
+    Cancels the statement running on a cursor from another thread. Drivers without cursor cancel (sqlite3) have their
+    connection interrupted instead
+
+    :param cursor: DB-API cursor or SQLCursor
+    :param engine: [Optional] DB-API connection of cursor
+    :return: (True/False) if a cancel was sent
+    """
+
+    if cursor is not None and hasattr(cursor, 'cancel'):
+        try:
+            cursor.cancel()
+            return True
+        except:
+            pass
+
+    if engine is not None and hasattr(engine, 'interrupt'):
+        try:
+            engine.interrupt()
+            return True
+        except:
+            pass
+
+    return False
+
+
 def close_engine(engine):
+    if engine and isinstance(engine, Connection):
+        # Returns the DB-API connection to the shared SQLAlchemy engine pool
+        try:
+            engine.close()
+        except:
+            pass
+
+        return
+
     if engine and hasattr(engine, 'cancel'):
         try:
             engine.cancel()
@@ -0,0 +1,146 @@
+from __future__ import unicode_literals
+
+from concurrent.futures import Executor, ThreadPoolExecutor, Future
+from threading import BoundedSemaphore, Lock
+
+import logging
+
+log = logging.getLogger(__name__)
+
+
+class SQLExecutor(object):
+    """
+    Persistent worker pool that runs queued SQLCursor and EngineCursor actions. Work is bounded to max_workers running
+    plus max_queue waiting. When the executor is saturated submissions either block until a slot frees up or are
+    handed back as a rejected Future, work is never silently dropped
+    """
+
+    DEFAULT_WORKERS = 10
+
+    def __init__(self, max_workers=DEFAULT_WORKERS, max_queue=None, block=True, executor=None, executor_id=None):
+        """
+        :param max_workers: [Optional] Number of worker threads that run cursors
+        :param max_queue: [Optional] Number of submissions that may wait for a worker (DEFAULT is max_workers)
+        :param block: [Optional] (True/False) Block when saturated or return a rejected Future
+        :param executor: [Optional] concurrent.futures Executor to run work on instead of a private ThreadPoolExecutor
+        :param executor_id: [Optional] Identifier used for worker thread names and logging
+        """
+
+        if max_workers < 1:
+            raise ValueError("'max_workers' %r must be a positive number" % max_workers)
+        if max_queue is None:
+            max_queue = max_workers
+        if max_queue < 0:
+            raise ValueError("'max_queue' %r must be a non-negative number" % max_queue)
+        if executor is not None and not isinstance(executor, Executor):
+            raise ValueError("'executor' %r is not an instance of concurrent.futures Executor" % executor)
+
+        self.__max_workers = max_workers
+        self.__max_queue = max_queue
+        self.__block = block
+        self.__executor_id = executor_id
+        self.__owns_executor = executor is None
+        self.__executor = executor
+        self.__slots = BoundedSemaphore(max_workers + max_queue)
+        self.__executor_lock = Lock()
+
+    @property
+    def max_workers(self):
+        """
+        :return: Number of worker threads that run cursors
+        """
+
+        return self.__max_workers
+
+    @property
+    def block(self):
+        """
+        :return: (True/False) if submissions block when the executor is saturated
+        """
+
+        return self.__block
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Submit work to the worker pool
+
+        :param fn: Function to run on a worker thread
+        :param block: [Optional] (True/False) Override executor blocking policy for this submission
+        :param timeout: [Optional] Seconds to wait for a free slot when blocking (None is infinity)
+        :return: concurrent.futures Future holding the result or error of fn
+        """
+
+        block = kwargs.pop('block', None)
+        timeout = kwargs.pop('timeout', None)
+
+        if block is None:
+            block = self.__block
+
+        if not self.__slots.acquire(block, timeout if block else None):
+            log.debug('SQL Executor %s: Saturated. Rejected submission', self.__executor_id)
+            return self.rejected(ValueError("SQL executor is saturated. Submission was rejected"))
+
+        try:
+            future = self.__get_executor().submit(fn, *args, **kwargs)
+        except:
+            self.__slots.release()
+            raise
+
+        future.add_done_callback(self.__release_slot)
+        return future
+
+    @staticmethod
+    def rejected(error):
+        """
+        :param error: Exception that is raised by Future.result()
+        :return: Completed Future that carries error
+        """
+
+        future = Future()
+        future.set_exception(error)
+        return future
+
+    def shutdown(self, wait=True):
+        """
+        Stops worker threads once submitted work is done
+
+        :param wait: [Optional] (True/False) Wait for submitted work to finish
+        """
+
+        with self.__executor_lock:
+            executor = self.__executor
+
+            if self.__owns_executor:
+                self.__executor = None
+
+        if self.__owns_executor and executor is not None:
+            executor.shutdown(wait=wait)
+
+    def __get_executor(self):
+        with self.__executor_lock:
+            if self.__executor is None:
+                self.__executor = ThreadPoolExecutor(max_workers=self.__max_workers,
+                                                     thread_name_prefix='SQLExecutor-%s' % self.__executor_id)
+
+            return self.__executor
+
+    def __release_slot(self, future):
+        self.__slots.release()
+
+    def __getstate__(self):
+        # The worker pool and semaphore cannot be pickled
+        state = self.__dict__.copy()
+        state['_SQLExecutor__executor'] = None
+        state['_SQLExecutor__owns_executor'] = True
+        del state['_SQLExecutor__slots']
+        del state['_SQLExecutor__executor_lock']
+        return state
+
+    def __setstate__(self, state):
+        # Restore the semaphore and lock
+        self.__dict__.update(state)
+        self.__slots = BoundedSemaphore(self.__max_workers + self.__max_queue)
+        self.__executor_lock = Lock()
+
+    def __repr__(self):
+        return '%s(%s, workers=%s)' % (self.__class__.__name__, self.__executor_id, self.__max_workers)
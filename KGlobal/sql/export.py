@@ -0,0 +1,259 @@
+from __future__ import unicode_literals
+
+from csv import writer as csv_writer, QUOTE_ALL
+from datetime import datetime, date
+from decimal import Decimal
+from time import monotonic
+
+import io
+import os
+import gzip
+import logging
+
+log = logging.getLogger(__name__)
+
+
+class ResultExporter(object):
+    """
+    Streams cursor result sets straight to a file. Rows are pulled with fetchmany() and written as they arrive so
+    memory stays bounded by fetch_size whatever the size of the result set. Formats are
+    -   csv - csv module writer over a buffered file
+    -   gzip - csv compressed with gzip
+    -   zstd - csv compressed with zstandard (requires the zstandard package)
+    -   parquet - one Parquet row group per fetched batch (requires pyarrow). Result sets after the first are written
+        to their own file (name_1.parquet, name_2.parquet, ...) since a Parquet file holds a single schema. Column
+        types come from cursor.description, or the first batch for drivers that do not report them
+    """
+
+    FORMATS = ('csv', 'gzip', 'zstd', 'parquet')
+    EXTENSIONS = (('.gz', 'gzip'), ('.gzip', 'gzip'), ('.zst', 'zstd'), ('.zstd', 'zstd'), ('.parquet', 'parquet'),
+                  ('.pq', 'parquet'))
+    DEFAULT_FETCH_SIZE = 10000
+    WRITE_BUFFER = 1024 * 1024
+
+    def __init__(self, path, export_format=None, delimiter=',', quotechar='"', quoting=QUOTE_ALL,
+                 fetch_size=DEFAULT_FETCH_SIZE):
+        """
+        :param path: File path results are written to. csv formats append when the file exists, parquet replaces it
+        :param export_format: [Optional] (csv, gzip, zstd, parquet) DEFAULT is inferred from the path extension
+        :param delimiter: [Optional] (csv only) Data seperator to delimit columns
+        :param quotechar: [Optional] (csv only) Quote Character to wrap values with
+        :param quoting: [Optional] (csv only) csv quote mode
+        :param fetch_size: [Optional] Number of rows to pull per fetchmany() call
+        """
+
+        if export_format is None:
+            export_format = self.infer_format(path)
+        if export_format not in self.FORMATS:
+            raise ValueError("'export_format' %r must be either (%s)" % (export_format, ', '.join(self.FORMATS)))
+        if not os.path.isdir(os.path.dirname(os.path.abspath(path))):
+            raise ValueError("'path' %r is not a valid directory path" % os.path.dirname(path))
+        if fetch_size < 1:
+            raise ValueError("'fetch_size' %r value is zero or negative" % fetch_size)
+
+        self.__path = path
+        self.__export_format = export_format
+        self.__delimiter = delimiter
+        self.__quotechar = quotechar
+        self.__quoting = quoting
+        self.__fetch_size = fetch_size
+        self.__stream = None
+        self.__writer = None
+        self.__paths = list()
+        self.__start_size = 0
+        self.__rows = 0
+        self.__bytes_written = 0
+        self.__elapsed = 0.0
+
+    @classmethod
+    def infer_format(cls, path):
+        """
+        :param path: File path
+        :return: Export format of the path extension, csv when the extension is not recognised
+        """
+
+        lower_path = path.lower()
+        return next((export_format for ext, export_format in cls.EXTENSIONS if lower_path.endswith(ext)), 'csv')
+
+    @property
+    def export_format(self):
+        """
+        :return: Format results are written in
+        """
+
+        return self.__export_format
+
+    @property
+    def stats(self):
+        """
+        :return: Dictionary of path, paths, format, rows, bytes_written, elapsed seconds and rows_per_second
+        """
+
+        return dict(path=self.__path, paths=list(self.__paths), format=self.__export_format, rows=self.__rows,
+                    bytes_written=self.__bytes_written, elapsed=self.__elapsed,
+                    rows_per_second=self.__rows / self.__elapsed if self.__elapsed else 0.0)
+
+    def write_dataset(self, dataset):
+        """
+        Writes the current result set of a cursor
+
+        :param dataset: DB-API cursor that has an open result set
+        :return: Number of rows written
+        """
+
+        if not dataset.description:
+            return 0
+
+        start = monotonic()
+        rows_written = 0
+
+        try:
+            if self.__export_format == 'parquet':
+                write_rows = self.__parquet_writer(dataset.description)
+            else:
+                write_rows = self.__csv_writer([column[0] for column in dataset.description])
+
+            while True:
+                rows = dataset.fetchmany(self.__fetch_size)
+
+                if not rows:
+                    break
+
+                write_rows(rows)
+                rows_written += len(rows)
+                self.__rows += len(rows)
+
+            if not rows_written and self.__export_format == 'parquet':
+                # An empty result set still gets a file with its schema
+                write_rows(list())
+        finally:
+            self.__elapsed += monotonic() - start
+
+        log.debug('Exported %s rows to %s', rows_written, self.__path)
+        return rows_written
+
+    def close(self):
+        """
+        Flushes and closes the file and records the bytes written
+        """
+
+        if self.__writer is not None and self.__export_format == 'parquet':
+            self.__writer.close()
+        elif self.__stream is not None:
+            self.__stream.close()
+
+        self.__writer = None
+        self.__stream = None
+        bytes_written = -self.__start_size
+
+        for path in self.__paths:
+            try:
+                bytes_written += os.path.getsize(path)
+            except OSError:
+                pass
+
+        self.__bytes_written = max(bytes_written, 0)
+
+    def __csv_writer(self, columns):
+        if self.__stream is None:
+            self.__start_size = os.path.getsize(self.__path) if os.path.exists(self.__path) else 0
+            self.__stream = self.__open_text()
+            self.__paths.append(self.__path)
+            self.__writer = csv_writer(self.__stream, delimiter=self.__delimiter, quotechar=self.__quotechar,
+                                       quoting=self.__quoting, lineterminator=os.linesep)
+
+        self.__writer.writerow(columns)
+        return self.__writer.writerows
+
+    def __open_text(self):
+        mode = 'ab' if os.path.exists(self.__path) else 'wb'
+
+        if self.__export_format == 'gzip':
+            stream = gzip.open(self.__path, mode)
+        elif self.__export_format == 'zstd':
+            try:
+                import zstandard
+            except ImportError:
+                raise ValueError("zstd export requires the zstandard package")
+
+            stream = zstandard.ZstdCompressor().stream_writer(open(self.__path, mode))
+        else:
+            stream = open(self.__path, mode, buffering=self.WRITE_BUFFER)
+
+        return io.TextIOWrapper(stream, encoding='utf-8', newline='')
+
+    def __parquet_writer(self, description):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ValueError("parquet export requires the pyarrow package")
+
+        names = [column[0] for column in description]
+        types = [self.__arrow_type(pa, column) for column in description]
+
+        if self.__writer is not None:
+            self.__writer.close()
+            self.__writer = None
+
+        if self.__paths:
+            root, ext = os.path.splitext(self.__path)
+            path = '%s_%s%s' % (root, len(self.__paths), ext)
+        else:
+            path = self.__path
+
+        self.__paths.append(path)
+
+        def write_rows(rows):
+            columns = list(zip(*rows)) or [list() for _ in names]
+            table = pa.Table.from_arrays([pa.array(list(values), type=arrow_type)
+                                          for values, arrow_type in zip(columns, types)], names=names)
+
+            if self.__writer is None:
+                # An untyped column that is NULL throughout the first batch has nothing to infer from. It is written
+                # as text so values of later batches still fit the file's schema
+                schema = pa.schema([pa.field(field.name, pa.string()) if pa.types.is_null(field.type) else field
+                                    for field in table.schema])
+                self.__writer = pq.ParquetWriter(path, schema)
+
+            if table.schema != self.__writer.schema:
+                # Columns pyarrow inferred from the first batch
+                table = table.cast(self.__writer.schema)
+
+            self.__writer.write_table(table)
+
+        return write_rows
+
+    @staticmethod
+    def __arrow_type(pa, column):
+        # Arrow type of a cursor.description column. None lets pyarrow infer it from the first batch
+        type_code = column[1]
+
+        if type_code is bool:
+            return pa.bool_()
+        elif type_code is int:
+            return pa.int64()
+        elif type_code is float:
+            return pa.float64()
+        elif type_code is str:
+            return pa.string()
+        elif type_code in (bytes, bytearray):
+            return pa.binary()
+        elif type_code is datetime:
+            return pa.timestamp('us')
+        elif type_code is date:
+            return pa.date32()
+        elif type_code is Decimal and column[4] and column[4] <= 38:
+            return pa.decimal128(column[4], column[5] or 0)
+
+        return None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __repr__(self):
+        return '%s(%s, format=%s, rows=%s)' % (self.__class__.__name__, self.__path, self.__export_format,
+                                               self.__rows)
@@ -0,0 +1,637 @@
+from __future__ import unicode_literals
+
+from pandas import DataFrame, RangeIndex, Int64Dtype, BooleanDtype
+from pandas.arrays import IntegerArray, BooleanArray
+from datetime import datetime
+from threading import Lock
+from collections import OrderedDict
+from time import monotonic
+
+import numpy as np
+import logging
+
+log = logging.getLogger(__name__)
+
+
+class ColumnarMaterializer(object):
+    """
+    Builds a DataFrame from a DB-API cursor without materializing row tuples. Rows are pulled with fetchmany() in
+    batches, each batch is split into typed NumPy column arrays driven by cursor.description type codes and the
+    DataFrame is assembled once from the column arrays
+    """
+
+    DEFAULT_FETCH_SIZE = 10000
+    TYPE_DTYPES = {
+        int: np.int64,
+        float: np.float64,
+        bool: np.bool_,
+        datetime: 'datetime64[us]',
+    }
+    NULL_DTYPES = {
+        int: np.float64,
+        float: np.float64,
+        datetime: 'datetime64[us]',
+    }
+    BINARY_TYPES = (bytes, bytearray, memoryview)
+    DATETIME_MIN = np.datetime64('1677-09-22', 'us')
+    DATETIME_MAX = np.datetime64('2262-04-11', 'us')
+
+    def __init__(self, dataset, fetch_size=DEFAULT_FETCH_SIZE):
+        """
+        :param dataset: DB-API cursor that has an open result set
+        :param fetch_size: [Optional] Number of rows to pull per fetchmany() call
+        """
+
+        if fetch_size < 1:
+            raise ValueError("'fetch_size' %r value is zero or negative" % fetch_size)
+
+        self.__dataset = dataset
+        self.__fetch_size = fetch_size
+        self.__columns = [column[0] for column in dataset.description]
+        self.__type_codes = [column[1] for column in dataset.description]
+        self.__rows = 0
+        self.__fetch_time = 0.0
+        self.__build_time = 0.0
+
+    @property
+    def columns(self):
+        """
+        :return: List of column names in result set
+        """
+
+        return self.__columns
+
+    @property
+    def rows(self):
+        """
+        :return: Number of rows fetched so far
+        """
+
+        return self.__rows
+
+    @property
+    def fetch_time(self):
+        """
+        :return: Seconds spent in fetchmany() so far
+        """
+
+        return self.__fetch_time
+
+    @property
+    def build_time(self):
+        """
+        :return: Seconds spent building column arrays and DataFrames so far
+        """
+
+        return self.__build_time
+
+    def fetch_batches(self):
+        """
+        Iterator of fetchmany() row batches until the result set is exhausted
+
+        :return: Iterator of row lists
+        """
+
+        while True:
+            start = monotonic()
+            rows = self.__dataset.fetchmany(self.__fetch_size)
+            self.__fetch_time += monotonic() - start
+
+            if not rows:
+                break
+
+            self.__rows += len(rows)
+            yield rows
+
+    def build_columns(self, rows):
+        """
+        Splits a batch of rows into typed NumPy column arrays
+
+        :param rows: List of rows from fetchmany()
+        :return: List of NumPy arrays, one per column
+        """
+
+        start = monotonic()
+
+        try:
+            return [self.__column_array(values, type_code)
+                    for values, type_code in zip(zip(*rows), self.__type_codes)]
+        finally:
+            self.__build_time += monotonic() - start
+
+    def build_dataframe(self, rows, row_start=0):
+        """
+        Assembles a DataFrame from a single batch of rows
+
+        :param rows: List of rows from fetchmany()
+        :param row_start: [Optional] Row number of the first row in the batch, used as the start of the index
+        :return: pandas DataFrame
+        """
+
+        df = self.assemble([[array] for array in self.build_columns(rows)])
+        df.index = RangeIndex(row_start, row_start + len(rows))
+        return df
+
+    def to_dataframe(self):
+        """
+        Fetches the rest of the result set and assembles a DataFrame from typed column arrays
+
+        :return: pandas DataFrame
+        """
+
+        chunks = [list() for _ in self.__columns]
+
+        for rows in self.fetch_batches():
+            for chunk, array in zip(chunks, self.build_columns(rows)):
+                chunk.append(array)
+
+        return self.assemble(chunks)
+
+    def assemble(self, chunks):
+        """
+        :param chunks: Per column list of NumPy arrays
+        :return: pandas DataFrame built from concatenated column arrays
+        """
+
+        if not chunks or not chunks[0]:
+            return DataFrame(columns=self.__columns)
+
+        start = monotonic()
+
+        try:
+            return self.__assemble(chunks)
+        finally:
+            self.__build_time += monotonic() - start
+
+    def __assemble(self, chunks):
+        data = dict()
+
+        for i, chunk in enumerate(chunks):
+            data[i] = self.__finalize_array(chunk[0] if len(chunk) == 1 else np.concatenate(chunk))
+
+        df = DataFrame(data, copy=False)
+        df.columns = self.__columns
+
+        if any(self.__type_codes[i] not in self.TYPE_DTYPES for i in range(len(self.__columns))):
+            df = df.infer_objects()
+
+        return df
+
+    def __column_array(self, values, type_code):
+        dtype = self.TYPE_DTYPES.get(type_code)
+
+        if dtype is not None and any(v is None for v in values):
+            dtype = self.NULL_DTYPES.get(type_code)
+
+        if dtype is not None:
+            try:
+                return np.array(values, dtype=dtype)
+            except (TypeError, ValueError, OverflowError):
+                pass
+
+        array = np.empty(len(values), dtype=object)
+
+        if type_code in self.BINARY_TYPES:
+            for i, value in enumerate(values):
+                array[i] = value
+        else:
+            array[:] = values
+
+        return array
+
+    def __finalize_array(self, array):
+        # pandas stores datetimes at nanosecond resolution, dates outside of that range stay python datetimes
+        if array.dtype.kind == 'M':
+            valid = array[~np.isnat(array)]
+
+            if valid.size and (valid.min() < self.DATETIME_MIN or valid.max() > self.DATETIME_MAX):
+                return array.astype(object)
+
+            return array.astype('datetime64[ns]')
+
+        return array
+
+
+class DtypeCache(object):
+    """
+    Least recently used cache of the column dtypes a streamed query settled on, keyed by the query and its result set
+    description. ChunkBuilder starts later runs of the query from the cached dtypes instead of inferring them again
+    """
+
+    DEFAULT_MAX_ENTRIES = 256
+
+    __default = None
+    __default_lock = Lock()
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        """
+        :param max_entries: [Optional] Maximum result set schemas kept
+        """
+
+        if max_entries < 1:
+            raise ValueError("'max_entries' %r must be a positive number" % max_entries)
+
+        self.__max_entries = max_entries
+        self.__entries = OrderedDict()
+        self.__hits = 0
+        self.__misses = 0
+        self.__cache_lock = Lock()
+
+    @classmethod
+    def default(cls):
+        """
+        :return: Process-wide DtypeCache
+        """
+
+        if cls.__default is None:
+            with cls.__default_lock:
+                if cls.__default is None:
+                    cls.__default = cls()
+
+        return cls.__default
+
+    @property
+    def max_entries(self):
+        """
+        :return: Maximum result set schemas kept
+        """
+
+        return self.__max_entries
+
+    @property
+    def hits(self):
+        """
+        :return: Number of lookups that found cached dtypes
+        """
+
+        return self.__hits
+
+    @property
+    def misses(self):
+        """
+        :return: Number of lookups that had no cached dtypes
+        """
+
+        return self.__misses
+
+    def get(self, key):
+        """
+        :param key: Result set key
+        :return: List of NumPy dtypes, one per column, or None when the result set is not cached
+        """
+
+        with self.__cache_lock:
+            dtypes = self.__entries.get(key)
+
+            if dtypes is None:
+                self.__misses += 1
+                return None
+
+            self.__entries.move_to_end(key)
+            self.__hits += 1
+            return list(dtypes)
+
+    def put(self, key, dtypes):
+        """
+        :param key: Result set key
+        :param dtypes: List of NumPy dtypes, one per column
+        """
+
+        with self.__cache_lock:
+            self.__entries[key] = tuple(dtypes)
+            self.__entries.move_to_end(key)
+
+            while len(self.__entries) > self.__max_entries:
+                self.__entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Drops every cached result set schema
+        """
+
+        with self.__cache_lock:
+            self.__entries.clear()
+
+    def __getstate__(self):
+        # The lock cannot be pickled
+        state = self.__dict__.copy()
+        del state['_DtypeCache__cache_lock']
+        return state
+
+    def __setstate__(self, state):
+        # Restore the lock
+        self.__dict__.update(state)
+        self.__cache_lock = Lock()
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def __repr__(self):
+        return '%s(entries=%s, max_entries=%s)' % (self.__class__.__name__, len(self.__entries), self.__max_entries)
+
+
+class ChunkBuilder(object):
+    """
+    Builds the DataFrame chunks of a streamed result set from typed NumPy column buffers filled straight from
+    fetchmany() batches. Column dtypes are settled on the first batch from cursor.description type codes (or the
+    values when the driver reports no usable type) and are kept for the rest of the result set. Integer and bit
+    columns switch to the pandas nullable Int64 and boolean dtypes once a NULL shows up, so values stay exact and later
+    chunks keep the dtype. A column whose values stop fitting its dtype is promoted for the chunks that follow. With a
+    cache_key the settled dtypes are kept in a DtypeCache so later runs of the query skip inference
+    """
+
+    OBJECT_DTYPE = np.dtype(object)
+    NULLABLE_DTYPES = {
+        'i': Int64Dtype(),
+        'b': BooleanDtype(),
+    }
+    KIND_TYPES = {
+        'i': (int,),
+        'f': (float, int),
+        'b': (bool,),
+        'M': (datetime,),
+    }
+
+    def __init__(self, dataset, chunk_rows=ColumnarMaterializer.DEFAULT_FETCH_SIZE, cache_key=None,
+                 dtype_cache=None):
+        """
+        :param dataset: DB-API cursor that has an open result set
+        :param chunk_rows: [Optional] Number of rows to pull per fetchmany() call and the size of the column buffers
+        :param cache_key: [Optional] Key of the query (ie query string) whose dtypes are cached across runs
+        :param dtype_cache: [Optional] DtypeCache used with cache_key DEFAULT is the process-wide DtypeCache
+        """
+
+        if chunk_rows < 1:
+            raise ValueError("'chunk_rows' %r value is zero or negative" % chunk_rows)
+
+        self.__dataset = dataset
+        self.__chunk_rows = chunk_rows
+        self.__columns = [column[0] for column in dataset.description]
+        self.__type_codes = [column[1] for column in dataset.description]
+        self.__dtype_cache = None
+        self.__cache_key = None
+        self.__dtypes = None
+        self.__buffers = None
+        self.__rows = 0
+        self.__fetch_time = 0.0
+        self.__build_time = 0.0
+
+        if cache_key is not None:
+            try:
+                self.__cache_key = (cache_key, tuple((name, type_code) for name, type_code in
+                                                     zip(self.__columns, self.__type_codes)))
+                hash(self.__cache_key)
+            except TypeError:
+                self.__cache_key = None
+
+        if self.__cache_key is not None:
+            self.__dtype_cache = dtype_cache if dtype_cache is not None else DtypeCache.default()
+            self.__set_dtypes(self.__dtype_cache.get(self.__cache_key))
+
+    @property
+    def columns(self):
+        """
+        :return: List of column names in result set
+        """
+
+        return self.__columns
+
+    @property
+    def dtypes(self):
+        """
+        :return: List of NumPy or pandas nullable dtypes of the columns, or None before the first batch was built
+        """
+
+        return None if self.__dtypes is None else list(self.__dtypes)
+
+    @property
+    def rows(self):
+        """
+        :return: Number of rows fetched so far
+        """
+
+        return self.__rows
+
+    @property
+    def fetch_time(self):
+        """
+        :return: Seconds spent in fetchmany() so far
+        """
+
+        return self.__fetch_time
+
+    @property
+    def build_time(self):
+        """
+        :return: Seconds spent filling column buffers and building DataFrames so far
+        """
+
+        return self.__build_time
+
+    def fetch_batches(self):
+        """
+        Iterator of fetchmany() row batches until the result set is exhausted
+
+        :return: Iterator of row lists
+        """
+
+        while True:
+            start = monotonic()
+            rows = self.__dataset.fetchmany(self.__chunk_rows)
+            self.__fetch_time += monotonic() - start
+
+            if not rows:
+                break
+
+            self.__rows += len(rows)
+            yield rows
+
+    def build_dataframe(self, rows, row_start=0):
+        """
+        Fills the column buffers with a batch of rows and builds a DataFrame chunk on them. The filled buffers are
+        handed to the chunk and replaced, so chunks stay valid while later batches are built
+
+        :param rows: List of rows from fetchmany()
+        :param row_start: [Optional] Row number of the first row in the batch, used as the start of the index
+        :return: pandas DataFrame
+        """
+
+        start = monotonic()
+
+        try:
+            columns = list(zip(*rows))
+
+            if self.__dtypes is None:
+                self.__set_dtypes([self.__infer_dtype(values, i) for i, values in enumerate(columns)], store=True)
+
+            data = dict()
+
+            for i, values in enumerate(columns):
+                data[i] = self.__column_array(values, i)
+
+            if not data:
+                return DataFrame(columns=self.__columns)
+
+            df = DataFrame(data, copy=False)
+            df.columns = self.__columns
+            df.index = RangeIndex(row_start, row_start + len(rows))
+            return df
+        finally:
+            self.__build_time += monotonic() - start
+
+    def __infer_dtype(self, values, i):
+        type_code = self.__type_codes[i]
+
+        if type_code not in ColumnarMaterializer.TYPE_DTYPES:
+            # Drivers without usable type codes (ie sqlite3) are typed by the first value of the column
+            type_code = next((type(v) for v in values if v is not None), None)
+
+        if type_code not in ColumnarMaterializer.TYPE_DTYPES:
+            return self.OBJECT_DTYPE
+
+        dtype = np.dtype(ColumnarMaterializer.TYPE_DTYPES[type_code])
+
+        if dtype.kind in self.NULLABLE_DTYPES and any(v is None for v in values):
+            return self.NULLABLE_DTYPES[dtype.kind]
+
+        return dtype
+
+    def __set_dtypes(self, dtypes, store=False):
+        if dtypes is None or len(dtypes) != len(self.__columns):
+            return
+
+        self.__dtypes = list(dtypes)
+        self.__buffers = [self.__new_buffer(dtype, self.__chunk_rows) for dtype in self.__dtypes]
+
+        if store and self.__dtype_cache is not None:
+            self.__dtype_cache.put(self.__cache_key, self.__dtypes)
+
+    @staticmethod
+    def __new_buffer(dtype, size):
+        # Nullable dtypes are filled as their NumPy values with a separate NULL mask
+        return np.empty(size, dtype=getattr(dtype, 'numpy_dtype', dtype))
+
+    def __promote(self, i, dtype):
+        log.debug('Column %r promoted from %s to %s', self.__columns[i], self.__dtypes[i], dtype)
+        self.__dtypes[i] = dtype
+        self.__buffers[i] = self.__new_buffer(dtype, len(self.__buffers[i]))
+
+        if self.__dtype_cache is not None:
+            self.__dtype_cache.put(self.__cache_key, self.__dtypes)
+
+    def __column_array(self, values, i):
+        n = len(values)
+
+        if n > len(self.__buffers[i]):
+            self.__buffers[i] = self.__new_buffer(self.__dtypes[i], n)
+
+        dtype = self.__dtypes[i]
+
+        if dtype.kind in self.KIND_TYPES and self.__type_codes[i] not in ColumnarMaterializer.TYPE_DTYPES:
+            # numpy would silently cast values of another type, ie truncate floats in an int buffer
+            accepted = self.KIND_TYPES[dtype.kind]
+
+            if any(v is not None and type(v) not in accepted for v in values):
+                self.__promote(i, self.OBJECT_DTYPE)
+
+        mask = None
+
+        if self.__dtypes[i].kind in self.NULLABLE_DTYPES:
+            mask = np.fromiter((v is None for v in values), dtype=np.bool_, count=n)
+
+            if mask.any():
+                if isinstance(self.__dtypes[i], np.dtype):
+                    self.__promote(i, self.NULLABLE_DTYPES[self.__dtypes[i].kind])
+
+                fill = self.__buffers[i].dtype.type(0)
+                values = [fill if v is None else v for v in values]
+
+        buffer = self.__buffers[i]
+
+        if buffer.dtype.kind != 'O':
+            try:
+                buffer[:n] = values
+            except (TypeError, ValueError, OverflowError):
+                self.__promote(i, self.OBJECT_DTYPE)
+                return self.__column_array(values if mask is None else self.__with_nulls(values, mask), i)
+
+            return self.__finalize_array(i, n, mask)
+
+        if self.__type_codes[i] in ColumnarMaterializer.BINARY_TYPES:
+            for j, value in enumerate(values):
+                buffer[j] = value
+        else:
+            try:
+                buffer[:n] = values
+            except ValueError:
+                for j, value in enumerate(values):
+                    buffer[j] = value
+
+        return self.__hand_over(i, n)
+
+    @staticmethod
+    def __with_nulls(values, mask):
+        return [None if null else v for v, null in zip(values, mask)]
+
+    def __hand_over(self, i, n):
+        # The chunk keeps the filled buffer and a fresh one is allocated instead of copying the data out
+        buffer = self.__buffers[i]
+        self.__buffers[i] = self.__new_buffer(self.__dtypes[i], len(buffer))
+        return buffer if n == len(buffer) else buffer[:n]
+
+    def __finalize_array(self, i, n, mask):
+        array = self.__buffers[i][:n]
+
+        # pandas stores datetimes at nanosecond resolution, dates outside of that range stay python datetimes
+        if array.dtype.kind == 'M':
+            valid = array[~np.isnat(array)]
+
+            if valid.size and (valid.min() < ColumnarMaterializer.DATETIME_MIN or
+                               valid.max() > ColumnarMaterializer.DATETIME_MAX):
+                self.__promote(i, self.OBJECT_DTYPE)
+                return array.astype(object)
+
+            # astype() converts into a new array so the buffer is re-used for the next batch
+            return array.astype('datetime64[ns]')
+
+        if isinstance(self.__dtypes[i], np.dtype):
+            return self.__hand_over(i, n)
+
+        array = self.__hand_over(i, n)
+
+        if array.dtype.kind == 'b':
+            return BooleanArray(array, mask)
+
+        return IntegerArray(array, mask)
+
+
+def materialize_dataframe(dataset, fetch_size=ColumnarMaterializer.DEFAULT_FETCH_SIZE, columnar=True, stats=None):
+    """
+    Builds a DataFrame from a DB-API cursor result set
+
+    :param dataset: DB-API cursor that has an open result set
+    :param fetch_size: [Optional] Number of rows to pull per fetchmany() call (columnar only)
+    :param columnar: [Optional] (True/False) Use the columnar fast path or the row tuple path
+    :param stats: [Optional] CursorStats that fetch and build seconds, rows and DataFrame bytes are added to
+    :return: pandas DataFrame
+    """
+
+    if columnar and hasattr(dataset, 'fetchmany'):
+        materializer = ColumnarMaterializer(dataset, fetch_size=fetch_size)
+        df = materializer.to_dataframe()
+        fetch_time, build_time = materializer.fetch_time, materializer.build_time
+    else:
+        start = monotonic()
+        data = [tuple(t) for t in dataset.fetchall()]
+        fetch_time = monotonic() - start
+        cols = [column[0] for column in dataset.description]
+        df = DataFrame(data, columns=cols)
+        build_time = monotonic() - start - fetch_time
+
+    if stats is not None:
+        stats.fetch += fetch_time
+        stats.build += build_time
+        stats.rows += len(df)
+        stats.bytes += int(df.memory_usage(index=False).sum())
+
+    return df
@@ -0,0 +1,296 @@
+from __future__ import unicode_literals
+
+from threading import Condition, Lock
+from collections import deque
+from time import monotonic
+
+import logging
+
+log = logging.getLogger(__name__)
+
+
+class PooledConnection(object):
+    """
+    Bookkeeping record for a single connection held by SQLConnectionPool
+    """
+
+    __slots__ = ("engine", "spid", "created", "last_used", "needs_validation", "retired")
+
+    def __init__(self, engine, spid):
+        self.engine = engine
+        self.spid = spid
+        self.created = monotonic()
+        self.last_used = self.created
+        self.needs_validation = False
+        self.retired = False
+
+    def age(self, now=None):
+        return (now or monotonic()) - self.created
+
+    def idle(self, now=None):
+        return (now or monotonic()) - self.last_used
+
+
+class SQLConnectionPool(object):
+    """
+    Bounded pool of re-usable validated SQL connections. Connections are created lazily up to max_size, handed out
+    LIFO so the most recently used connection is re-used first, health-checked lazily on checkout and evicted when
+    idle or aged past their limits
+    """
+
+    DEFAULT_POOL_SIZE = 10
+    DEFAULT_IDLE_TIMEOUT = 300
+    DEFAULT_MAX_AGE = 3600
+    DEFAULT_VALIDATE_INTERVAL = 30
+
+    def __init__(self, connect, validate, close, max_size=DEFAULT_POOL_SIZE, idle_timeout=DEFAULT_IDLE_TIMEOUT,
+                 max_age=DEFAULT_MAX_AGE, validate_interval=DEFAULT_VALIDATE_INTERVAL, pool_id=None):
+        """
+        :param connect: Function that creates a new connection and returns [engine, spid]
+        :param validate: Function that validates a connection and returns [engine, spid] (engine is None if invalid)
+        :param close: Function that closes a connection
+        :param max_size: [Optional] Maximum connections open at one time (checked out + idle)
+        :param idle_timeout: [Optional] Seconds a connection may sit idle before being evicted (0 is infinity)
+        :param max_age: [Optional] Seconds a connection may live before being evicted (0 is infinity)
+        :param validate_interval: [Optional] Seconds a connection may sit idle before it is re-validated on checkout
+        :param pool_id: [Optional] Identifier used for logging
+        """
+
+        if max_size < 1:
+            raise ValueError("'max_size' %r must be a positive number" % max_size)
+        if idle_timeout < 0:
+            raise ValueError("'idle_timeout' %r must be a non-negative number" % idle_timeout)
+        if max_age < 0:
+            raise ValueError("'max_age' %r must be a non-negative number" % max_age)
+
+        self.__connect = connect
+        self.__validate = validate
+        self.__close = close
+        self.__max_size = max_size
+        self.__idle_timeout = idle_timeout
+        self.__max_age = max_age
+        self.__validate_interval = validate_interval
+        self.__pool_id = pool_id
+        self.__idle = deque()
+        self.__checked_out = dict()
+        self.__size = 0
+        self.__closed = False
+        self.__pool_cond = Condition(Lock())
+
+    @property
+    def max_size(self):
+        """
+        :return: Maximum connections allowed in pool
+        """
+
+        return self.__max_size
+
+    @property
+    def size(self):
+        """
+        :return: Number of open connections (checked out + idle)
+        """
+
+        return self.__size
+
+    @property
+    def closed(self):
+        """
+        :return: (True/False) if close_all() was called and the pool has not handed out a connection since
+        """
+
+        return self.__closed
+
+    @property
+    def idle_count(self):
+        """
+        :return: Number of idle connections waiting in pool
+        """
+
+        return len(self.__idle)
+
+    @property
+    def checked_out_count(self):
+        """
+        :return: Number of connections currently checked out of pool
+        """
+
+        return len(self.__checked_out)
+
+    def owns(self, engine):
+        """
+        :param engine: Connection handed out by checkout()
+        :return: (True/False) if connection is currently checked out of this pool
+        """
+
+        return id(engine) in self.__checked_out
+
+    def checkout(self, timeout=None):
+        """
+        Borrow a connection from the pool. Idle connections are re-used first, otherwise a new connection is created
+        when the pool has room, otherwise the caller waits for a connection to be returned
+
+        :param timeout: [Optional] Seconds to wait for a connection (None is infinity)
+        :return: [engine, spid]
+        """
+
+        end_time = None if timeout is None else monotonic() + timeout
+
+        with self.__pool_cond:
+            self.__closed = False
+
+        while True:
+            record = None
+            create = False
+            evicted = list()
+
+            with self.__pool_cond:
+                while True:
+                    evicted.extend(self.__evict_idle())
+
+                    if self.__idle:
+                        record = self.__idle.pop()
+                        break
+                    elif self.__size < self.__max_size:
+                        self.__size += 1
+                        create = True
+                        break
+
+                    remaining = None if end_time is None else end_time - monotonic()
+
+                    if remaining is not None and remaining <= 0:
+                        self.__close_engines(evicted)
+                        raise ValueError("No SQL connection available in pool. Operation timed out")
+
+                    self.__pool_cond.wait(remaining)
+
+            self.__close_engines(evicted)
+
+            if create:
+                try:
+                    engine, spid = self.__connect()
+                except:
+                    with self.__pool_cond:
+                        self.__size -= 1
+                        self.__pool_cond.notify()
+                    raise
+
+                record = PooledConnection(engine, spid)
+                log.debug('SQL Pool %s: Opened connection on SPID %s (%s/%s)', self.__pool_id, spid, self.__size,
+                          self.__max_size)
+            elif record.needs_validation or record.idle() >= self.__validate_interval:
+                engine, spid = self.__validate(record.engine)
+
+                if engine is None:
+                    log.debug('SQL Pool %s: Connection on SPID %s failed validation', self.__pool_id, record.spid)
+                    self.__discard(record)
+                    continue
+
+                record.spid = spid
+                record.needs_validation = False
+
+            with self.__pool_cond:
+                self.__checked_out[id(record.engine)] = record
+
+            return [record.engine, record.spid]
+
+    def checkin(self, engine, validate=False, discard=False):
+        """
+        Return a borrowed connection to the pool
+
+        :param engine: Connection handed out by checkout()
+        :param validate: [Optional] (True/False) Force a health-check the next time the connection is checked out
+        :param discard: [Optional] (True/False) Close the connection instead of returning it to the pool
+        """
+
+        with self.__pool_cond:
+            record = self.__checked_out.pop(id(engine), None)
+
+            if record is None:
+                return
+
+            if not discard and not self.__closed and not record.retired and \
+                    not (self.__max_age and record.age() >= self.__max_age):
+                record.last_used = monotonic()
+                record.needs_validation = record.needs_validation or validate
+                self.__idle.append(record)
+                self.__pool_cond.notify()
+                return
+
+            self.__release_slot()
+
+        self.__close_engines([record])
+
+    def prune(self):
+        """
+        Closes idle connections that are past the idle timeout or max age
+        """
+
+        with self.__pool_cond:
+            evicted = self.__evict_idle()
+
+        self.__close_engines(evicted)
+
+    def close_all(self):
+        """
+        Closes all idle connections. Checked out connections are closed when they are returned instead of going back
+        to the pool, the pool itself stays usable for new checkouts
+        """
+
+        with self.__pool_cond:
+            self.__closed = True
+            records = list(self.__idle)
+            self.__idle.clear()
+
+            for record in self.__checked_out.values():
+                record.retired = True
+
+            for _ in records:
+                self.__release_slot()
+
+        self.__close_engines(records)
+
+    def __evict_idle(self):
+        evicted = list()
+
+        if not self.__idle_timeout and not self.__max_age:
+            return evicted
+
+        now = monotonic()
+        keep = deque()
+
+        for record in self.__idle:
+            if (self.__idle_timeout and record.idle(now) >= self.__idle_timeout) or \
+                    (self.__max_age and record.age(now) >= self.__max_age):
+                log.debug('SQL Pool %s: Evicting connection on SPID %s', self.__pool_id, record.spid)
+                self.__release_slot()
+                evicted.append(record)
+            else:
+                keep.append(record)
+
+        self.__idle = keep
+        return evicted
+
+    def __discard(self, record):
+        with self.__pool_cond:
+            self.__release_slot()
+
+        self.__close_engines([record])
+
+    def __release_slot(self):
+        self.__size -= 1
+        self.__pool_cond.notify()
+
+    def __close_engines(self, records):
+        for record in records:
+            try:
+                self.__close(record.engine)
+            except:
+                pass
+
+    def __len__(self):
+        return self.__size
+
+    def __repr__(self):
+        return '%s(%s, size=%s, idle=%s, max=%s)' % (self.__class__.__name__, self.__pool_id, self.__size,
+                                                     len(self.__idle), self.__max_size)
@@ -1,7 +1,9 @@
 from __future__ import unicode_literals
 
-from future.moves.queue import LifoQueue, Empty
-from threading import Lock
+from threading import Lock, Event, Timer
+from collections import deque
+from contextlib import contextmanager
+from time import monotonic
 from ..data.error import TransportError
 
 import logging
@@ -14,23 +16,70 @@ def close_sql_connections():
     CatchSQLQueue.clear_cache()
 
 
+class EngineWaiter(object):
+    """
+    A caller waiting in BaseSQLQueue.pop_sql_engine_from_pool for an engine to be handed to it
+    """
+
+    __slots__ = ("sql_engine", "event", "started", "config_key")
+
+    def __init__(self, config_key=None):
+        self.sql_engine = None
+        self.event = Event()
+        self.started = monotonic()
+        self.config_key = config_key
+
+    def accepts(self, sql_engine):
+        return self.config_key is None or self.config_key == sql_engine.sql_config.config_key
+
+
+class ElasticConfig(object):
+    """
+    Bounds and engine parameters of a SQLConfig registered with BaseSQLQueue.register_sql_config
+    """
+
+    __slots__ = ("sql_config", "min_size", "max_size", "engine_params", "size")
+
+    def __init__(self, sql_config, min_size, max_size, engine_params):
+        self.sql_config = sql_config
+        self.min_size = min_size
+        self.max_size = max_size
+        self.engine_params = engine_params
+        self.size = 0
+
+
 class BaseSQLQueue(object):
     CONN_DEFAULT_TIMEOUT = 3
     QUERY_DEFAULT_TIMEOUT = 0
     DEFAULT_CONNECTION_SIZE = 10
+    DEFAULT_IDLE_TTL = 300
 
-    def __init__(self, queue_id, max_pool_size):
+    def __init__(self, queue_id, max_pool_size, elastic=False, idle_ttl=DEFAULT_IDLE_TTL):
         """
         Class to add different SQL engines to a pool
 
         :param queue_id: [Optional] Queue_ID
         :param max_pool_size: [Optional] Pool_Size for SQL engines
+        :param elastic: [Optional] (True/False) Create engines of registered SQLConfigs on demand when callers would
+        have to wait and close idle engines above their minimum after idle_ttl. Idle engines are closed by a
+        background timer, so the pool shrinks even when nobody pops an engine
+        :param idle_ttl: [Optional] (elastic only) Seconds an engine may sit idle before it is closed (0 is infinity)
         """
         self.__queue_id = queue_id
         self.__pool_size = max_pool_size
-        self.__sql_engine_pool = LifoQueue(maxsize=max_pool_size)
+        self.__elastic = elastic
+        self.__idle_ttl = idle_ttl
+        self.__sql_engine_pool = deque()
         self.__sql_engine_pool_lock = Lock()
+        self.__waiters = deque()
+        self.__checked_out = set()
+        self.__idle_since = dict()
+        self.__elastic_configs = dict()
         self.__disabled_pool = list()
+        self.__engine_groups = list()
+        self.__prune_timer = None
+        self.__stats = dict(checkouts=0, waits=0, timeouts=0, returns=0, wait_time_total=0.0, wait_time_max=0.0,
+                            created=0, pruned=0, engines_high_water=0, in_use_high_water=0, waiters_high_water=0)
 
     @property
     def pool_list(self):
@@ -41,7 +90,7 @@ class BaseSQLQueue(object):
         if self.__disabled_pool:
             raise Exception("Pool is currently disabled. Unable to view items")
         else:
-            return list(self.__sql_engine_pool.queue)
+            return list(self.__sql_engine_pool)
 
     @property
     def max_pool_size(self):
@@ -67,6 +116,129 @@ class BaseSQLQueue(object):
 
         self.__pool_size = max_pool_size
 
+    @property
+    def elastic(self):
+        """
+        :return: (True/False) if engines are created and closed on demand
+        """
+
+        return self.__elastic
+
+    @property
+    def idle_ttl(self):
+        """
+        :return: Seconds an elastic engine may sit idle before it is closed
+        """
+
+        return self.__idle_ttl
+
+    @property
+    def waiters(self):
+        """
+        :return: Number of callers waiting for a SQL engine
+        """
+
+        return len(self.__waiters)
+
+    @property
+    def stats(self):
+        """
+        :return: Dictionary of checkout counters (checkouts, waits, timeouts, returns, waiters, wait_time_total,
+        wait_time_max, idle, in_use, created, pruned), high-water marks (engines_high_water, in_use_high_water,
+        waiters_high_water) and per SQLConfig engine counts and bounds (configs)
+        """
+
+        with self.__sql_engine_pool_lock:
+            stats = dict(self.__stats)
+            stats['waiters'] = len(self.__waiters)
+            stats['idle'] = len(self.__sql_engine_pool)
+            stats['in_use'] = len(self.__checked_out)
+            stats['configs'] = [dict(sql_config=str(config.sql_config), size=config.size, min_size=config.min_size,
+                                     max_size=config.max_size) for config in self.__elastic_configs.values()]
+
+        return stats
+
+    def register_sql_config(self, sql_config, min_size=0, max_size=DEFAULT_CONNECTION_SIZE,
+                            conn_max_pool_size=DEFAULT_CONNECTION_SIZE, conn_timeout=CONN_DEFAULT_TIMEOUT,
+                            query_timeout=QUERY_DEFAULT_TIMEOUT):
+        """
+        Registers a SQLConfig that engines are created from on demand and creates its minimum engines. The max pool
+        size of the queue grows to fit the max_size of every registered SQLConfig
+
+        :param sql_config: SQLConfig instance class
+        :param min_size: [Optional] Engines that are kept open even when idle
+        :param max_size: [Optional] Engines that may exist at one time
+        :param conn_max_pool_size: [Optional] Max SQL connection pool size of each engine
+        :param conn_timeout: [Optional] SQL Connection timeout in seconds
+        :param query_timeout: [Optional] SQL Query timeout in seconds
+        """
+
+        if min_size < 0:
+            raise ValueError("'min_size' %r is a negative number" % min_size)
+        if max_size < 1 or max_size < min_size:
+            raise ValueError("'max_size' %r must be a positive number of at least min_size" % max_size)
+
+        with self.__sql_engine_pool_lock:
+            key = sql_config.config_key
+            config = self.__elastic_configs.get(key)
+
+            if config is None:
+                config = ElasticConfig(sql_config, min_size, max_size, dict(conn_max_pool_size=conn_max_pool_size,
+                                                                            conn_timeout=conn_timeout,
+                                                                            query_timeout=query_timeout))
+                self.__elastic_configs[key] = config
+            else:
+                config.min_size = min_size
+                config.max_size = max_size
+
+            max_pool_size = sum(c.max_size for c in self.__elastic_configs.values())
+
+            if max_pool_size > self.__pool_size:
+                log.debug('Queue Pool %s: Max pool size raised to %s', self.__queue_id, max_pool_size)
+                self.__pool_size = max_pool_size
+
+            missing = max(0, config.min_size - config.size)
+
+        for _ in range(missing):
+            self.create_sql_engine_to_pool(sql_config, **config.engine_params)
+
+    def prune(self):
+        """
+        (elastic only) Closes idle engines past idle_ttl while their SQLConfig has more than min_size engines. Runs on
+        a background timer whenever engines above their minimum are idle, and can be called to prune right away
+        """
+
+        if not self.__elastic or not self.__idle_ttl:
+            return
+
+        now = monotonic()
+        evicted = list()
+
+        with self.__sql_engine_pool_lock:
+            keep = deque()
+
+            for sql_engine in self.__sql_engine_pool:
+                config = self.__elastic_configs.get(sql_engine.sql_config.config_key)
+
+                if config is not None and config.size > config.min_size and \
+                        now - self.__idle_since.get(sql_engine.engine_id, now) >= self.__idle_ttl:
+                    config.size -= 1
+                    self.__stats['pruned'] += 1
+                    self.__idle_since.pop(sql_engine.engine_id, None)
+                    evicted.append(sql_engine)
+                else:
+                    keep.append(sql_engine)
+
+            self.__sql_engine_pool = keep
+            delay = self.__next_expiry(now)
+
+            if delay is not None:
+                self.__schedule_prune(delay)
+
+        for sql_engine in evicted:
+            log.debug('Queue Pool %s: Closing idle SQL engine %s', self.__queue_id, sql_engine.engine_id)
+            sql_engine.close_connections(False)
+
     def create_sql_engine_to_pool(self, sql_config, conn_max_pool_size=DEFAULT_CONNECTION_SIZE,
                                   conn_timeout=CONN_DEFAULT_TIMEOUT, query_timeout=QUERY_DEFAULT_TIMEOUT):
         """
@@ -81,20 +253,59 @@ class BaseSQLQueue(object):
         from .engine import SQLEngineClass
 
         if not self.__disabled_pool:
+            sql_engine = SQLEngineClass(sql_config=sql_config, conn_max_pool_size=conn_max_pool_size,
+                                        conn_timeout=conn_timeout, query_timeout=query_timeout)
+            sql_engine.connect()
+            sql_engine.engine_sql_class = self
+
             with self.__sql_engine_pool_lock:
-                sql_engine = SQLEngineClass(sql_config=sql_config, conn_max_pool_size=conn_max_pool_size,
-                                            conn_timeout=conn_timeout, query_timeout=query_timeout)
-                sql_engine.connect()
-                sql_engine.engine_sql_class = self
+                config = self.__elastic_configs.get(sql_config.config_key)
+
+                if config is not None:
+                    config.size += 1
+
+                self.__stats['created'] += 1
 
             self.queue_sql_engine_to_pool(sql_engine)
             return sql_engine
         else:
             log.error('Queue Pool %s: Is in disabled state. Please enable', self.__queue_id)
 
+    def create_sql_engine_group(self, primary_config, replica_configs=None, conn_max_pool_size=DEFAULT_CONNECTION_SIZE,
+                                conn_timeout=CONN_DEFAULT_TIMEOUT, query_timeout=QUERY_DEFAULT_TIMEOUT,
+                                cooldown=None, **engine_params):
+        """
+        Creates a SQLEngineGroup that routes queries across read replicas and writes to the primary. The group owns
+        its engines, they are not queued into the engine queue pool and are closed with close_pool()
+
+        :param primary_config: SQLConfig instance class of the server that takes writes
+        :param replica_configs: [Optional] List of SQLConfig instance classes of read replicas
+        :param conn_max_pool_size: [Optional] Max SQL connection pool size of each engine
+        :param conn_timeout: [Optional] SQL Connection timeout in seconds
+        :param query_timeout: [Optional] SQL Query timeout in seconds
+        :param cooldown: [Optional] Seconds an ejected replica stays out of rotation DEFAULT is 30
+        :param engine_params: [Optional] Other SQLEngineClass parameters
+        :return: SQLEngineGroup instance class
+        """
+
+        from .router import SQLEngineGroup
+
+        if cooldown is None:
+            cooldown = SQLEngineGroup.DEFAULT_COOLDOWN
+
+        group = SQLEngineGroup(primary_config, replica_configs, cooldown=cooldown, group_id=self.__queue_id,
+                               conn_max_pool_size=conn_max_pool_size, conn_timeout=conn_timeout,
+                               query_timeout=query_timeout, **engine_params)
+
+        with self.__sql_engine_pool_lock:
+            self.__engine_groups.append(group)
+
+        return group
+
     def queue_sql_engine_to_pool(self, sql_engine):
         """
-        Puts SQLEngine class instance back into the sql queue pool if queue pool has room available
+        Puts SQLEngine class instance back into the sql queue pool if queue pool has room available. When callers are
+        waiting the engine is handed straight to the longest waiting caller
 
         :param sql_engine: SQLEngine class instance
         """
@@ -105,36 +316,112 @@ class BaseSQLQueue(object):
             if not isinstance(sql_engine, SQLEngineClass):
                 raise ValueError("'engine' %r is not an instance of SQLEngineClass")
 
-            if sql_engine not in self.__sql_engine_pool.queue:
-                with self.__sql_engine_pool_lock:
-                    log.debug('Queue Pool %s: Added SQL engine %s to pool', self.__queue_id, sql_engine.engine_id)
-                    self.__sql_engine_pool.put(sql_engine, block=False)
+            with self.__sql_engine_pool_lock:
+                if sql_engine in self.__sql_engine_pool:
+                    return
+
+                self.__stats['returns'] += 1
+                waiter = next((w for w in self.__waiters if w.accepts(sql_engine)), None)
+
+                if waiter is not None:
+                    self.__waiters.remove(waiter)
+                    waiter.sql_engine = sql_engine
+                    waiter.event.set()
+                    log.debug('Queue Pool %s: Handed SQL engine %s to waiting caller', self.__queue_id,
+                              sql_engine.engine_id)
+                    return
+
+                if len(self.__sql_engine_pool) >= self.__pool_size:
+                    raise ValueError("Queue pool %s is full. Unable to add SQL engine %s" % (self.__queue_id,
+                                                                                            sql_engine.engine_id))
+
+                log.debug('Queue Pool %s: Added SQL engine %s to pool', self.__queue_id, sql_engine.engine_id)
+                self.__checked_out.discard(sql_engine.engine_id)
+                self.__idle_since[sql_engine.engine_id] = monotonic()
+                self.__sql_engine_pool.append(sql_engine)
+                self.__update_high_water()
+                self.__schedule_prune()
         else:
             log.error('Queue Pool %s: Is in disabled state. Please enable', self.__queue_id)
 
-    def pop_sql_engine_from_pool(self):
+    def pop_sql_engine_from_pool(self, timeout=None, sql_config=None):
         """
-        Removes sql engine from top of SQL queue pool and returns engine to user
+        Removes sql engine from top of SQL queue pool and returns engine to user. Callers that have to wait are served
+        first come first served and the pool is never locked while waiting. In elastic mode a caller that would have
+        to wait creates a new engine instead while a registered SQLConfig is below its max_size
 
+        :param timeout: [Optional] Seconds to wait for a SQL engine (None is infinity)
+        :param sql_config: [Optional] SQLConfig instance class the engine must be connected with DEFAULT is any engine
         :return: Returns SQLEngine class instance object
         """
 
         if not self.__disabled_pool:
+            config_key = None if sql_config is None else sql_config.config_key
+
             with self.__sql_engine_pool_lock:
-                _timeout = 60
-
-                while True:
-                    try:
-                        log.debug('Queue Pool %s: Waiting for SQL engine', self.__queue_id)
-                        sql_engine = self.__sql_engine_pool.get(timeout=_timeout)
-                        log.debug('Queue Pool %s: Popped SQL engine %s from pool', self.__queue_id,
-                                  sql_engine.engine_id)
-                        return sql_engine
-                    except Empty:
-                        log.debug('Queue Pool %s: No SQL engines available for %s seconds', self.__queue_id, _timeout)
+                sql_engine = next((e for e in reversed(self.__sql_engine_pool)
+                                   if config_key is None or e.sql_config.config_key == config_key), None)
+
+                if sql_engine is not None:
+                    self.__sql_engine_pool.remove(sql_engine)
+                    self.__checkout(sql_engine)
+                    log.debug('Queue Pool %s: Popped SQL engine %s from pool', self.__queue_id, sql_engine.engine_id)
+                    return sql_engine
+
+                config = self.__reserve_engine(config_key)
+
+                if config is None:
+                    waiter = EngineWaiter(config_key)
+                    self.__waiters.append(waiter)
+                    self.__update_high_water()
+
+            if config is not None:
+                return self.__grow(config)
+
+            log.debug('Queue Pool %s: Waiting for SQL engine', self.__queue_id)
+            waiter.event.wait(timeout)
+
+            with self.__sql_engine_pool_lock:
+                wait_time = monotonic() - waiter.started
+                self.__stats['wait_time_total'] += wait_time
+                self.__stats['wait_time_max'] = max(self.__stats['wait_time_max'], wait_time)
+
+                if waiter.sql_engine is None:
+                    if waiter in self.__waiters:
+                        self.__waiters.remove(waiter)
+
+                    self.__stats['timeouts'] += 1
+                    raise ValueError("No SQL engine available in queue pool %s after %s seconds. Operation timed out"
+                                     % (self.__queue_id, timeout))
+
+                self.__checkout(waiter.sql_engine)
+                self.__stats['waits'] += 1
+
+            log.debug('Queue Pool %s: Popped SQL engine %s from pool after waiting %.3f seconds', self.__queue_id,
+                      waiter.sql_engine.engine_id, wait_time)
+            return waiter.sql_engine
         else:
             log.error('Queue Pool %s: Is in disabled state. Please enable', self.__queue_id)
 
+    @contextmanager
+    def engine(self, timeout=None):
+        """
+        Context manager that pops a SQL engine from the pool and queues it back on exit
+
+        :param timeout: [Optional] Seconds to wait for a SQL engine (None is infinity)
+        :return: SQLEngine class instance object
+        """
+
+        sql_engine = self.pop_sql_engine_from_pool(timeout=timeout)
+
+        if sql_engine is None:
+            raise ValueError("Queue pool %s is disabled. Unable to pop SQL engine" % self.__queue_id)
+
+        try:
+            yield sql_engine
+        finally:
+            self.queue_sql_engine_to_pool(sql_engine)
+
     def remove_engine_from_pool(self, sql_engine):
         """
         Removes SQLEngine class instance for sql queue pool
@@ -147,13 +434,13 @@ class BaseSQLQueue(object):
         if not self.__disabled_pool:
             if not isinstance(sql_engine, SQLEngineClass):
                 raise ValueError("'engine' %r is not an instance of SQLEngineClass")
-            if sql_engine not in self.__sql_engine_pool.queue:
-                raise ValueError("'engine' %r is not in the SQL Engine Pool" % sql_engine)
-
             with self.__sql_engine_pool_lock:
+                if sql_engine not in self.__sql_engine_pool:
+                    raise ValueError("'engine' %r is not in the SQL Engine Pool" % sql_engine)
 
                 log.debug('Queue Pool %s: Removed SQL engine %s from pool', self.__queue_id, sql_engine.engine_id)
-                self.__sql_engine_pool.queue.remove(sql_engine)
+                self.__sql_engine_pool.remove(sql_engine)
+                self.__forget(sql_engine)
         else:
             log.error('Queue Pool %s: Is in disabled state. Please enable', self.__queue_id)
 
@@ -166,11 +453,19 @@ class BaseSQLQueue(object):
             if enable_log:
                 log.debug('Queue Pool %s: Closing SQL Engine pool', self.__queue_id)
 
-            while True:
-                try:
-                    self.__sql_engine_pool.get(block=False).close_connections(False, enable_log=enable_log)
-                except Empty:
-                    break
+            sql_engines = list(self.__sql_engine_pool)
+            self.__sql_engine_pool.clear()
+            engine_groups = list(self.__engine_groups)
+            self.__cancel_prune()
+
+            for sql_engine in sql_engines:
+                self.__forget(sql_engine)
+
+        for sql_engine in sql_engines:
+            sql_engine.close_connections(False, enable_log=enable_log)
+
+        for group in engine_groups:
+            group.close_connections(enable_log=enable_log)
 
     def disable_pool(self):
         """
@@ -180,14 +475,13 @@ class BaseSQLQueue(object):
         if not self.__disabled_pool:
             with self.__sql_engine_pool_lock:
                 log.debug('Queue Pool %s: Disabling SQL Engine pool', self.__queue_id)
+                sql_engines = list(self.__sql_engine_pool)
+                self.__sql_engine_pool.clear()
+                self.__cancel_prune()
 
-                while True:
-                    try:
-                        sql_engine = self.__sql_engine_pool.get(block=False)
-                        sql_engine.close_connections()
-                        self.__disabled_pool.append(sql_engine)
-                    except Empty:
-                        break
+            for sql_engine in sql_engines:
+                sql_engine.close_connections()
+                self.__disabled_pool.append(sql_engine)
         else:
             log.warning('Queue Pool %s: Is already disabled', self.__queue_id)
 
@@ -197,17 +491,123 @@ class BaseSQLQueue(object):
         """
 
         if self.__disabled_pool:
-            with self.__sql_engine_pool_lock:
-                log.debug('Queue Pool %s: Enabling SQL Engine pool', self.__queue_id)
-
-                for sql_engine in self.__disabled_pool:
-                    sql_engine.connect()
-                    self.__sql_engine_pool.put(sql_engine, block=False)
+            log.debug('Queue Pool %s: Enabling SQL Engine pool', self.__queue_id)
+            sql_engines = self.__disabled_pool
+            self.__disabled_pool = list()
 
-                self.__disabled_pool = list()
+            for sql_engine in sql_engines:
+                sql_engine.connect()
+                self.queue_sql_engine_to_pool(sql_engine)
         else:
             log.warning('Queue Pool %s: Is already enabled', self.__queue_id)
 
+    def __reserve_engine(self, config_key):
+        # Claims room for one more engine of a registered SQLConfig. Caller holds the pool lock
+        if not self.__elastic:
+            return None
+
+        if config_key is None:
+            configs = self.__elastic_configs.values()
+        elif config_key in self.__elastic_configs:
+            configs = [self.__elastic_configs[config_key]]
+        else:
+            configs = list()
+
+        for config in configs:
+            if config.size < config.max_size:
+                config.size += 1
+                return config
+
+        return None
+
+    def __grow(self, config):
+        from .engine import SQLEngineClass
+
+        log.debug('Queue Pool %s: Creating SQL engine on demand (%s/%s)', self.__queue_id, config.size,
+                  config.max_size)
+
+        try:
+            sql_engine = SQLEngineClass(sql_config=config.sql_config, **config.engine_params)
+            sql_engine.connect()
+            sql_engine.engine_sql_class = self
+        except:
+            with self.__sql_engine_pool_lock:
+                config.size -= 1
+
+            raise
+
+        with self.__sql_engine_pool_lock:
+            self.__stats['created'] += 1
+            self.__checkout(sql_engine)
+
+        return sql_engine
+
+    def __next_expiry(self, now):
+        # Seconds until the next idle engine above its minimum expires, None when there is none. Caller holds the lock
+        if not self.__elastic or not self.__idle_ttl:
+            return None
+
+        delays = list()
+
+        for sql_engine in self.__sql_engine_pool:
+            config = self.__elastic_configs.get(sql_engine.sql_config.config_key)
+
+            if config is not None and config.size > config.min_size:
+                idle = now - self.__idle_since.get(sql_engine.engine_id, now)
+                delays.append(max(self.__idle_ttl - idle, 0))
+
+        return min(delays) if delays else None
+
+    def __schedule_prune(self, delay=None):
+        # Caller holds the pool lock. One timer is pending at a time, prune() schedules the next one
+        if not self.__elastic or not self.__idle_ttl or self.__prune_timer is not None:
+            return
+
+        self.__prune_timer = Timer(self.__idle_ttl if delay is None else delay, self.__run_prune)
+        self.__prune_timer.daemon = True
+        self.__prune_timer.start()
+
+    def __cancel_prune(self):
+        # Caller holds the pool lock
+        if self.__prune_timer is not None:
+            self.__prune_timer.cancel()
+            self.__prune_timer = None
+
+    def __run_prune(self):
+        # Timer thread, so closing evicted engines never holds up a caller
+        with self.__sql_engine_pool_lock:
+            self.__prune_timer = None
+
+        try:
+            self.prune()
+        except Exception as e:
+            log.warning('Queue Pool %s: Pruning idle SQL engines failed. %s', self.__queue_id, e)
+
+    def __checkout(self, sql_engine):
+        # Caller holds the pool lock
+        self.__stats['checkouts'] += 1
+        self.__checked_out.add(sql_engine.engine_id)
+        self.__idle_since.pop(sql_engine.engine_id, None)
+        self.__update_high_water()
+
+    def __forget(self, sql_engine):
+        # Engine leaves the queue for good. Caller holds the pool lock
+        config = self.__elastic_configs.get(sql_engine.sql_config.config_key)
+
+        if config is not None and config.size > 0:
+            config.size -= 1
+
+        self.__checked_out.discard(sql_engine.engine_id)
+        self.__idle_since.pop(sql_engine.engine_id, None)
+
+    def __update_high_water(self):
+        # Caller holds the pool lock
+        in_use = len(self.__checked_out)
+        self.__stats['in_use_high_water'] = max(self.__stats['in_use_high_water'], in_use)
+        self.__stats['engines_high_water'] = max(self.__stats['engines_high_water'],
+                                                 in_use + len(self.__sql_engine_pool))
+        self.__stats['waiters_high_water'] = max(self.__stats['waiters_high_water'], len(self.__waiters))
+
     def __del__(self):
         self.close_pool(enable_log=False)
 
@@ -216,19 +616,27 @@ class BaseSQLQueue(object):
         self.disable_pool()
         state = self.__dict__.copy()
 
-        if state and '__sql_engine_pool' in state.keys():
-            del state['__sql_engine_pool']
+        if state and '_BaseSQLQueue__sql_engine_pool' in state.keys():
+            del state['_BaseSQLQueue__sql_engine_pool']
+
+        if state and '_BaseSQLQueue__sql_engine_pool_lock' in state.keys():
+            del state['_BaseSQLQueue__sql_engine_pool_lock']
+
+        if state and '_BaseSQLQueue__waiters' in state.keys():
+            del state['_BaseSQLQueue__waiters']
 
-        if state and '__sql_engine_pool_lock' in state.keys():
-            del state['__sql_engine_pool_lock']
+        if state and '_BaseSQLQueue__prune_timer' in state.keys():
+            del state['_BaseSQLQueue__prune_timer']
 
         return state
 
     def __setstate__(self, state):
         # Restore the pool and lock
         self.__dict__.update(state)
-        self.__sql_engine_pool = LifoQueue(maxsize=self.__pool_size)
+        self.__sql_engine_pool = deque()
         self.__sql_engine_pool_lock = Lock()
+        self.__waiters = deque()
+        self.__prune_timer = None
         self.enable_pool()
 
 
@@ -288,11 +696,11 @@ class SQLQueue(BaseSQLQueue, metaclass=CatchSQLQueue):
     Creates a SQLQueue pool that is cached for SQLEngine instance classes
     """
 
-    def __init__(self, queue_id=None, max_pool_size=None):
+    def __init__(self, queue_id=None, max_pool_size=None, elastic=False, idle_ttl=BaseSQLQueue.DEFAULT_IDLE_TTL):
         if not queue_id:
             queue_id = id(self.__class__)
 
         if not max_pool_size:
             max_pool_size = 10
 
-        super().__init__(queue_id=queue_id, max_pool_size=max_pool_size)
+        super().__init__(queue_id=queue_id, max_pool_size=max_pool_size, elastic=elastic, idle_ttl=idle_ttl)
@@ -0,0 +1,114 @@
+from __future__ import unicode_literals
+
+from threading import Lock
+from sqlalchemy import create_engine
+
+import logging
+
+log = logging.getLogger(__name__)
+
+
+def get_sql_engine(sql_config, **engine_options):
+    return SQLEngineRegistry.get_engine(sql_config, **engine_options)
+
+
+def dispose_sql_engines(sql_config=None):
+    SQLEngineRegistry.dispose(sql_config)
+
+
+class SQLEngineRegistry(object):
+    """
+    Process-wide cache of SQLAlchemy engines keyed by SQLConfig.config_key. Every SQLEngineClass for the same SQLConfig
+    shares one engine and its connection pool, and the connection string is only generated (decrypted) once. Each
+    SQLEngineClass holds the connections its own SQLConnectionPool keeps open, so the shared pool has no overflow limit
+    by default and grows with the combined demand of every SQLEngineClass, which their pools already bound
+    """
+
+    DEFAULT_POOL_SIZE = 10
+    DEFAULT_MAX_OVERFLOW = -1
+    DEFAULT_POOL_RECYCLE = 3600
+    DEFAULT_POOL_PRE_PING = True
+
+    _engine_cache = {}
+    _conn_str_cache = {}
+    _engine_cache_lock = Lock()
+
+    @classmethod
+    def get_engine(cls, sql_config, pool_size=DEFAULT_POOL_SIZE, max_overflow=DEFAULT_MAX_OVERFLOW,
+                   pool_recycle=DEFAULT_POOL_RECYCLE, pool_pre_ping=DEFAULT_POOL_PRE_PING, connect_args=None):
+        """
+        Returns the cached SQLAlchemy engine for sql_config, creating it on first use. Pool options only apply when
+        the engine is created
+
+        :param sql_config: SQLConfig instance class
+        :param pool_size: [Optional] Connections kept open in the engine pool
+        :param max_overflow: [Optional] Connections allowed above pool_size when the pool is exhausted (-1 is no limit)
+        :param pool_recycle: [Optional] Seconds before a pooled connection is recycled (-1 is never)
+        :param pool_pre_ping: [Optional] (True/False) Test connections for liveness when checked out of the pool
+        :param connect_args: [Optional] Dictionary of DB-API connect() arguments
+        :return: SQLAlchemy Engine
+        """
+
+        key = sql_config.config_key
+        engine = cls._engine_cache.get(key)
+
+        if engine is not None:
+            return engine
+
+        with cls._engine_cache_lock:
+            engine = cls._engine_cache.get(key)
+
+            if engine is not None:
+                return engine
+
+            log.debug("SQL Engine Registry: Cache miss. Creating engine for '%s'", str(sql_config))
+            engine = create_engine(cls.__conn_str(sql_config, key), connect_args=connect_args or dict(),
+                                   pool_size=pool_size, max_overflow=max_overflow, pool_recycle=pool_recycle,
+                                   pool_pre_ping=pool_pre_ping)
+            cls._engine_cache[key] = engine
+            return engine
+
+    @classmethod
+    def conn_str(cls, sql_config):
+        """
+        :param sql_config: SQLConfig instance class
+        :return: Cached connection string of sql_config
+        """
+
+        key = sql_config.config_key
+
+        with cls._engine_cache_lock:
+            return cls.__conn_str(sql_config, key)
+
+    @classmethod
+    def dispose(cls, sql_config=None):
+        """
+        Disposes cached engines, closing every pooled connection they hold
+
+        :param sql_config: [Optional] SQLConfig instance class to dispose. DEFAULT disposes every cached engine
+        """
+
+        with cls._engine_cache_lock:
+            if sql_config is None:
+                keys = list(cls._engine_cache.keys())
+                cls._conn_str_cache.clear()
+            else:
+                keys = [sql_config.config_key]
+                cls._conn_str_cache.pop(sql_config.config_key, None)
+
+            engines = [cls._engine_cache.pop(key) for key in keys if key in cls._engine_cache]
+
+        for engine in engines:
+            log.debug('SQL Engine Registry: Disposing engine %s', engine)
+
+            try:
+                engine.dispose()
+            except:
+                pass
+
+    @classmethod
+    def __conn_str(cls, sql_config, key):
+        if key not in cls._conn_str_cache:
+            cls._conn_str_cache[key] = sql_config.gen_conn_str()
+
+        return cls._conn_str_cache[key]
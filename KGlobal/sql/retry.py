@@ -0,0 +1,255 @@
+from __future__ import unicode_literals
+
+from concurrent.futures import Future
+from threading import Timer
+from random import uniform
+
+import re
+import os
+import logging
+
+log = logging.getLogger(__name__)
+
+DEADLOCK_PATTERN = re.compile(r'\b40001\b|\(1205\)|\bdeadlock', re.IGNORECASE)
+DISCONNECT_PATTERN = re.compile(r'\b08S01\b|\b0800[1347]\b|\bHYT01\b|communication link failure|tcp provider|'
+                                r'login timeout expired|connection is closed|unable to connect|unable to open database|'
+                                r'\(1005[34]\)|\(233\)', re.IGNORECASE)
+
+
+def classify_error(errors):
+    """
+    :param errors: Cursor errors ([code, message]), an exception or a message
+    :return: (deadlock, disconnect or None) Class of a transient error
+    """
+
+    if not errors:
+        return None
+
+    if isinstance(errors, (list, tuple)):
+        text = ' '.join(str(e) for e in errors)
+    else:
+        text = str(errors)
+
+    if DEADLOCK_PATTERN.search(text):
+        return 'deadlock'
+    elif DISCONNECT_PATTERN.search(text):
+        return 'disconnect'
+
+    return None
+
+
+def is_disconnect(errors):
+    """
+    :param errors: Cursor errors ([code, message]), an exception or a message
+    :return: (True/False) if the connection that raised errors is dead and must not be re-used
+    """
+
+    return classify_error(errors) == 'disconnect'
+
+
+class RetryingCursor(object):
+    """
+    Stands in for a queued statement in SQLEngineClass's cursor queue across all of its retry attempts, so waiters see
+    the statement complete once, when its last attempt finished. Only the last attempt is added to cursor_results
+    """
+
+    def __init__(self):
+        self.cursor_id = sum(map(ord, str(os.urandom(100))))
+        self.cursor = None
+        self.attempts = list()
+        self.held = list()
+        self.future = None
+        self.closed = False
+
+    @property
+    def cursor_action(self):
+        """
+        :return: Returns cursor action of the running attempt
+        """
+
+        return self.cursor.cursor_action if self.cursor is not None else None
+
+    @property
+    def is_pending(self):
+        """
+        :return: Returns True/False when an attempt is running or waiting to be retried
+        """
+
+        return self.future is None or not self.future.done()
+
+    def result(self):
+        """
+        :return: Cursor of the last attempt, None when the statement could not be submitted
+        """
+
+        if self.future is None or not self.future.done() or self.future.cancelled() or self.future.exception():
+            return None
+
+        return self.future.result()
+
+    def close(self, write_log=True):
+        """
+        Closes the running attempt and stops later retries
+
+        :param write_log: (True/False) Enables logging
+        """
+
+        self.closed = True
+
+        if self.cursor is not None:
+            self.cursor.close(write_log=write_log)
+
+    def __repr__(self):
+        return '%s(%s, attempts=%s)' % (self.__class__.__name__, self.cursor_id, len(self.attempts))
+
+
+class RetryPolicy(object):
+    """
+    Retry policy for transient SQL errors. Deadlock victims are rolled back by the server so they are always safe to
+    run again. Dropped connections and login timeouts are only retried for idempotent work, since a statement may
+    have been applied before the link dropped. Attempts back off exponentially with full jitter
+    """
+
+    DEFAULT_MAX_ATTEMPTS = 3
+    DEFAULT_BASE_DELAY = 0.5
+    DEFAULT_MAX_DELAY = 30
+
+    def __init__(self, max_attempts=DEFAULT_MAX_ATTEMPTS, base_delay=DEFAULT_BASE_DELAY, max_delay=DEFAULT_MAX_DELAY,
+                 jitter=True, retry_on=('deadlock', 'disconnect')):
+        """
+        :param max_attempts: [Optional] Attempts including the first one
+        :param base_delay: [Optional] Seconds to wait before the second attempt, doubled for every later attempt
+        :param max_delay: [Optional] Upper limit of seconds between attempts
+        :param jitter: [Optional] (True/False) Wait a random time up to the backoff delay so retries do not align
+        :param retry_on: [Optional] Error classes retried (deadlock, disconnect)
+        """
+
+        if max_attempts < 1:
+            raise ValueError("'max_attempts' %r must be a positive number" % max_attempts)
+        if base_delay < 0 or max_delay < 0:
+            raise ValueError("'base_delay' and 'max_delay' must be non-negative numbers")
+
+        self.__max_attempts = max_attempts
+        self.__base_delay = base_delay
+        self.__max_delay = max_delay
+        self.__jitter = jitter
+        self.__retry_on = frozenset(retry_on)
+
+    @property
+    def max_attempts(self):
+        """
+        :return: Attempts including the first one
+        """
+
+        return self.__max_attempts
+
+    def should_retry(self, errors, attempt, idempotent=False):
+        """
+        :param errors: Cursor errors ([code, message]) or exception of the failed attempt
+        :param attempt: Number of the failed attempt, starting at 1
+        :param idempotent: [Optional] (True/False) if running the work twice is harmless
+        :return: (True/False) if the work should be run again
+        """
+
+        if attempt >= self.__max_attempts:
+            return False
+
+        error_class = classify_error(errors)
+
+        if error_class not in self.__retry_on:
+            return False
+
+        return error_class == 'deadlock' or idempotent
+
+    def delay(self, attempt):
+        """
+        :param attempt: Number of the failed attempt, starting at 1
+        :return: Seconds to wait before the next attempt
+        """
+
+        delay = min(self.__max_delay, self.__base_delay * 2 ** (attempt - 1))
+        return uniform(0, delay) if self.__jitter else delay
+
+    def run(self, attempt_fn, idempotent=False, errors_fn=None):
+        """
+        Runs attempt_fn until it succeeds, fails with a non transient error or runs out of attempts
+
+        :param attempt_fn: Function without arguments that runs one attempt
+        :param idempotent: [Optional] (True/False) if running the work twice is harmless
+        :param errors_fn: [Optional] Function that returns the errors of an attempt's result DEFAULT is result.errors
+        :return: Result of the last attempt
+        """
+
+        from time import sleep
+
+        attempt = 1
+
+        while True:
+            try:
+                result = attempt_fn()
+            except ValueError as e:
+                # Connections that cannot be opened (login timeouts) surface as ValueError
+                if not self.should_retry(e, attempt, idempotent):
+                    raise
+            else:
+                errors = errors_fn(result) if errors_fn else getattr(result, 'errors', None)
+
+                if not self.should_retry(errors, attempt, idempotent):
+                    return result
+
+            delay = self.delay(attempt)
+            log.debug('SQL Retry: Attempt %s failed with a transient error. Retrying in %.2f seconds', attempt, delay)
+            sleep(delay)
+            attempt += 1
+
+    def run_future(self, submit_fn, idempotent=False):
+        """
+        Asynchronous run(). Later attempts are scheduled on a timer instead of blocking a worker while backing off
+
+        :param submit_fn: Function without arguments that submits one attempt and returns its Future
+        :param idempotent: [Optional] (True/False) if running the work twice is harmless
+        :return: Future that resolves to the result of the last attempt
+        """
+
+        outer = Future()
+        outer.set_running_or_notify_cancel()
+
+        def start(attempt):
+            try:
+                inner = submit_fn()
+            except Exception as e:
+                if self.should_retry(e, attempt, idempotent):
+                    schedule(attempt)
+                else:
+                    outer.set_exception(e)
+
+                return
+
+            inner.add_done_callback(lambda f: finished(attempt, f))
+
+        def finished(attempt, inner):
+            if inner.cancelled():
+                outer.set_exception(ValueError("SQL attempt %s was cancelled" % attempt))
+            elif inner.exception() is not None:
+                if self.should_retry(inner.exception(), attempt, idempotent):
+                    schedule(attempt)
+                else:
+                    outer.set_exception(inner.exception())
+            elif self.should_retry(getattr(inner.result(), 'errors', None), attempt, idempotent):
+                schedule(attempt)
+            else:
+                outer.set_result(inner.result())
+
+        def schedule(attempt):
+            delay = self.delay(attempt)
+            log.debug('SQL Retry: Attempt %s failed with a transient error. Retrying in %.2f seconds', attempt, delay)
+            timer = Timer(delay, start, args=(attempt + 1,))
+            timer.daemon = True
+            timer.start()
+
+        start(1)
+        return outer
+
+    def __repr__(self):
+        return '%s(max_attempts=%s, base_delay=%s, max_delay=%s)' % (self.__class__.__name__, self.__max_attempts,
+                                                                     self.__base_delay, self.__max_delay)
@@ -0,0 +1,320 @@
+from __future__ import unicode_literals
+
+from threading import Lock
+from time import monotonic
+from concurrent.futures import Future
+from .retry import is_disconnect
+
+import logging
+
+log = logging.getLogger(__name__)
+
+
+class EngineNode(object):
+    """
+    A SQLEngineClass of a SQLEngineGroup with its load and health counters
+    """
+
+    __slots__ = ("sql_engine", "role", "in_flight", "latency", "failures", "ejected_until", "ejections", "calls",
+                 "errors")
+
+    def __init__(self, sql_engine, role):
+        self.sql_engine = sql_engine
+        self.role = role
+        self.in_flight = 0
+        self.latency = None
+        self.failures = 0
+        self.ejected_until = None
+        self.ejections = 0
+        self.calls = 0
+        self.errors = 0
+
+    def healthy(self, now):
+        return self.ejected_until is None or now >= self.ejected_until
+
+    def as_dict(self, now):
+        return dict(sql_config=str(self.sql_engine.sql_config), role=self.role, in_flight=self.in_flight,
+                    latency=self.latency, failures=self.failures, healthy=self.healthy(now), ejections=self.ejections,
+                    calls=self.calls, errors=self.errors)
+
+
+class SQLEngineGroup(object):
+    """
+    Routes SQL work across a primary SQLConfig and read replicas. Queries go to the healthy replica with the lowest
+    (in-flight cursors + 1) x recent latency and fall back to the next replica, then the primary, when a connection
+    fails. Executed statements, executemany() and uploads always go to the primary. A replica whose connections drop
+    eject_after times in a row is taken out of rotation for cooldown seconds. It rejoins afterwards and is ejected
+    again by its next connection failure
+    """
+
+    DEFAULT_COOLDOWN = 30
+    DEFAULT_EJECT_AFTER = 1
+    LATENCY_WEIGHT = 0.2
+
+    def __init__(self, primary_config, replica_configs=None, cooldown=DEFAULT_COOLDOWN,
+                 eject_after=DEFAULT_EJECT_AFTER, group_id=None, **engine_params):
+        """
+        :param primary_config: SQLConfig instance class of the server that takes writes
+        :param replica_configs: [Optional] List of SQLConfig instance classes of read replicas
+        :param cooldown: [Optional] Seconds an ejected node stays out of rotation
+        :param eject_after: [Optional] Consecutive connection failures that eject a node
+        :param group_id: [Optional] Identifier used for logging
+        :param engine_params: [Optional] SQLEngineClass parameters used for every node (ie conn_max_pool_size,
+        conn_timeout, query_timeout, retry_policy). One SQLResultCache is shared by every node unless result_cache is
+        given, so executed statements on the primary invalidate cached replica reads
+        """
+
+        from .config import SQLConfig
+        from .cache import SQLResultCache
+        from .engine import SQLEngineClass
+
+        replica_configs = list(replica_configs or list())
+
+        for sql_config in [primary_config] + replica_configs:
+            if not isinstance(sql_config, SQLConfig):
+                raise ValueError("'sql_config' %r is not an SQLConfig instance" % sql_config)
+
+        if cooldown < 0:
+            raise ValueError("'cooldown' %r must be a non-negative number" % cooldown)
+        if eject_after < 1:
+            raise ValueError("'eject_after' %r must be a positive number" % eject_after)
+
+        engine_params.setdefault('result_cache', SQLResultCache())
+        self.__group_id = group_id
+        self.__cooldown = cooldown
+        self.__eject_after = eject_after
+        self.__primary = EngineNode(SQLEngineClass(sql_config=primary_config, **engine_params), 'primary')
+        self.__replicas = [EngineNode(SQLEngineClass(sql_config=sql_config, **engine_params), 'replica')
+                           for sql_config in replica_configs]
+        self.__group_lock = Lock()
+
+    @property
+    def primary(self):
+        """
+        :return: SQLEngineClass of the primary
+        """
+
+        return self.__primary.sql_engine
+
+    @property
+    def replicas(self):
+        """
+        :return: List of SQLEngineClass of the replicas
+        """
+
+        return [node.sql_engine for node in self.__replicas]
+
+    @property
+    def stats(self):
+        """
+        :return: List of dictionaries per node of sql_config, role, in_flight, latency (seconds, moving average),
+        failures, healthy, ejections, calls and errors
+        """
+
+        now = monotonic()
+
+        with self.__group_lock:
+            return [node.as_dict(now) for node in [self.__primary] + self.__replicas]
+
+    def route(self, write=False):
+        """
+        Picks the node work would be routed to without tracking the work, ie for SQLEngineClass calls the group does
+        not wrap
+
+        :param write: [Optional] (True/False) Work writes and must go to the primary
+        :return: SQLEngineClass
+        """
+
+        return self.__candidates(write)[0].sql_engine
+
+    def sql_execute(self, query_str, execute=False, queue_cursor=False, route=None, **kwargs):
+        """
+        SQLEngineClass.sql_execute() on the node the statement is routed to
+
+        :param query_str: Query string that is executed to connection
+        :param execute: [Optional] (True/False) Choose to execute or query results. Executed statements go to the
+        primary
+        :param queue_cursor: [Optional] (True/False) Add to multi-thread queue. Queued calls are not failed over
+        :param route: [Optional] (primary/replica) Overrides routing, ie primary for reads that must see a write that
+        was just committed DEFAULT is primary for execute or many and replica otherwise
+        :param kwargs: [Optional] Other SQLEngineClass.sql_execute() parameters
+        :return: Returns Cursor class if queue_cursor is set to False, otherwise a Future that resolves to the Cursor
+        """
+
+        if route not in (None, 'primary', 'replica'):
+            raise ValueError("'route' %r must be either (primary, replica)" % route)
+
+        write = route == 'primary' or (route is None and (execute or kwargs.get('many')))
+        return self.__call(write, queue_cursor, lambda engine: engine.sql_execute(
+            query_str, execute=execute, queue_cursor=queue_cursor, **kwargs))
+
+    def sql_tables(self, queue_cursor=False, **kwargs):
+        """
+        SQLEngineClass.sql_tables() on a replica
+
+        :param queue_cursor: [Optional] (True/False) Add to multi-thread queue
+        :param kwargs: [Optional] Other SQLEngineClass.sql_tables() parameters
+        :return: Returns Cursor class if queue_cursor is set to False, otherwise a Future that resolves to the Cursor
+        """
+
+        return self.__call(False, queue_cursor, lambda engine: engine.sql_tables(queue_cursor=queue_cursor, **kwargs))
+
+    def sql_upload(self, dataframe, table_name, queue_cursor=False, **kwargs):
+        """
+        SQLEngineClass.sql_upload() on the primary
+
+        :param dataframe: Panda's Dataframe or dataset path
+        :param table_name: Table name in destination
+        :param queue_cursor: [Optional] (True/False) Add to multi-thread queue
+        :param kwargs: [Optional] Other SQLEngineClass.sql_upload() parameters
+        :return: Returns Cursor class if queue_cursor is set to False, otherwise a Future that resolves to the Cursor
+        """
+
+        return self.__call(True, queue_cursor, lambda engine: engine.sql_upload(
+            dataframe, table_name, queue_cursor=queue_cursor, **kwargs))
+
+    def execute_batch(self, statements, execute=False, **kwargs):
+        """
+        SQLEngineClass.execute_batch() on the primary when executing, otherwise on a replica
+
+        :param statements: List of query strings or (query string, params) tuples
+        :param execute: [Optional] (True/False) Commit after each statement or only query results
+        :param kwargs: [Optional] Other SQLEngineClass.execute_batch() parameters
+        :return: List of StatementResult in the order of statements
+        """
+
+        return self.__call(execute, False, lambda engine: engine.execute_batch(statements, execute=execute, **kwargs))
+
+    def transaction(self, timeout=None):
+        """
+        SQLEngineClass.transaction() on the primary
+
+        :param timeout: [Optional] Seconds to wait for a pooled connection (None is infinity)
+        :return: SQLTransaction
+        """
+
+        return self.__primary.sql_engine.transaction(timeout=timeout)
+
+    def close_connections(self, enable_log=True):
+        """
+        Closes all cursors and connections of every node
+
+        :param enable_log: (True/False) Enables logging
+        """
+
+        for node in [self.__primary] + self.__replicas:
+            node.sql_engine.close_connections(enable_log=enable_log)
+
+    def __candidates(self, write):
+        # Primary for writes, otherwise healthy replicas by load then the primary as the last resort
+        if write or not self.__replicas:
+            return [self.__primary]
+
+        now = monotonic()
+
+        with self.__group_lock:
+            healthy = [node for node in self.__replicas if node.healthy(now)]
+            healthy.sort(key=lambda node: ((node.in_flight + 1) * max(node.latency or 0.0, 0.001), node.calls))
+
+        return healthy + [self.__primary]
+
+    def __call(self, write, queue_cursor, call_fn):
+        candidates = self.__candidates(write)
+        error = None
+
+        for node in candidates:
+            start = self.__begin(node)
+
+            try:
+                result = call_fn(node.sql_engine)
+            except Exception as e:
+                # Connections that cannot be opened are tried on the next node, other errors are the caller's
+                disconnected = is_disconnect(e)
+                self.__finish(node, start, failed=True, disconnected=disconnected)
+
+                if not disconnected:
+                    raise
+
+                error = e
+                continue
+
+            if isinstance(result, Future):
+                result.add_done_callback(lambda f, n=node, s=start: self.__finish_future(n, s, f))
+                return result
+
+            failed, disconnected = self.__outcome(result)
+            self.__finish(node, start, failed, disconnected)
+
+            if not disconnected or node is candidates[-1]:
+                return result
+
+            log.debug('SQL Engine Group %s: %s dropped its connection. Failing over', self.__group_id,
+                      node.sql_engine.sql_config)
+
+        raise error
+
+    @staticmethod
+    def __outcome(result):
+        if isinstance(result, list):
+            errors = [r.errors for r in result if getattr(r, 'errors', None)]
+        else:
+            errors = getattr(result, 'errors', None)
+
+        return [result is None or bool(errors), is_disconnect(errors)]
+
+    def __begin(self, node):
+        with self.__group_lock:
+            node.in_flight += 1
+            node.calls += 1
+
+        return monotonic()
+
+    def __finish_future(self, node, start, future):
+        if future.cancelled() or future.exception() is not None:
+            self.__finish(node, start, failed=True, disconnected=not future.cancelled() and is_disconnect(
+                future.exception()))
+        else:
+            self.__finish(node, start, *self.__outcome(future.result()))
+
+    def __finish(self, node, start, failed, disconnected):
+        elapsed = monotonic() - start
+
+        with self.__group_lock:
+            node.in_flight -= 1
+
+            if failed:
+                node.errors += 1
+
+            if disconnected:
+                node.failures += 1
+
+                if node.failures >= self.__eject_after and node.role == 'replica':
+                    node.ejected_until = monotonic() + self.__cooldown
+                    node.ejections += 1
+                    log.warning('SQL Engine Group %s: Ejected replica %s for %s seconds', self.__group_id,
+                                node.sql_engine.sql_config, self.__cooldown)
+            else:
+                node.failures = 0
+                node.ejected_until = None
+
+                if node.latency is None:
+                    node.latency = elapsed
+                else:
+                    node.latency += self.LATENCY_WEIGHT * (elapsed - node.latency)
+
+    def __getstate__(self):
+        # The lock cannot be pickled
+        state = self.__dict__.copy()
+        del state['_SQLEngineGroup__group_lock']
+        return state
+
+    def __setstate__(self, state):
+        # Restore the lock
+        self.__dict__.update(state)
+        self.__group_lock = Lock()
+
+    def __len__(self):
+        return len(self.__replicas) + 1
+
+    def __repr__(self):
+        return '%s(%s, replicas=%s)' % (self.__class__.__name__, self.__group_id, len(self.__replicas))
@@ -0,0 +1,154 @@
+from __future__ import unicode_literals
+
+from threading import Lock
+from collections import OrderedDict
+
+import logging
+
+log = logging.getLogger(__name__)
+
+
+class SQLStatementCache(object):
+    """
+    Client side cache of prepared statements keyed by connection and SQL text. ODBC drivers keep the last statement
+    prepared on a cursor and skip the prepare step when the same SQL text is executed again on it, so holding one open
+    cursor per statement per pooled connection lets repeated parameterized statements re-use their prepared handle.
+    Least recently used cursors are closed once max_statements is reached
+    """
+
+    DEFAULT_MAX_STATEMENTS = 100
+
+    def __init__(self, max_statements=DEFAULT_MAX_STATEMENTS):
+        """
+        :param max_statements: [Optional] Maximum prepared cursors kept open across all connections
+        """
+
+        if max_statements < 1:
+            raise ValueError("'max_statements' %r must be a positive number" % max_statements)
+
+        self.__max_statements = max_statements
+        self.__cursors = OrderedDict()
+        self.__hits = 0
+        self.__misses = 0
+        self.__cache_lock = Lock()
+
+    @property
+    def max_statements(self):
+        """
+        :return: Maximum prepared cursors kept open
+        """
+
+        return self.__max_statements
+
+    @property
+    def hits(self):
+        """
+        :return: Number of checkouts that re-used a prepared cursor
+        """
+
+        return self.__hits
+
+    @property
+    def misses(self):
+        """
+        :return: Number of checkouts that had no prepared cursor
+        """
+
+        return self.__misses
+
+    def checkout(self, engine, query_str):
+        """
+        Borrow the prepared cursor of a statement. The cursor is removed from the cache until checkin()
+
+        :param engine: Connection the statement was prepared on
+        :param query_str: SQL statement text
+        :return: DB-API cursor or None when the statement is not prepared on engine
+        """
+
+        with self.__cache_lock:
+            entry = self.__cursors.pop((id(engine), query_str), None)
+
+            if entry is None:
+                self.__misses += 1
+                return None
+
+            self.__hits += 1
+            return entry[1]
+
+    def checkin(self, engine, query_str, cursor):
+        """
+        Return a cursor that has executed query_str so the prepared statement can be re-used
+
+        :param engine: Connection the cursor belongs to
+        :param query_str: SQL statement text
+        :param cursor: DB-API cursor
+        """
+
+        evicted = list()
+
+        with self.__cache_lock:
+            key = (id(engine), query_str)
+
+            if key in self.__cursors:
+                evicted.append(self.__cursors.pop(key))
+
+            # The connection is held with its cursor so its id cannot be re-used while the entry is cached
+            self.__cursors[key] = (engine, cursor)
+
+            while len(self.__cursors) > self.__max_statements:
+                evicted.append(self.__cursors.popitem(last=False)[1])
+
+        self.__close_cursors(evicted)
+
+    def discard(self, engine):
+        """
+        Closes every prepared cursor of a connection. Must be called before the connection is closed
+
+        :param engine: Connection
+        """
+
+        with self.__cache_lock:
+            keys = [key for key in self.__cursors.keys() if key[0] == id(engine)]
+            evicted = [self.__cursors.pop(key) for key in keys]
+
+        if evicted:
+            log.debug('SQL Statement Cache: Closing %s prepared statements', len(evicted))
+
+        self.__close_cursors(evicted)
+
+    def clear(self):
+        """
+        Closes every prepared cursor
+        """
+
+        with self.__cache_lock:
+            evicted = list(self.__cursors.values())
+            self.__cursors.clear()
+
+        self.__close_cursors(evicted)
+
+    @staticmethod
+    def __close_cursors(entries):
+        for engine, cursor in entries:
+            try:
+                cursor.close()
+            except:
+                pass
+
+    def __getstate__(self):
+        # Open cursors and the lock cannot be pickled
+        state = self.__dict__.copy()
+        state['_SQLStatementCache__cursors'] = OrderedDict()
+        del state['_SQLStatementCache__cache_lock']
+        return state
+
+    def __setstate__(self, state):
+        # Restore the lock
+        self.__dict__.update(state)
+        self.__cache_lock = Lock()
+
+    def __len__(self):
+        return len(self.__cursors)
+
+    def __repr__(self):
+        return '%s(size=%s, max=%s)' % (self.__class__.__name__, len(self.__cursors), self.__max_statements)
@@ -0,0 +1,177 @@
+from __future__ import unicode_literals
+
+from threading import Lock
+from time import monotonic
+
+import logging
+
+log = logging.getLogger(__name__)
+slow_log = logging.getLogger(__name__ + '.slow')
+
+
+class CursorStats(object):
+    """
+    Timings in seconds of one cursor action, split so the time spent waiting for a worker, on the server, on the
+    network and in pandas can be told apart
+    """
+
+    __slots__ = ("action", "query_str", "spid", "queue_wait", "connect", "execute", "fetch", "build", "rows", "bytes",
+                 "total", "errors", "started", "run_started")
+
+    PHASES = ('queue_wait', 'connect', 'execute', 'fetch', 'build')
+
+    def __init__(self, action=None, query_str=None, spid=None, connect=0.0):
+        """
+        :param action: [Optional] Cursor action (execute, tables, upload_df)
+        :param query_str: [Optional] Query string or table name
+        :param spid: [Optional] SPID of the connection the action ran on
+        :param connect: [Optional] Seconds spent acquiring the connection before the cursor was created
+        """
+
+        self.action = action
+        self.query_str = query_str
+        self.spid = spid
+        self.queue_wait = 0.0
+        self.connect = connect
+        self.execute = 0.0
+        self.fetch = 0.0
+        self.build = 0.0
+        self.rows = 0
+        self.bytes = 0
+        self.total = None
+        self.errors = None
+        self.started = monotonic() - connect
+        self.run_started = None
+
+    def mark_run(self):
+        """
+        Records the queue wait of a queued cursor once a worker starts running it
+        """
+
+        self.run_started = monotonic()
+        self.queue_wait = self.run_started - self.started - self.connect
+
+    def finish(self, errors=None):
+        """
+        :param errors: [Optional] Errors of the cursor action
+        :return: Total seconds from connection checkout until the cursor closed
+        """
+
+        self.errors = errors
+        self.total = monotonic() - self.started
+        return self.total
+
+    def as_dict(self):
+        """
+        :return: Dictionary of the recorded timings and counters
+        """
+
+        return dict((k, getattr(self, k)) for k in self.__slots__ if k not in ('started', 'run_started'))
+
+    def __repr__(self):
+        return '%s(%s, total=%s, rows=%s)' % (self.__class__.__name__, self.action, self.total, self.rows)
+
+
+class QueryStats(object):
+    """
+    Running totals of CursorStats for one SQLEngineClass. Actions that take slow_query_threshold seconds or longer are
+    written to the dedicated KGlobal.sql.stats.slow logger with their phase timings
+    """
+
+    def __init__(self, slow_query_threshold=None, stats_id=None):
+        """
+        :param slow_query_threshold: [Optional] Seconds an action must take to be logged as slow (None disables)
+        :param stats_id: [Optional] Identifier used for logging
+        """
+
+        self.slow_query_threshold = slow_query_threshold
+        self.__stats_id = stats_id
+        self.__stats_lock = Lock()
+        self.__totals = self.__empty()
+
+    @property
+    def slow_query_threshold(self):
+        """
+        :return: Seconds an action must take to be logged as slow or None
+        """
+
+        return self.__slow_query_threshold
+
+    @slow_query_threshold.setter
+    def slow_query_threshold(self, slow_query_threshold):
+        if slow_query_threshold is not None and slow_query_threshold < 0:
+            raise ValueError("'slow_query_threshold' %r must be a non-negative number" % slow_query_threshold)
+
+        self.__slow_query_threshold = slow_query_threshold
+
+    def record(self, stats):
+        """
+        :param stats: Finished CursorStats
+        """
+
+        slow = self.__slow_query_threshold is not None and stats.total >= self.__slow_query_threshold
+
+        with self.__stats_lock:
+            totals = self.__totals
+            totals['actions'] += 1
+            totals['errors'] += 1 if stats.errors else 0
+            totals['slow'] += 1 if slow else 0
+            totals['rows'] += stats.rows
+            totals['bytes'] += stats.bytes
+            totals['total'] += stats.total
+            totals['max_total'] = max(totals['max_total'], stats.total)
+
+            for phase in CursorStats.PHASES:
+                totals[phase] += getattr(stats, phase)
+
+        if slow:
+            query_str = ' '.join(str(stats.query_str or '').split())
+
+            slow_log.warning('SQL Engine %s: Slow %s on SPID %s took %.3fs (queue_wait %.3fs, connect %.3fs, '
+                             'execute %.3fs, fetch %.3fs, build %.3fs, rows %s, bytes %s) %s',
+                             self.__stats_id, stats.action, stats.spid, stats.total, stats.queue_wait, stats.connect,
+                             stats.execute, stats.fetch, stats.build, stats.rows, stats.bytes, query_str[:500])
+
+    def snapshot(self):
+        """
+        :return: Dictionary of actions, errors, slow, rows, bytes, summed phase and total seconds, max_total and the
+        average seconds per action of each phase (avg_<phase>)
+        """
+
+        with self.__stats_lock:
+            totals = dict(self.__totals)
+
+        actions = totals['actions'] or 1
+
+        for phase in CursorStats.PHASES + ('total',):
+            totals['avg_' + phase] = totals[phase] / actions
+
+        return totals
+
+    def reset(self):
+        """
+        Clears the running totals
+        """
+
+        with self.__stats_lock:
+            self.__totals = self.__empty()
+
+    @staticmethod
+    def __empty():
+        totals = dict(actions=0, errors=0, slow=0, rows=0, bytes=0, total=0.0, max_total=0.0)
+        totals.update((phase, 0.0) for phase in CursorStats.PHASES)
+        return totals
+
+    def __getstate__(self):
+        # The lock cannot be pickled
+        state = self.__dict__.copy()
+        del state['_QueryStats__stats_lock']
+        return state
+
+    def __setstate__(self, state):
+        # Restore the lock
+        self.__dict__.update(state)
+        self.__stats_lock = Lock()
+
+    def __repr__(self):
+        return '%s(%s, actions=%s)' % (self.__class__.__name__, self.__stats_id, self.__totals['actions'])
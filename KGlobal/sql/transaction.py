@@ -0,0 +1,485 @@
+from __future__ import unicode_literals
+
+from time import monotonic
+from .batch import StatementResult, collect_results
+from .cache import query_tables
+from .retry import is_disconnect
+
+import re
+import logging
+
+log = logging.getLogger(__name__)
+
+SAVEPOINT_NAME = re.compile(r'^[A-Za-z_][A-Za-z0-9_]{0,31}$')
+
+
+class SQLSavepoint(object):
+    """
+    A named savepoint of a SQLTransaction. Leaving its with block releases it. An exception rolls back the work done
+    since the savepoint, keeps the work done before it and is re-raised
+    """
+
+    def __init__(self, transaction, name):
+        """
+        :param transaction: SQLTransaction the savepoint was created in
+        :param name: Savepoint name
+        """
+
+        self.__transaction = transaction
+        self.__name = name
+        self.__active = True
+
+    @property
+    def name(self):
+        """
+        :return: Savepoint name
+        """
+
+        return self.__name
+
+    @property
+    def active(self):
+        """
+        :return: (True/False) if the savepoint was neither released nor rolled back
+        """
+
+        return self.__active
+
+    def release(self):
+        """
+        Keeps the work done since the savepoint as part of the transaction. Savepoints nested inside it are released
+        as well
+        """
+
+        if self.__active:
+            self.__transaction.release_savepoint(self)
+
+    def rollback(self):
+        """
+        Undoes the work done since the savepoint. Savepoints nested inside it are rolled back as well
+        """
+
+        if self.__active:
+            self.__transaction.rollback_savepoint(self)
+
+    def end(self):
+        # Called by SQLTransaction once the savepoint was released or rolled back
+        self.__active = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.release()
+        elif self.__active and self.__transaction.active:
+            self.rollback()
+
+        return False
+
+    def __repr__(self):
+        return '%s(%s, active=%s)' % (self.__class__.__name__, self.__name, self.__active)
+
+
+class SQLTransaction(object):
+    """
+    Pins one pooled connection so any number of statements and uploads share a single transaction that is committed
+    once. Leaving the with block commits, an exception rolls everything back. Savepoints can be nested to undo part
+    of the work without giving up the rest
+    """
+
+    SAVEPOINT_STATEMENTS = {
+        'mssql': ('SAVE TRANSACTION {0}', None, 'ROLLBACK TRANSACTION {0}'),
+        'sqlite': ('SAVEPOINT {0}', 'RELEASE SAVEPOINT {0}', 'ROLLBACK TO SAVEPOINT {0}'),
+        'postgresql': ('SAVEPOINT {0}', 'RELEASE SAVEPOINT {0}', 'ROLLBACK TO SAVEPOINT {0}'),
+        'mysql': ('SAVEPOINT {0}', 'RELEASE SAVEPOINT {0}', 'ROLLBACK TO SAVEPOINT {0}'),
+    }
+
+    # SQL Server runs pyodbc connections with implicit transactions, which SAVE TRANSACTION does not open. Reading a
+    # table does, so the transaction is opened before the first savepoint
+    MSSQL_OPEN_TRANSACTION = 'IF @@TRANCOUNT = 0 SELECT TOP 0 1 FROM sys.objects'
+
+    def __init__(self, engine_class, timeout=None):
+        """
+        :param engine_class: SQLEngineClass instance whose connection pool the connection is borrowed from
+        :param timeout: [Optional] Seconds to wait for a pooled connection (None is infinity)
+        """
+
+        self.__engine_class = engine_class
+        self.__timeout = timeout
+        self.__engine = None
+        self.__spid = None
+        self.__raw_engine = None
+        self.__owns_raw = False
+        self.__alch_tx = None
+        self.__cursor = None
+        self.__dialect = None
+        self.__savepoints = list()
+        self.__savepoint_count = 0
+        self.__tables = set()
+        self.__results = list()
+        self.__disconnected = False
+        self.__started = None
+
+    @property
+    def active(self):
+        """
+        :return: (True/False) if the transaction holds a connection and was neither committed nor rolled back
+        """
+
+        return self.__engine is not None
+
+    @property
+    def spid(self):
+        """
+        :return: SPID of the pinned connection
+        """
+
+        return self.__spid
+
+    @property
+    def engine(self):
+        """
+        :return: Pinned SQLAlchemy Connection or PYODBC Connection
+        """
+
+        return self.__engine
+
+    @property
+    def dialect(self):
+        """
+        :return: Dialect name of the pinned connection (mssql, sqlite, access, ...)
+        """
+
+        return self.__dialect
+
+    @property
+    def results(self):
+        """
+        :return: List of StatementResult of every execute() in the order they ran
+        """
+
+        return self.__results
+
+    @property
+    def savepoints(self):
+        """
+        :return: List of active savepoints, outermost first
+        """
+
+        return list(self.__savepoints)
+
+    def begin(self):
+        """
+        Borrows a connection from the pool and opens the transaction on it
+
+        :return: SQLTransaction
+        """
+
+        from .engine import raw_connection, dbapi_connection
+
+        if self.active:
+            raise ValueError("Transaction on SPID %s is already open" % self.__spid)
+
+        self.__engine, self.__spid = self.__engine_class.conn_pool.checkout(timeout=self.__timeout)
+        self.__started = monotonic()
+
+        try:
+            self.__raw_engine, self.__owns_raw = raw_connection(self.__engine)
+
+            if hasattr(self.__engine, 'begin') and hasattr(self.__engine, 'dialect'):
+                # An open SQLAlchemy transaction keeps DataFrame.to_sql() from committing on its own
+                if self.__engine.in_transaction():
+                    self.__engine.rollback()
+
+                self.__alch_tx = self.__engine.begin()
+                self.__dialect = self.__engine.dialect.name
+            elif self.__engine_class.sql_config.config_type == 'accdb':
+                self.__dialect = 'access'
+            else:
+                self.__dialect = 'mssql'
+
+            self.__cursor = self.__raw_engine.cursor()
+
+            # sqlite3 opens transactions lazily before DML, so a savepoint would otherwise start and end its own
+            if self.__dialect == 'sqlite' and not getattr(dbapi_connection(self.__engine), 'in_transaction', True):
+                self.__cursor.execute('BEGIN')
+        except:
+            self.__release(failed=True)
+            raise
+
+        log.debug('SQL Transaction: Opened on SPID %s', self.__spid)
+        return self
+
+    def execute(self, query_str, params=None, many=False, columnar=True):
+        """
+        Runs a statement inside the transaction. Errors are raised so the with block rolls back
+
+        :param query_str: SQL query string
+        :param params: [Optional] Bind parameters for the placeholders in query_str, or a list of parameter sets when
+        many is True
+        :param many: [Optional] (True/False) executemany() query_str once per parameter set in params
+        :param columnar: [Optional] (True/False) Build result DataFrames from typed column arrays
+        :return: StatementResult with result DataFrames, rowcount and elapsed seconds
+        """
+
+        self.__check_active()
+
+        if not isinstance(query_str, str):
+            raise ValueError("'query_str' %r is not a String" % query_str)
+        if many and params is None:
+            raise ValueError("'params' must be provided when many is True")
+
+        result = StatementResult(len(self.__results), query_str, params)
+        result.spid = self.__spid
+        self.__results.append(result)
+        start = monotonic()
+
+        try:
+            if many:
+                if hasattr(self.__cursor, 'fast_executemany'):
+                    self.__cursor.fast_executemany = True
+
+                self.__cursor.executemany(query_str, params)
+                result.rowcount = self.__cursor.rowcount
+            else:
+                if params is None:
+                    self.__cursor.execute(query_str)
+                else:
+                    self.__cursor.execute(query_str, params)
+
+                result.rowcount = collect_results(self.__cursor, result, columnar=columnar)
+
+            result.status = 'ok'
+        except Exception as e:
+            result.errors = [type(e).__name__, str(e)]
+            result.status = 'error'
+            self.__disconnected = self.__disconnected or is_disconnect(e)
+            raise
+        finally:
+            result.elapsed = monotonic() - start
+
+        self.__tables.update(query_tables(query_str))
+        return result
+
+    def upload(self, dataframe, table_name, table_schema=None, if_exists='append', index=True, index_label='ID',
+               method='fast_executemany', chunksize=None, stage_dir=None, mode='insert', keys=None):
+        """
+        Uploads a pandas DataFrame inside the transaction (alchemy only)
+
+        :param dataframe: pandas DataFrame
+        :param table_name: SQL table name
+        :param table_schema: [Optional] SQL table schema
+        :param if_exists: [Optional] (append/replace) If table exists, should I append or replace table?
+        :param index: [Optional] (True/False) Upload DataFrame index as column(s)
+        :param index_label: [Optional] Index column name
+        :param method: [Optional] (None/fast_executemany/multirow/csv) Insert method. None uses DataFrame.to_sql()
+        :param chunksize: [Optional] Fixed rows per round trip. DEFAULT is adaptive for bulk methods
+        :param stage_dir: [Optional] (csv only) Directory for staged csv files. Must be readable by the SQL server
+        :param mode: [Optional] (insert/upsert) upsert merges rows into the table by keys
+        :param keys: [Optional] (upsert only) Column name or list of column names that identify a row
+        :return: Number of rows inserted, or dictionary of inserted, updated and unchanged rows for upsert
+        """
+
+        from .upload import BulkUploader, UpsertUploader
+
+        self.__check_active()
+
+        if self.__alch_tx is None:
+            raise ValueError("Uploads require an alchemy engine. %s is a pyodbc connection" % self.__dialect)
+        if mode not in ('insert', 'upsert'):
+            raise ValueError("'mode' %r must be either (insert, upsert)" % mode)
+        if mode == 'upsert' and (not keys or if_exists == 'replace'):
+            raise ValueError("mode 'upsert' requires 'keys' and cannot be combined with if_exists replace")
+
+        try:
+            if mode == 'upsert':
+                rows = UpsertUploader(self.__engine, dataframe, table_name, keys, table_schema=table_schema,
+                                      index=index, index_label=index_label, method=method or 'fast_executemany',
+                                      chunksize=chunksize, stage_dir=stage_dir, commit=False).upload()
+            elif method:
+                rows = BulkUploader(self.__engine, dataframe, table_name, table_schema=table_schema,
+                                    if_exists=if_exists, index=index, index_label=index_label, method=method,
+                                    chunksize=chunksize, stage_dir=stage_dir, commit=False).upload()
+            else:
+                dataframe.to_sql(table_name, self.__engine, schema=table_schema, if_exists=if_exists, index=index,
+                                 index_label=index_label, chunksize=chunksize or 1000)
+                rows = len(dataframe)
+        except Exception as e:
+            self.__disconnected = self.__disconnected or is_disconnect(e)
+            raise
+
+        self.__tables.add(table_name)
+        return rows
+
+    def savepoint(self, name=None):
+        """
+        Marks a point the transaction can be rolled back to. Use as a with block or call release() or rollback()
+
+        :param name: [Optional] Savepoint name DEFAULT is kg_sp_<n>
+        :return: SQLSavepoint
+        """
+
+        self.__check_active()
+        statements = self.SAVEPOINT_STATEMENTS.get(self.__dialect)
+
+        if statements is None:
+            raise ValueError("Savepoints are not supported for %s. Supported (%s)"
+                             % (self.__dialect, ', '.join(self.SAVEPOINT_STATEMENTS)))
+
+        self.__savepoint_count += 1
+        name = name or 'kg_sp_%s' % self.__savepoint_count
+
+        if not SAVEPOINT_NAME.match(name):
+            raise ValueError("'name' %r must be a letter or underscore followed by up to 31 letters, digits or "
+                             "underscores" % name)
+        if any(sp.name == name for sp in self.__savepoints):
+            raise ValueError("Savepoint %r is already active" % name)
+
+        if self.__dialect == 'mssql':
+            self.__cursor.execute(self.MSSQL_OPEN_TRANSACTION)
+
+        self.__cursor.execute(statements[0].format(name))
+        savepoint = SQLSavepoint(self, name)
+        self.__savepoints.append(savepoint)
+        return savepoint
+
+    def release_savepoint(self, savepoint):
+        """
+        :param savepoint: Active SQLSavepoint of this transaction
+        """
+
+        inner = self.__unwind(savepoint)
+        release = self.SAVEPOINT_STATEMENTS[self.__dialect][1]
+
+        if release:
+            self.__cursor.execute(release.format(savepoint.name))
+
+        for sp in inner:
+            sp.end()
+
+    def rollback_savepoint(self, savepoint):
+        """
+        :param savepoint: Active SQLSavepoint of this transaction
+        """
+
+        inner = self.__unwind(savepoint)
+        statements = self.SAVEPOINT_STATEMENTS[self.__dialect]
+        self.__cursor.execute(statements[2].format(savepoint.name))
+
+        if statements[1]:
+            self.__cursor.execute(statements[1].format(savepoint.name))
+
+        for sp in inner:
+            sp.end()
+
+        log.debug('SQL Transaction: Rolled back to savepoint %s on SPID %s', savepoint.name, self.__spid)
+
+    def commit(self):
+        """
+        Commits every statement and upload of the transaction and returns the connection to the pool
+        """
+
+        self.__check_active()
+
+        try:
+            if self.__alch_tx is not None:
+                self.__alch_tx.commit()
+            else:
+                self.__raw_engine.commit()
+        except Exception as e:
+            self.__disconnected = self.__disconnected or is_disconnect(e)
+            self.rollback()
+            raise
+
+        log.debug('SQL Transaction: Committed %s statements on SPID %s in %.3f seconds', len(self.__results),
+                  self.__spid, monotonic() - self.__started)
+
+        for table_name in self.__tables:
+            self.__engine_class.invalidate_cache(table_name)
+
+        self.__release()
+
+    def rollback(self):
+        """
+        Rolls back every statement and upload of the transaction and returns the connection to the pool
+        """
+
+        if not self.active:
+            return
+
+        try:
+            if self.__alch_tx is not None:
+                self.__alch_tx.rollback()
+            else:
+                self.__raw_engine.rollback()
+        except Exception as e:
+            log.debug('SQL Transaction: Rollback on SPID %s failed. %s', self.__spid, e)
+            self.__disconnected = True
+
+        log.debug('SQL Transaction: Rolled back on SPID %s', self.__spid)
+        self.__release(failed=True)
+
+    def __unwind(self, savepoint):
+        # Pops savepoint and the savepoints nested inside it off the stack
+        self.__check_active()
+
+        if savepoint not in self.__savepoints:
+            raise ValueError("Savepoint %r is not active in this transaction" % savepoint.name)
+
+        index = self.__savepoints.index(savepoint)
+        inner = self.__savepoints[index:]
+        del self.__savepoints[index:]
+        return inner
+
+    def __check_active(self):
+        if not self.active:
+            raise ValueError("Transaction is not open. Use it as a with block or call begin()")
+
+    def __release(self, failed=False):
+        from .engine import invalidate_engine
+
+        for sp in self.__savepoints:
+            sp.end()
+
+        if self.__cursor is not None:
+            try:
+                self.__cursor.close()
+            except:
+                pass
+
+        if self.__owns_raw and self.__raw_engine is not None:
+            try:
+                self.__raw_engine.close()
+            except:
+                pass
+
+        if self.__engine is not None:
+            if self.__disconnected:
+                invalidate_engine(self.__engine)
+
+            self.__engine_class.conn_pool.checkin(self.__engine, validate=failed, discard=self.__disconnected)
+
+        self.__engine = None
+        self.__raw_engine = None
+        self.__alch_tx = None
+        self.__cursor = None
+        self.__savepoints = list()
+
+    def __enter__(self):
+        return self.begin()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if not self.active:
+            return False
+
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+
+        return False
+
+    def __repr__(self):
+        return '%s(spid=%s, active=%s, statements=%s)' % (self.__class__.__name__, self.__spid, self.active,
+                                                          len(self.__results))
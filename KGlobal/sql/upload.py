@@ -0,0 +1,974 @@
+from __future__ import unicode_literals
+
+from pandas import DataFrame
+from concurrent.futures import Future
+from threading import Lock
+from pandas.api.types import is_datetime64_any_dtype
+from itertools import islice
+from numbers import Number
+from time import monotonic
+
+import numpy as np
+import tempfile
+import logging
+import re
+import os
+
+log = logging.getLogger(__name__)
+
+DATASET_BATCH_ROWS = 100000
+CSV_FIELD = re.compile(r'(?:"((?:[^"]|"")*)"|([^,"\n]*))(,|\n)')
+
+
+def upload_frame(dataframe, index=True, index_label='ID'):
+    """
+    :param dataframe: pandas DataFrame
+    :param index: [Optional] (True/False) Include DataFrame index as column(s)
+    :param index_label: [Optional] Index column name
+    :return: DataFrame laid out the way DataFrame.to_sql() writes it to a table
+    """
+
+    if index:
+        frame = dataframe.reset_index()
+
+        if index_label is not None and dataframe.index.nlevels == 1:
+            frame = frame.rename(columns={frame.columns[0]: index_label})
+
+        return frame
+    else:
+        return dataframe
+
+
+def is_dataset_source(source):
+    """
+    :param source: Object passed as the dataframe of an upload
+    :return: (True/False) if source is a Parquet/Arrow file or directory path or a pyarrow Dataset
+    """
+
+    return isinstance(source, str) or (hasattr(source, 'to_batches') and not isinstance(source, DataFrame))
+
+
+def csv_field(value):
+    """
+    :param value: Python value of an upload record
+    :return: Staged csv field. NULL is a bare empty field, text is always quoted so '' is written as ""
+    """
+
+    if value is None:
+        return ''
+    elif isinstance(value, (bool, np.bool_)):
+        return '1' if value else '0'
+    elif isinstance(value, Number):
+        return repr(value) if isinstance(value, float) else str(value)
+    else:
+        return '"%s"' % str(value).replace('"', '""')
+
+
+def iter_csv_rows(f):
+    """
+    Reads back a csv file written with csv_field(). Unquoted fields are numbers or NULL, quoted fields are text
+
+    :param f: Text file opened with newline=''
+    :return: Iterator of row lists with NULLs as None and numbers as int/float
+    """
+
+    record = ''
+
+    for line in f:
+        record += line
+
+        # Quotes inside text are doubled, so an odd count means a quoted field runs on to the next line
+        if record.count('"') % 2:
+            continue
+
+        row, pos = list(), 0
+
+        while pos < len(record):
+            match = CSV_FIELD.match(record, pos)
+
+            if match is None:
+                raise ValueError("Staged csv record %r is malformed at position %s" % (record, pos))
+
+            text, bare, sep = match.groups()
+
+            if text is not None:
+                row.append(text.replace('""', '"'))
+            elif not bare:
+                row.append(None)
+            else:
+                try:
+                    row.append(int(bare))
+                except ValueError:
+                    row.append(float(bare))
+
+            pos = match.end()
+
+            if sep == '\n':
+                break
+
+        record = ''
+        yield row
+
+
+def iter_dataset_frames(source, batch_rows=DATASET_BATCH_ROWS):
+    """
+    Reads a columnar dataset one record batch at a time so it is never fully held in memory. Always yields at least
+    one (possibly empty) DataFrame so the schema reaches the destination table
+
+    :param source: Parquet file, Arrow IPC/Feather file, directory of them or pyarrow Dataset
+    :param batch_rows: [Optional] Maximum rows per DataFrame
+    :return: Iterator of DataFrames indexed by their row position in the dataset
+    """
+
+    try:
+        import pyarrow.dataset as ds
+    except ImportError:
+        raise ValueError("Uploading a Parquet or Arrow dataset requires the pyarrow package")
+
+    if isinstance(source, str):
+        if not os.path.exists(source):
+            raise ValueError("'dataframe' path %r does not exist" % source)
+
+        dataset_format = 'ipc' if source.lower().endswith(('.arrow', '.feather', '.ipc')) else 'parquet'
+        source = ds.dataset(source, format=dataset_format)
+
+    row_start = 0
+
+    for batch in source.to_batches(batch_size=batch_rows):
+        if not batch.num_rows:
+            continue
+
+        frame = batch.to_pandas()
+        frame.index = range(row_start, row_start + len(frame))
+        row_start += len(frame)
+        yield frame
+
+    if not row_start:
+        yield source.schema.empty_table().to_pandas()
+
+
+class AdaptiveChunker(object):
+    """
+    Picks the number of rows per round trip. The first chunk is sized from the column count, later chunks are
+    resized so each round trip takes roughly target_seconds
+    """
+
+    DEFAULT_TARGET_SECONDS = 1.0
+    DEFAULT_TARGET_PARAMS = 20000
+
+    def __init__(self, column_count, max_rows=None, min_rows=1, chunksize=None, target_seconds=DEFAULT_TARGET_SECONDS,
+                 target_params=DEFAULT_TARGET_PARAMS):
+        """
+        :param column_count: Number of columns (parameters) per row
+        :param max_rows: [Optional] Hard limit of rows per chunk (ie driver parameter limit)
+        :param min_rows: [Optional] Smallest chunk size allowed
+        :param chunksize: [Optional] Fixed chunk size, disables adaptive sizing
+        :param target_seconds: [Optional] Wall clock seconds each round trip should take
+        :param target_params: [Optional] Number of parameters in the first chunk
+        """
+
+        column_count = max(column_count, 1)
+        self.__max_rows = max_rows
+        self.__min_rows = min_rows
+        self.__fixed = chunksize
+        self.__target_seconds = target_seconds
+        self.__size = self.__clamp(chunksize or target_params // column_count)
+
+    @property
+    def size(self):
+        """
+        :return: Number of rows to send in the next chunk
+        """
+
+        return self.__size
+
+    def record(self, rows, elapsed):
+        """
+        Resizes the next chunk from the measured round trip time of the last chunk
+
+        :param rows: Number of rows sent in the last chunk
+        :param elapsed: Seconds the last chunk took
+        """
+
+        if self.__fixed or rows < self.__size or elapsed <= 0:
+            return
+
+        # Damp growth so a single fast round trip does not explode the chunk size
+        factor = min(max(self.__target_seconds / elapsed, 0.5), 2.0)
+        self.__size = self.__clamp(int(self.__size * factor))
+
+    def __clamp(self, size):
+        size = max(size, self.__min_rows)
+
+        if self.__max_rows:
+            size = min(size, self.__max_rows)
+
+        return size
+
+
+class BulkUploader(object):
+    """
+    Uploads a DataFrame through a SQLAlchemy engine's DB-API connection with one of the bulk insert methods:
+        * fast_executemany - executemany() with pyodbc fast_executemany enabled (plain executemany on other drivers)
+        * multirow - parameterized multi-row INSERT ... VALUES (...), (...) statements sized under the parameter limit
+        * csv - stage rows to a csv file and bulk-load it (BULK INSERT on mssql, csv reader + executemany on sqlite)
+
+    Staged csv files quote every text value and write NULL as a bare empty field, so '' and NULL stay apart.
+    Numbers are written unquoted and booleans as 1/0
+    """
+
+    METHODS = ('fast_executemany', 'multirow', 'csv')
+    PARAM_LIMITS = {'mssql': 2100, 'sqlite': 999}
+    DEFAULT_PARAM_LIMIT = 2000
+    MAX_VALUES_ROWS = {'mssql': 1000}
+    CSV_DIALECTS = ('mssql', 'sqlite')
+
+    def __init__(self, engine, dataframe, table_name, table_schema=None, if_exists='append', index=True,
+                 index_label='ID', method='fast_executemany', chunksize=None, stage_dir=None, create_table=True,
+                 commit=True):
+        """
+        :param engine: SQLAlchemy engine
+        :param dataframe: pandas DataFrame
+        :param table_name: SQL table name
+        :param table_schema: (Optional) SQL table schema
+        :param if_exists: (Optional) [append, replace, fail]
+        :param index: (Optional) [True, False] Upload DataFrame index as column(s)
+        :param index_label: (Optional) Index column name
+        :param method: (Optional) [fast_executemany, multirow, csv]
+        :param chunksize: (Optional) Fixed rows per round trip. DEFAULT is adaptive
+        :param stage_dir: (Optional) [csv only] Directory for staged csv files. Required on mssql, where it must be a
+        path the SQL server can read (ie a UNC share) since BULK INSERT opens the file on the server
+        :param create_table: (Optional) [True, False] Create or replace the table per if_exists before inserting. False
+        inserts into an existing table, ie a session temp table that to_sql() cannot see
+        :param commit: (Optional) [True, False] Commit once all rows are inserted. False leaves the rows in the open
+        transaction of engine, ie inside SQLEngineClass.transaction()
+        """
+
+        if method not in self.METHODS:
+            raise ValueError("'method' %r must be either (%s)" % (method, ', '.join(self.METHODS)))
+        if not isinstance(dataframe, DataFrame):
+            raise ValueError("'dataframe' %r is not an pandas Dataframe instance" % dataframe)
+        if chunksize is not None and (not isinstance(chunksize, int) or chunksize < 1):
+            raise ValueError("'chunksize' %r must be a positive int" % chunksize)
+        if stage_dir and not os.path.isdir(stage_dir):
+            raise ValueError("'stage_dir' %r is not a valid directory path" % stage_dir)
+
+        self.__engine = engine
+        self.__dialect = engine.dialect
+        self.__table_name = table_name
+        self.__table_schema = table_schema
+        self.__if_exists = if_exists
+        self.__method = method
+        self.__chunksize = chunksize
+        self.__stage_dir = stage_dir
+        self.__create_table = create_table
+        self.__commit = commit
+
+        self.__frame = upload_frame(dataframe, index, index_label)
+        self.__rows_uploaded = 0
+
+        if method == 'csv' and self.__dialect.name not in self.CSV_DIALECTS:
+            raise ValueError("'method' csv is not supported for %s. Supported (%s)" %
+                             (self.__dialect.name, ', '.join(self.CSV_DIALECTS)))
+        if method == 'csv' and self.__dialect.name == 'mssql' and not stage_dir:
+            raise ValueError("'stage_dir' is required for method csv on mssql and must be a directory the SQL server "
+                             "can read")
+
+    @property
+    def rows_uploaded(self):
+        """
+        :return: Number of rows inserted so far
+        """
+
+        return self.__rows_uploaded
+
+    @property
+    def table_ref(self):
+        """
+        :return: Dialect quoted [schema.]table reference
+        """
+
+        preparer = self.__dialect.identifier_preparer
+
+        if self.__table_schema:
+            return '%s.%s' % (preparer.quote_schema(self.__table_schema), preparer.quote(self.__table_name))
+        else:
+            return preparer.quote(self.__table_name)
+
+    def upload(self):
+        """
+        Creates the table when needed and inserts all rows in chunks
+
+        :return: Number of rows inserted
+        """
+
+        if self.__create_table:
+            self.__frame.head(0).to_sql(self.__table_name, self.__engine, schema=self.__table_schema,
+                                        if_exists=self.__if_exists, index=False)
+
+        if self.__frame.empty:
+            return 0
+
+        from .engine import raw_connection
+        raw_engine, owns_raw = raw_connection(self.__engine)
+
+        try:
+            cursor = raw_engine.cursor()
+
+            try:
+                if self.__method == 'fast_executemany':
+                    self.__upload_executemany(cursor)
+                elif self.__method == 'multirow':
+                    self.__upload_multirow(cursor)
+                else:
+                    self.__upload_csv(cursor)
+
+                if self.__commit:
+                    raw_engine.commit()
+            except:
+                if self.__commit:
+                    raw_engine.rollback()
+
+                raise
+            finally:
+                try:
+                    cursor.close()
+                except:
+                    pass
+        finally:
+            if owns_raw:
+                raw_engine.close()
+
+        return self.__rows_uploaded
+
+    def iter_records(self):
+        """
+        :return: Iterator of row tuples with NULLs as None and numpy scalars as python values
+        """
+
+        columns = list()
+
+        for i in range(len(self.__frame.columns)):
+            series = self.__frame.iloc[:, i]
+
+            if is_datetime64_any_dtype(series):
+                values = np.array(series.dt.to_pydatetime(), dtype=object)
+            else:
+                values = series.astype(object).values
+
+            mask = series.isna().values
+
+            if mask.any():
+                values = values.copy()
+                values[mask] = None
+
+            columns.append(values)
+
+        return zip(*columns)
+
+    def insert_statement(self, rows=1):
+        """
+        :param rows: [Optional] Number of VALUES rows in statement
+        :return: Parameterized INSERT statement for the table
+        """
+
+        preparer = self.__dialect.identifier_preparer
+        cols = ', '.join(preparer.quote(str(c)) for c in self.__frame.columns)
+        count = len(self.__frame.columns)
+        values = ', '.join(self.__placeholders(count, offset=r * count) for r in range(rows))
+        return 'INSERT INTO %s (%s) VALUES %s' % (self.table_ref, cols, values)
+
+    def __placeholders(self, count, offset=0):
+        style = self.__dialect.paramstyle
+
+        if style == 'qmark':
+            marks = ['?'] * count
+        elif style in ('format', 'pyformat'):
+            marks = ['%s'] * count
+        elif style == 'numeric':
+            marks = [':%s' % (offset + i + 1) for i in range(count)]
+        else:
+            raise ValueError("'paramstyle' %s is not supported for bulk upload" % style)
+
+        return '(%s)' % ', '.join(marks)
+
+    def __param_limit(self):
+        return self.PARAM_LIMITS.get(self.__dialect.name, self.DEFAULT_PARAM_LIMIT) - 1
+
+    def __chunks(self, chunker, records):
+        while True:
+            chunk = list(islice(records, chunker.size))
+
+            if not chunk:
+                break
+
+            yield chunk
+
+    def __timed(self, chunker, rows, func, *args):
+        start = monotonic()
+        func(*args)
+        elapsed = monotonic() - start
+        chunker.record(rows, elapsed)
+        self.__rows_uploaded += rows
+        log.debug('Bulk upload to %s: %s rows in %.3fs (%s total)', self.table_ref, rows, elapsed,
+                  self.__rows_uploaded)
+
+    def __upload_executemany(self, cursor):
+        if hasattr(cursor, 'fast_executemany'):
+            cursor.fast_executemany = True
+
+        chunker = AdaptiveChunker(len(self.__frame.columns), chunksize=self.__chunksize)
+        statement = self.insert_statement()
+
+        for chunk in self.__chunks(chunker, self.iter_records()):
+            self.__timed(chunker, len(chunk), cursor.executemany, statement, chunk)
+
+    def __upload_multirow(self, cursor):
+        count = len(self.__frame.columns)
+        max_rows = max(self.__param_limit() // count, 1)
+        max_values = self.MAX_VALUES_ROWS.get(self.__dialect.name)
+
+        if max_values:
+            max_rows = min(max_rows, max_values)
+
+        chunker = AdaptiveChunker(count, max_rows=max_rows, chunksize=self.__chunksize)
+        statements = dict()
+
+        for chunk in self.__chunks(chunker, self.iter_records()):
+            rows = len(chunk)
+
+            if rows not in statements:
+                statements[rows] = self.insert_statement(rows)
+
+            params = [value for row in chunk for value in row]
+            self.__timed(chunker, rows, cursor.execute, statements[rows], params)
+
+    def __upload_csv(self, cursor):
+        chunker = AdaptiveChunker(len(self.__frame.columns), target_params=500000, chunksize=self.__chunksize)
+
+        for chunk in self.__chunks(chunker, self.iter_records()):
+            fd, csv_path = tempfile.mkstemp(suffix='.csv', dir=self.__stage_dir)
+
+            try:
+                with os.fdopen(fd, 'w', newline='', encoding='utf-8') as f:
+                    f.writelines('%s\n' % ','.join(csv_field(value) for value in row) for row in chunk)
+
+                self.__timed(chunker, len(chunk), self.__bulk_load, cursor, csv_path)
+            finally:
+                try:
+                    os.remove(csv_path)
+                except OSError:
+                    pass
+
+    def __bulk_load(self, cursor, csv_path):
+        if self.__dialect.name == 'mssql':
+            cursor.execute("BULK INSERT %s FROM '%s' WITH (FORMAT = 'CSV', FIELDTERMINATOR = ',', "
+                           "ROWTERMINATOR = '0x0a', KEEPNULLS, TABLOCK, CODEPAGE = '65001')"
+                           % (self.table_ref, csv_path.replace("'", "''")))
+        else:
+            statement = self.insert_statement()
+
+            with open(csv_path, 'r', newline='', encoding='utf-8') as f:
+                cursor.executemany(statement, iter_csv_rows(f))
+
+
+class UpsertUploader(object):
+    """
+    Inserts new rows and updates changed rows of a table in one server side step. Rows are bulk-loaded into a
+    session temp table with BulkUploader and folded into the table by a MERGE on mssql or INSERT ... ON CONFLICT on
+    sqlite and postgresql (keys must be a primary key or unique index there). Matched rows whose values are all equal
+    are left alone and counted as unchanged
+    """
+
+    DIALECTS = ('mssql', 'sqlite', 'postgresql')
+    STAGE_NAME = 'kg_upsert_%s'
+
+    def __init__(self, engine, dataframe, table_name, keys, table_schema=None, index=True, index_label='ID',
+                 method='fast_executemany', chunksize=None, stage_dir=None, commit=True):
+        """
+        :param engine: SQLAlchemy connection. The temp table is only visible to this session, so not an Engine
+        :param dataframe: pandas DataFrame
+        :param table_name: SQL table name
+        :param keys: Column name or list of column names that identify a row
+        :param table_schema: (Optional) SQL table schema
+        :param index: (Optional) [True, False] Upload DataFrame index as column(s)
+        :param index_label: (Optional) Index column name
+        :param method: (Optional) [fast_executemany, multirow, csv] Method rows are loaded into the temp table with
+        :param chunksize: (Optional) Fixed rows per round trip. DEFAULT is adaptive
+        :param stage_dir: (Optional) [csv only] Directory for staged csv files. Must be readable by the SQL server
+        :param commit: (Optional) [True, False] Commit the merge. False leaves it in the open transaction of engine
+        """
+
+        if isinstance(keys, str):
+            keys = [keys]
+
+        self.__frame = upload_frame(dataframe, index, index_label)
+        columns = [str(c) for c in self.__frame.columns]
+
+        if not keys:
+            raise ValueError("'keys' must name the columns that identify a row")
+        if any(key not in columns for key in keys):
+            raise ValueError("'keys' %r are not all columns of the dataframe (%s)" % (keys, ', '.join(columns)))
+        if engine.dialect.name not in self.DIALECTS:
+            raise ValueError("Upsert is not supported for %s. Supported (%s)" % (engine.dialect.name,
+                                                                                  ', '.join(self.DIALECTS)))
+
+        self.__engine = engine
+        self.__dialect = engine.dialect
+        self.__table_name = table_name
+        self.__table_schema = table_schema
+        self.__keys = list(keys)
+        self.__columns = columns
+        self.__method = method
+        self.__chunksize = chunksize
+        self.__stage_dir = stage_dir
+        self.__commit = commit
+        stage = self.STAGE_NAME % os.urandom(4).hex()
+        self.__stage_name = '#' + stage if self.__dialect.name == 'mssql' else stage
+        self.__counts = None
+
+    @property
+    def counts(self):
+        """
+        :return: Dictionary of inserted, updated and unchanged row counts once upload() finished
+        """
+
+        return self.__counts
+
+    def upload(self):
+        """
+        Creates the table when needed, stages the rows and merges them into the table
+
+        :return: Dictionary of inserted, updated and unchanged row counts
+        """
+
+        self.__frame.head(0).to_sql(self.__table_name, self.__engine, schema=self.__table_schema,
+                                    if_exists='append', index=False)
+
+        if self.__frame.empty:
+            self.__counts = dict(inserted=0, updated=0, unchanged=0)
+            return self.__counts
+
+        from .engine import raw_connection
+        raw_engine, owns_raw = raw_connection(self.__engine)
+
+        try:
+            cursor = raw_engine.cursor()
+
+            try:
+                cursor.execute(self.__create_stage())
+
+                if self.__commit:
+                    raw_engine.commit()
+
+                try:
+                    BulkUploader(self.__engine, self.__frame, self.__stage_name, index=False, method=self.__method,
+                                 chunksize=self.__chunksize, stage_dir=self.__stage_dir, create_table=False,
+                                 commit=self.__commit).upload()
+
+                    counts = self.__merge(raw_engine, cursor)
+
+                    if self.__commit:
+                        raw_engine.commit()
+                except:
+                    if self.__commit:
+                        raw_engine.rollback()
+
+                    raise
+                finally:
+                    # The temp table lives as long as the pooled session, so it is always dropped
+                    try:
+                        cursor.execute('DROP TABLE %s' % self.__quote(self.__stage_name))
+
+                        if self.__commit:
+                            raw_engine.commit()
+                    except:
+                        pass
+            finally:
+                try:
+                    cursor.close()
+                except:
+                    pass
+        finally:
+            if owns_raw:
+                raw_engine.close()
+
+        self.__counts = counts
+        log.debug('Upsert into %s: %s', self.__table_ref(), self.__counts)
+        return self.__counts
+
+    def __merge(self, raw_engine, cursor):
+        if self.__dialect.name == 'mssql':
+            # The MERGE reports what it did through OUTPUT $action, so no other session can skew the counts
+            cursor.execute(self.__merge_statement())
+
+            while cursor.description is None and cursor.nextset():
+                pass
+
+            inserted, updated = [int(c or 0) for c in cursor.fetchone()]
+            return dict(inserted=inserted, updated=updated, unchanged=len(self.__frame) - inserted - updated)
+
+        # The count must see the rows the merge changes, so writers are locked out until the merge commits
+        if self.__dialect.name == 'postgresql':
+            cursor.execute('LOCK TABLE %s IN SHARE ROW EXCLUSIVE MODE' % self.__table_ref())
+        elif not getattr(raw_engine, 'in_transaction', True):
+            cursor.execute('BEGIN IMMEDIATE')
+
+        total, matched, unchanged = cursor.execute(self.__count_statement()).fetchone()
+        cursor.execute(self.__merge_statement())
+        matched, unchanged = int(matched or 0), int(unchanged or 0)
+        return dict(inserted=int(total) - matched, updated=matched - unchanged, unchanged=unchanged)
+
+    def __quote(self, name):
+        return self.__dialect.identifier_preparer.quote(name)
+
+    def __table_ref(self):
+        if self.__table_schema:
+            return '%s.%s' % (self.__dialect.identifier_preparer.quote_schema(self.__table_schema),
+                              self.__quote(self.__table_name))
+        else:
+            return self.__quote(self.__table_name)
+
+    def __col_list(self, alias=None):
+        prefix = alias + '.' if alias else ''
+        return ', '.join(prefix + self.__quote(c) for c in self.__columns)
+
+    def __create_stage(self):
+        stage = self.__quote(self.__stage_name)
+
+        if self.__dialect.name == 'mssql':
+            # UNION ALL drops the IDENTITY property SELECT INTO would copy, so key values can be inserted
+            return 'SELECT TOP 0 %s INTO %s FROM %s UNION ALL SELECT TOP 0 %s FROM %s' % (
+                self.__col_list(), stage, self.__table_ref(), self.__col_list(), self.__table_ref())
+        else:
+            return 'CREATE TEMP TABLE %s AS SELECT %s FROM %s WHERE 1 = 0' % (stage, self.__col_list(),
+                                                                              self.__table_ref())
+
+    def __same(self, left, right):
+        # Null safe equality of every non key column
+        values = [c for c in self.__columns if c not in self.__keys]
+
+        if not values:
+            return '1 = 1'
+
+        if self.__dialect.name == 'sqlite':
+            template = '%s.%s IS %s.%s'
+        elif self.__dialect.name == 'postgresql':
+            template = '%s.%s IS NOT DISTINCT FROM %s.%s'
+        else:
+            template = '(%s.{0} = %s.{0} OR (%s.{0} IS NULL AND %s.{0} IS NULL))'
+            return ' AND '.join(template.format(self.__quote(c)) % (left, right, left, right) for c in values)
+
+        return ' AND '.join(template % (left, self.__quote(c), right, self.__quote(c)) for c in values)
+
+    def __key_join(self, left, right):
+        return ' AND '.join('%s.%s = %s.%s' % (left, self.__quote(k), right, self.__quote(k)) for k in self.__keys)
+
+    def __count_statement(self):
+        first_key = self.__quote(self.__keys[0])
+        return ('SELECT COUNT(*), COUNT(t.%s), SUM(CASE WHEN t.%s IS NOT NULL AND %s THEN 1 ELSE 0 END) '
+                'FROM %s s LEFT JOIN %s t ON %s' % (first_key, first_key, self.__same('s', 't'),
+                                                    self.__quote(self.__stage_name), self.__table_ref(),
+                                                    self.__key_join('s', 't')))
+
+    def __merge_statement(self):
+        values = [c for c in self.__columns if c not in self.__keys]
+        stage = self.__quote(self.__stage_name)
+
+        if self.__dialect.name == 'mssql':
+            # HOLDLOCK keeps rows that are not there yet locked from the match until the insert
+            statement = ('SET NOCOUNT ON; DECLARE @actions TABLE (merge_action NVARCHAR(10)); '
+                         'MERGE INTO %s WITH (HOLDLOCK) AS t USING %s AS s ON (%s)' % (self.__table_ref(), stage,
+                                                                                       self.__key_join('t', 's')))
+
+            if values:
+                statement += ' WHEN MATCHED AND NOT (%s) THEN UPDATE SET %s' % (
+                    self.__same('t', 's'), ', '.join('t.%s = s.%s' % (self.__quote(c), self.__quote(c))
+                                                     for c in values))
+
+            statement += ' WHEN NOT MATCHED BY TARGET THEN INSERT (%s) VALUES (%s)' % (self.__col_list(),
+                                                                                    self.__col_list('s'))
+            return statement + (" OUTPUT $action INTO @actions; SELECT COUNT(CASE WHEN merge_action = 'INSERT' THEN "
+                                "1 END), COUNT(CASE WHEN merge_action = 'UPDATE' THEN 1 END) FROM @actions; "
+                                "SET NOCOUNT OFF;")
+
+        # WHERE 1 = 1 keeps the parser from reading ON CONFLICT as a join constraint
+        statement = 'INSERT INTO %s AS t (%s) SELECT %s FROM %s WHERE 1 = 1 ON CONFLICT (%s)' % (
+            self.__table_ref(), self.__col_list(), self.__col_list(), stage,
+            ', '.join(self.__quote(k) for k in self.__keys))
+
+        if not values:
+            return statement + ' DO NOTHING'
+
+        return statement + ' DO UPDATE SET %s WHERE NOT (%s)' % (
+            ', '.join('%s = excluded.%s' % (self.__quote(c), self.__quote(c)) for c in values),
+            self.__same('t', 'excluded'))
+
+
+class PartitionedUpload(object):
+    """
+    Splits a DataFrame into row partitions and uploads them concurrently as queued EngineCursors, each on its own
+    pooled connection. Per-partition progress and errors are tracked on this class, which is added to SQLEngine's
+    cursor results once every partition is done.
+
+    In atomic mode partitions are loaded into a staging table and moved into the destination table in a single
+    transaction once every partition succeeded. A missing destination table is only created for that move and dropped
+    again if it fails, so the destination is left untouched when any partition fails. Partitions are not retried
+    """
+
+    STAGE_SUFFIX = '_kg_stage_%s'
+
+    def __init__(self, engine_class, parallelism, atomic=False, **params):
+        """
+        :param engine_class: SQLEngine class instance that partitions are queued on
+        :param parallelism: Number of partitions uploaded concurrently
+        :param atomic: [Optional] (True/False) Stage partitions and move them into the table all-or-nothing
+        :param params: sql_upload() parameters (dataframe, table_name, table_schema, if_exists, index, ...)
+        """
+
+        if not isinstance(parallelism, int) or parallelism < 1:
+            raise ValueError("'parallelism' %r must be a positive int" % parallelism)
+        if not isinstance(params.get('dataframe'), DataFrame):
+            raise ValueError("'dataframe' %r is not an pandas Dataframe instance" % params.get('dataframe'))
+
+        self.__engine_class = engine_class
+        self.__params = params
+        self.__atomic = atomic
+        self.__cursor_action = ['upload_partitioned', dict(params, parallelism=parallelism, atomic=atomic)]
+        self.__errors = None
+        self.__partitions = list()
+        self.__pending = 0
+        self.__lock = Lock()
+        self.__future = Future()
+        self.__create_target = False
+        self.cursor_id = sum(map(ord, str(os.urandom(100))))
+
+        rows = len(params['dataframe'])
+        parallelism = max(min(parallelism, rows), 1)
+        bounds = [rows * i // parallelism for i in range(parallelism + 1)]
+
+        for i in range(parallelism):
+            self.__partitions.append(dict(partition=i, row_start=bounds[i], row_end=bounds[i + 1], status='pending',
+                                          errors=None))
+
+        if atomic:
+            self.__dest_table = params['table_name'] + self.STAGE_SUFFIX % (self.cursor_id % 100000000)
+        else:
+            self.__dest_table = params['table_name']
+
+    @property
+    def cursor_action(self):
+        """
+        :return: Returns cursor action that was performed
+        """
+
+        return self.__cursor_action
+
+    @property
+    def results(self):
+        """
+        :return: DataFrame of [partition, row_start, row_end, status, errors] for every partition
+        """
+
+        return [DataFrame(self.__partitions, columns=['partition', 'row_start', 'row_end', 'status', 'errors'])]
+
+    @property
+    def errors(self):
+        """
+        :return: Returns one or more errors that occurred while uploading partitions
+        """
+
+        return self.__errors
+
+    @property
+    def is_pending(self):
+        """
+        :return: Returns True/False when partitions are still uploading
+        """
+
+        return not self.__future.done()
+
+    @property
+    def future(self):
+        """
+        :return: Future that resolves to this class once every partition is done
+        """
+
+        return self.__future
+
+    def start(self):
+        """
+        Prepares the destination table and queues every partition
+
+        :return: Future that resolves to this class once every partition is done
+        """
+
+        try:
+            self.__prepare()
+        except Exception as e:
+            self.__errors = [type(e).__name__, str(e)]
+            self.__finish()
+            return self.__future
+
+        params = self.__params
+        dataframe = params['dataframe']
+        self.__pending = len(self.__partitions)
+
+        for partition in self.__partitions:
+            part_params = dict(params, dataframe=dataframe.iloc[partition['row_start']:partition['row_end']],
+                               table_name=self.__dest_table, if_exists='append', queue_cursor=True, retry=False)
+            partition['status'] = 'running'
+            future = self.__engine_class.sql_upload(**part_params)
+            future.add_done_callback(lambda f, p=partition: self.__partition_done(p, f))
+
+        return self.__future
+
+    def __partition_done(self, partition, future):
+        error = future.exception()
+
+        if error is None and future.result() is not None and future.result().errors:
+            error = future.result().errors
+        elif error is not None:
+            error = [type(error).__name__, str(error)]
+
+        partition['status'] = 'failed' if error else 'done'
+        partition['errors'] = error
+        log.debug('Partitioned upload %s: Partition %s %s', self.cursor_id, partition['partition'],
+                  partition['status'])
+
+        with self.__lock:
+            self.__pending -= 1
+
+            if error and not self.__errors:
+                self.__errors = error
+
+            if self.__pending:
+                return
+
+        self.__finish()
+
+    def __finish(self):
+        if self.__atomic:
+            try:
+                if self.__errors:
+                    self.__run_statements([self.__drop_stage()])
+                else:
+                    self.__merge()
+            except Exception as e:
+                self.__errors = self.__errors or [type(e).__name__, str(e)]
+
+        self.__engine_class.add_cursor_result(self)
+        self.__future.set_result(self)
+
+    def __prepare(self):
+        params = self.__params
+        head = params['dataframe'].head(0)
+        engine, spid = self.__engine_class.conn_pool.checkout()
+
+        try:
+            if self.__atomic:
+                from sqlalchemy import inspect
+
+                # The destination is only created when the staged rows are moved in, so a failed upload leaves no table
+                exists = inspect(engine).has_table(params['table_name'], schema=params.get('table_schema'))
+
+                if exists and params.get('if_exists') == 'fail':
+                    raise ValueError("Table '%s' already exists." % params['table_name'])
+
+                self.__create_target = not exists
+                head.to_sql(self.__dest_table, engine, schema=params.get('table_schema'), if_exists='replace',
+                            index=params.get('index', True), index_label=params.get('index_label', 'ID'))
+            else:
+                head.to_sql(params['table_name'], engine, schema=params.get('table_schema'),
+                            if_exists=params.get('if_exists', 'append'), index=params.get('index', True),
+                            index_label=params.get('index_label', 'ID'))
+        finally:
+            self.__engine_class.conn_pool.checkin(engine)
+
+    def __merge(self):
+        params = self.__params
+
+        if not self.__create_target:
+            self.__run_statements(self.__merge_statements())
+            return
+
+        engine, spid = self.__engine_class.conn_pool.checkout()
+
+        try:
+            params['dataframe'].head(0).to_sql(params['table_name'], engine, schema=params.get('table_schema'),
+                                               if_exists='append', index=params.get('index', True),
+                                               index_label=params.get('index_label', 'ID'))
+        finally:
+            self.__engine_class.conn_pool.checkin(engine)
+
+        try:
+            self.__run_statements(self.__merge_statements())
+        except:
+            try:
+                self.__run_statements([lambda dialect: 'DROP TABLE %s' % self.__table_ref(dialect,
+                                                                                           params['table_name'])])
+            except Exception as e:
+                log.warning('Partitioned upload %s: Could not drop table %s after a failed merge (%s)',
+                            self.cursor_id, params['table_name'], e)
+
+            raise
+
+    def __table_ref(self, dialect, table_name):
+        preparer = dialect.identifier_preparer
+        schema = self.__params.get('table_schema')
+
+        if schema:
+            return '%s.%s' % (preparer.quote_schema(schema), preparer.quote(table_name))
+        else:
+            return preparer.quote(table_name)
+
+    def __drop_stage(self):
+        return lambda dialect: 'DROP TABLE %s' % self.__table_ref(dialect, self.__dest_table)
+
+    def __merge_statements(self):
+        params = self.__params
+        frame = upload_frame(params['dataframe'].head(0), params.get('index', True), params.get('index_label', 'ID'))
+
+        def insert(dialect):
+            cols = ', '.join(dialect.identifier_preparer.quote(str(c)) for c in frame.columns)
+            return 'INSERT INTO %s (%s) SELECT %s FROM %s' % (self.__table_ref(dialect, params['table_name']), cols,
+                                                               cols, self.__table_ref(dialect, self.__dest_table))
+
+        statements = list()
+
+        if params.get('if_exists') == 'replace':
+            statements.append(lambda dialect: 'DELETE FROM %s' % self.__table_ref(dialect, params['table_name']))
+
+        statements.append(insert)
+        statements.append(self.__drop_stage())
+        return statements
+
+    def __run_statements(self, statements):
+        engine, spid = self.__engine_class.conn_pool.checkout()
+        failed = False
+
+        try:
+            from .engine import raw_connection
+            raw_engine, owns_raw = raw_connection(engine)
+
+            try:
+                cursor = raw_engine.cursor()
+
+                try:
+                    for statement in statements:
+                        cursor.execute(statement(engine.dialect))
+
+                    raw_engine.commit()
+                except:
+                    raw_engine.rollback()
+                    raise
+                finally:
+                    cursor.close()
+            finally:
+                if owns_raw:
+                    raw_engine.close()
+        except:
+            failed = True
+            raise
+        finally:
+            self.__engine_class.conn_pool.checkin(engine, validate=failed)
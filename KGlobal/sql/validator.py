@@ -0,0 +1,189 @@
+from __future__ import unicode_literals
+
+from threading import Lock
+from time import monotonic
+
+import logging
+
+log = logging.getLogger(__name__)
+
+PING_QUERIES = {
+    'sql': 'SELECT @@SPID',
+    'dsn': 'SELECT @@SPID',
+    'conn_str': 'SELECT @@SPID',
+    'accdb': None,
+    'sqlite': 'SELECT 1',
+}
+
+
+class ConnectionValidator(object):
+    """
+    Connection liveness checks with the SPID cached per connection. A connection is pinged when it is first seen,
+    when it was marked with invalidate() after an error and once validate_interval seconds passed since its last
+    check. Other calls are answered from the cache without a round trip. The ping is a query per dialect:
+    SELECT @@SPID on SQL Server, SELECT 1 on sqlite and no query on Access, where opening a cursor on the local
+    file is the check
+    """
+
+    DEFAULT_VALIDATE_INTERVAL = 30
+
+    def __init__(self, ping_query=None, validate_interval=DEFAULT_VALIDATE_INTERVAL, validator_id=None):
+        """
+        :param ping_query: [Optional] Query string, or function taking a DB-API connection and returning the spid,
+        that checks a connection. None checks that a cursor can be opened
+        :param validate_interval: [Optional] Seconds a validated connection is trusted for (0 pings on every call)
+        :param validator_id: [Optional] Identifier used for logging
+        """
+
+        if validate_interval < 0:
+            raise ValueError("'validate_interval' %r must be a non-negative number" % validate_interval)
+
+        self.__ping_query = ping_query
+        self.__validate_interval = validate_interval
+        self.__validator_id = validator_id
+        self.__checked = dict()
+        self.__stats = dict(validations=0, cached=0, failures=0)
+        self.__validator_lock = Lock()
+
+    @classmethod
+    def for_config(cls, sql_config, ping_query=None, validate_interval=DEFAULT_VALIDATE_INTERVAL, validator_id=None):
+        """
+        :param sql_config: SQLConfig instance class
+        :param ping_query: [Optional] Overrides the ping query of the SQLConfig type
+        :param validate_interval: [Optional] Seconds a validated connection is trusted for
+        :param validator_id: [Optional] Identifier used for logging
+        :return: ConnectionValidator with the ping query of the SQLConfig type
+        """
+
+        if ping_query is None:
+            ping_query = PING_QUERIES.get(sql_config.config_type, PING_QUERIES['sql'])
+
+        return cls(ping_query=ping_query, validate_interval=validate_interval, validator_id=validator_id)
+
+    @property
+    def stats(self):
+        """
+        :return: Dictionary of validations (pings sent), cached (pings saved) and failures
+        """
+
+        with self.__validator_lock:
+            return dict(self.__stats)
+
+    def validate(self, engine, force=False):
+        """
+        :param engine: SQLAlchemy Connection or PYODBC Connection
+        :param force: [Optional] (True/False) Ping even when the cached check is still fresh
+        :return: [engine, spid] (engine is None if the connection is dead)
+        """
+
+        if engine is None:
+            return [None, None]
+
+        now = monotonic()
+
+        with self.__validator_lock:
+            entry = self.__checked.get(id(engine))
+
+            if not force and entry is not None and entry[0] is engine and (
+                    entry[2] is not None and now - entry[2] < self.__validate_interval):
+                self.__stats['cached'] += 1
+                return [engine, entry[1]]
+
+            self.__stats['validations'] += 1
+
+        try:
+            spid = self.__ping(engine)
+        except Exception as e:
+            log.debug('SQL Validator %s: Connection failed validation. %s', self.__validator_id, e)
+
+            with self.__validator_lock:
+                self.__checked.pop(id(engine), None)
+                self.__stats['failures'] += 1
+
+            return [None, None]
+
+        with self.__validator_lock:
+            # The connection is held with its entry so its id cannot be re-used while the entry is cached
+            self.__checked[id(engine)] = (engine, spid, monotonic())
+
+        return [engine, spid]
+
+    def invalidate(self, engine):
+        """
+        Forces the next validate() of a connection to ping it, ie after a statement on it failed
+
+        :param engine: SQLAlchemy Connection or PYODBC Connection
+        """
+
+        with self.__validator_lock:
+            entry = self.__checked.get(id(engine))
+
+            if entry is not None:
+                self.__checked[id(engine)] = (entry[0], entry[1], None)
+
+    def forget(self, engine):
+        """
+        Drops a closed connection from the cache
+
+        :param engine: SQLAlchemy Connection or PYODBC Connection
+        """
+
+        with self.__validator_lock:
+            self.__checked.pop(id(engine), None)
+
+    def __ping(self, engine):
+        from .engine import raw_connection, dbapi_connection
+
+        raw_engine, owns_raw = raw_connection(engine)
+        ping_query = self.__ping_query
+
+        # SQLAlchemy hands out pooled proxies, the driver connection underneath tells the dialect
+        if type(dbapi_connection(raw_engine)).__module__.startswith('sqlite3'):
+            ping_query = PING_QUERIES['sqlite']
+
+        try:
+            if callable(ping_query):
+                return ping_query(raw_engine)
+
+            cursor = raw_engine.cursor()
+
+            try:
+                if ping_query is None:
+                    return None
+
+                rows = [tuple(t) for t in cursor.execute(ping_query).fetchall()]
+
+                # SELECT 1 only proves liveness, other pings return the session id
+                if ping_query == PING_QUERIES['sqlite'] or not rows:
+                    return None
+
+                return rows[0]
+            finally:
+                try:
+                    cursor.close()
+                except:
+                    pass
+        finally:
+            if owns_raw:
+                try:
+                    raw_engine.close()
+                except:
+                    pass
+
+    def __getstate__(self):
+        # Connections and the lock cannot be pickled
+        state = self.__dict__.copy()
+        state['_ConnectionValidator__checked'] = dict()
+        del state['_ConnectionValidator__validator_lock']
+        return state
+
+    def __setstate__(self, state):
+        # Restore the lock
+        self.__dict__.update(state)
+        self.__validator_lock = Lock()
+
+    def __len__(self):
+        return len(self.__checked)
+
+    def __repr__(self):
+        return '%s(%s, interval=%s)' % (self.__class__.__name__, self.__validator_id, self.__validate_interval)
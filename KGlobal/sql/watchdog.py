@@ -0,0 +1,123 @@
+from __future__ import unicode_literals
+
+from threading import Thread, Condition, Lock
+from itertools import count
+from time import monotonic
+
+import heapq
+import logging
+
+log = logging.getLogger(__name__)
+
+
+class StatementWatchdog(object):
+    """
+    One daemon thread that cancels statements once their deadline passes. Statements register a cancel callback with
+    watch() before they execute and unwatch() once they finish, so a deadline costs a heap push instead of a thread
+    """
+
+    __default = None
+    __default_lock = Lock()
+
+    def __init__(self, watchdog_id=None):
+        """
+        :param watchdog_id: [Optional] Identifier used for the thread name and logging
+        """
+
+        self.__watchdog_id = watchdog_id
+        self.__deadlines = list()
+        self.__callbacks = dict()
+        self.__tokens = count()
+        self.__thread = None
+        self.__fired = 0
+        self.__watch_cond = Condition(Lock())
+
+    @classmethod
+    def default(cls):
+        """
+        :return: Process-wide StatementWatchdog
+        """
+
+        if cls.__default is None:
+            with cls.__default_lock:
+                if cls.__default is None:
+                    cls.__default = cls(watchdog_id='default')
+
+        return cls.__default
+
+    @property
+    def fired(self):
+        """
+        :return: Number of deadlines that passed and had their callback called
+        """
+
+        return self.__fired
+
+    def watch(self, seconds, callback):
+        """
+        :param seconds: Seconds until callback is called
+        :param callback: Function called without arguments on the watchdog thread once the deadline passes
+        :return: Token for unwatch()
+        """
+
+        if seconds <= 0:
+            raise ValueError("'seconds' %r must be a positive number" % seconds)
+
+        with self.__watch_cond:
+            token = next(self.__tokens)
+            self.__callbacks[token] = callback
+            heapq.heappush(self.__deadlines, (monotonic() + seconds, token))
+
+            if self.__thread is None or not self.__thread.is_alive():
+                self.__thread = Thread(target=self.__run, name='SQLWatchdog-%s' % self.__watchdog_id, daemon=True)
+                self.__thread.start()
+
+            self.__watch_cond.notify()
+
+        return token
+
+    def unwatch(self, token):
+        """
+        :param token: Token returned by watch()
+        :return: (True/False) if the deadline was removed before it passed
+        """
+
+        with self.__watch_cond:
+            return self.__callbacks.pop(token, None) is not None
+
+    def __run(self):
+        while True:
+            with self.__watch_cond:
+                while True:
+                    while self.__deadlines and self.__deadlines[0][1] not in self.__callbacks:
+                        heapq.heappop(self.__deadlines)
+
+                    if not self.__deadlines:
+                        # The thread exits when idle and is restarted by the next watch()
+                        if not self.__watch_cond.wait(60) and not self.__deadlines:
+                            self.__thread = None
+                            return
+
+                        continue
+
+                    deadline, token = self.__deadlines[0]
+                    remaining = deadline - monotonic()
+
+                    if remaining <= 0:
+                        heapq.heappop(self.__deadlines)
+                        callback = self.__callbacks.pop(token)
+                        self.__fired += 1
+                        break
+
+                    self.__watch_cond.wait(remaining)
+
+            try:
+                callback()
+            except Exception as e:
+                log.debug('SQL Watchdog %s: Deadline callback failed. %s', self.__watchdog_id, e)
+
+    def __len__(self):
+        return len(self.__callbacks)
+
+    def __repr__(self):
+        return '%s(%s, watching=%s)' % (self.__class__.__name__, self.__watchdog_id, len(self.__callbacks))
@@ -199,6 +199,21 @@ class Toolbox(TBoxBase, SQLQueue, LogHandle):
 
         return engine
 
+    def config_sql_group(self, primary_config, replica_configs=None, conn_max_pool_size=DEFAULT_CONNECTION_SIZE,
+                         cooldown=None):
+        """
+        Create a routed SQL engine group that sends queries to read replicas and writes to the primary
+
+        :param primary_config: SQLConfig class instance of the server that takes writes
+        :param replica_configs: List of SQLConfig class instances of read replicas (Optional)
+        :param conn_max_pool_size: Maximum of sql connections per server (Optional)
+        :param cooldown: Seconds an unhealthy replica is left out of rotation (Optional)
+        :return: SQLEngineGroup (Engines are closed with the SQL queue pool)
+        """
+
+        return self.create_sql_engine_group(primary_config, replica_configs, conn_max_pool_size=conn_max_pool_size,
+                                            cooldown=cooldown)
+
     def default_sql_conn(self, new_instance=False, conn_max_pool_size=DEFAULT_CONNECTION_SIZE):
         """
         Creates the default SQL connection and add engine to SQL queue pool
@@ -0,0 +1,27 @@
+from __future__ import unicode_literals
+
+from KGlobal.sql import SQLConfig, SQLEngineClass, dispose_sql_engines
+
+import pytest
+
+
+@pytest.fixture
+def sqlite_config(tmp_path):
+    """
+    SQLConfig of a SQLAlchemy sqlite database file that is removed with the test's tmp_path
+    """
+
+    sql_config = SQLConfig(conn_type='alchemy', conn_str='sqlite:///%s' % (tmp_path / 'kglobal.db'))
+    yield sql_config
+    dispose_sql_engines(sql_config)
+
+
+@pytest.fixture
+def sql_engine(sqlite_config):
+    """
+    SQLEngineClass on sqlite_config whose cursors and connections are closed after the test
+    """
+
+    sql_engine = SQLEngineClass(sql_config=sqlite_config, conn_max_pool_size=4)
+    yield sql_engine
+    sql_engine.close_connections(enable_log=False)
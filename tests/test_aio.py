@@ -0,0 +1,126 @@
+from __future__ import unicode_literals
+
+from KGlobal.sql import AsyncSQLEngine
+
+import asyncio
+import threading
+import pytest
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+@pytest.fixture
+def items_engine(sql_engine):
+    sql_engine.sql_execute('CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)', execute=True)
+    sql_engine.sql_execute('INSERT INTO items (name) VALUES (?)', execute=True, many=True,
+                           params=[('item%s' % i,) for i in range(25)])
+    return sql_engine
+
+
+def test_execute_returns_results(items_engine):
+    async def main():
+        async with AsyncSQLEngine(items_engine) as async_engine:
+            return await async_engine.execute('SELECT id, name FROM items WHERE id <= ?', params=(3,))
+
+    cursor = run(main())
+    assert cursor.errors is None
+    assert cursor.results[0]['name'].tolist() == ['item0', 'item1', 'item2']
+    assert items_engine.conn_pool.checked_out_count == 0
+
+
+def test_execute_all_keeps_statement_order(items_engine):
+    async def main():
+        async with AsyncSQLEngine(items_engine, max_concurrency=2) as async_engine:
+            return await async_engine.execute_all([('SELECT name FROM items WHERE id = ?', (i,)) for i in (5, 1, 3)])
+
+    cursors = run(main())
+    assert [cursor.results[0]['name'][0] for cursor in cursors] == ['item4', 'item0', 'item2']
+
+
+def test_execute_statement_commits(items_engine):
+    async def main():
+        async with AsyncSQLEngine(items_engine) as async_engine:
+            await async_engine.execute("UPDATE items SET name = 'x' WHERE id = 1", execute=True)
+            return await async_engine.execute('SELECT name FROM items WHERE id = 1')
+
+    assert run(main()).results[0]['name'][0] == 'x'
+
+
+def test_execute_error_is_reported_on_the_cursor(items_engine):
+    async def main():
+        async with AsyncSQLEngine(items_engine) as async_engine:
+            return await async_engine.execute('SELECT missing FROM items')
+
+    cursor = run(main())
+    assert cursor.errors
+    assert items_engine.conn_pool.checked_out_count == 0
+
+
+def test_stream_yields_chunks_with_row_number_index(items_engine):
+    async def main():
+        async with AsyncSQLEngine(items_engine) as async_engine:
+            return [chunk async for chunk in async_engine.stream('SELECT id FROM items ORDER BY id', chunk_rows=10)]
+
+    chunks = run(main())
+    assert [len(chunk) for chunk in chunks] == [10, 10, 5]
+    assert chunks[2].index.tolist() == list(range(20, 25))
+    assert chunks[2]['id'].tolist() == list(range(21, 26))
+    assert items_engine.conn_pool.checked_out_count == 0
+
+
+def test_stream_returns_the_connection_when_the_consumer_stops(items_engine):
+    async def main():
+        async with AsyncSQLEngine(items_engine) as async_engine:
+            stream = async_engine.stream('SELECT id FROM items', chunk_rows=5, as_dataframe=False)
+
+            async for rows in stream:
+                await stream.aclose()
+                return rows
+
+    assert run(main()) == [(i,) for i in range(1, 6)]
+    assert items_engine.conn_pool.checked_out_count == 0
+
+
+def test_stream_closes_its_statement_off_the_event_loop(items_engine, monkeypatch):
+    from KGlobal.sql.aio import PendingStatement
+
+    close, threads = PendingStatement.close, list()
+
+    def spy(pending, conn_pool, exhausted=True):
+        threads.append(threading.current_thread())
+        close(pending, conn_pool, exhausted)
+
+    monkeypatch.setattr(PendingStatement, 'close', spy)
+
+    async def main():
+        async with AsyncSQLEngine(items_engine) as async_engine:
+            stream = async_engine.stream('SELECT id FROM items', chunk_rows=5)
+
+            async for chunk in stream:
+                await stream.aclose()
+
+            return threading.current_thread()
+
+    loop_thread = run(main())
+    assert len(threads) == 1
+    assert threads[0] is not loop_thread
+    assert items_engine.conn_pool.checked_out_count == 0
+
+
+def test_cancelled_statement_is_interrupted_on_sqlite(items_engine):
+    slow_query = ('WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 100000000) '
+                  'SELECT COUNT(*) FROM n')
+
+    async def main():
+        async with AsyncSQLEngine(items_engine) as async_engine:
+            task = asyncio.ensure_future(async_engine.execute(slow_query))
+            await asyncio.sleep(0.2)
+            task.cancel()
+
+            with pytest.raises(asyncio.CancelledError):
+                await asyncio.wait_for(task, 10)
+
+    run(main())
+    assert items_engine.conn_pool.checked_out_count == 0
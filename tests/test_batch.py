@@ -0,0 +1,93 @@
+from __future__ import unicode_literals
+
+from KGlobal.sql import SQLEngineClass, RetryPolicy
+
+import pytest
+
+SLOW_QUERY = ('WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 50000000) '
+              'SELECT COUNT(*) AS c FROM n')
+
+
+@pytest.fixture
+def items_engine(sql_engine):
+    sql_engine.sql_execute('CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)', execute=True)
+    sql_engine.sql_execute("INSERT INTO items (name) VALUES ('a'), ('b'), ('c')", execute=True)
+    sql_engine.query_stats.reset()
+    return sql_engine
+
+
+def test_sequential_batch_runs_in_order_on_one_connection(items_engine):
+    results = items_engine.execute_batch(["UPDATE items SET name = 'B' WHERE id = 2",
+                                          ('SELECT name FROM items WHERE id >= ?', (2,)),
+                                          'SELECT COUNT(*) AS c FROM items'], execute=True)
+
+    assert [result.index for result in results] == [0, 1, 2]
+    assert [result.status for result in results] == ['ok', 'ok', 'ok']
+    assert [result.rowcount for result in results] == [1, 2, 1]
+    assert results[1].results[0]['name'].tolist() == ['B', 'c']
+    assert all(result.elapsed > 0 for result in results)
+    assert len(set(result.spid for result in results)) == 1
+
+
+def test_parallel_batch_spreads_lanes_and_keeps_statement_order(items_engine, monkeypatch):
+    conn_pool, checkouts = items_engine.conn_pool, list()
+    checkout = conn_pool.checkout
+    monkeypatch.setattr(conn_pool, 'checkout', lambda *args, **kwargs: checkouts.append(1) or checkout(*args, **kwargs))
+
+    statements = ['SELECT %s AS n, COUNT(*) AS c FROM items' % i for i in range(6)]
+    results = items_engine.execute_batch(statements, parallel=3)
+
+    assert [result.results[0]['n'][0] for result in results] == list(range(6))
+    assert [result.rowcount for result in results] == [1] * 6
+    assert len(checkouts) == 3
+
+    items_engine.execute_batch(statements)
+    assert len(checkouts) == 4
+
+
+def test_stop_on_error_skips_the_remaining_statements(items_engine):
+    statements = ['SELECT 1 AS n', 'SELECT * FROM missing', "INSERT INTO items (name) VALUES ('d')"]
+    results = items_engine.execute_batch(statements, execute=True)
+
+    assert [result.status for result in results] == ['ok', 'error', 'skipped']
+    assert 'missing' in results[1].errors[1]
+    assert results[2].elapsed is None
+    assert items_engine.sql_execute('SELECT COUNT(*) AS c FROM items').results[0]['c'][0] == 3
+
+    results = items_engine.execute_batch(statements, execute=True, stop_on_error=False)
+    assert [result.status for result in results] == ['ok', 'error', 'ok']
+
+
+def test_statements_are_cancelled_at_the_timeout_and_the_lane_carries_on(items_engine):
+    results = items_engine.execute_batch([SLOW_QUERY, 'SELECT COUNT(*) AS c FROM items'], timeout=0.2,
+                                         stop_on_error=False)
+
+    assert results[0].timed_out
+    assert results[0].errors[0] == 'HYT00'
+    assert results[0].elapsed < 10
+    assert results[1].status == 'ok'
+    assert results[1].results[0]['c'][0] == 3
+
+
+def test_statements_are_recorded_in_query_stats(items_engine):
+    items_engine.execute_batch(['SELECT name FROM items', 'SELECT * FROM missing'], stop_on_error=False)
+    stats = items_engine.query_stats.snapshot()
+
+    assert (stats['actions'], stats['errors'], stats['rows']) == (2, 1, 3)
+    assert stats['execute'] > 0
+
+
+def test_deadlocked_statements_are_retried(sqlite_config):
+    sql_engine = SQLEngineClass(sql_config=sqlite_config, retry_policy=RetryPolicy(base_delay=0.01, jitter=False))
+
+    try:
+        # A CHECK constraint named deadlock fails every attempt with an error classified as a deadlock
+        sql_engine.sql_execute('CREATE TABLE items (id INTEGER CONSTRAINT deadlock CHECK (id > 0))', execute=True)
+        results = sql_engine.execute_batch(['INSERT INTO items VALUES (0)', 'INSERT INTO items VALUES (1)'],
+                                           execute=True, stop_on_error=False)
+
+        assert [result.attempts for result in results] == [3, 1]
+        assert [result.status for result in results] == ['error', 'ok']
+        assert sql_engine.execute_batch(['INSERT INTO items VALUES (0)'], retry=False)[0].attempts == 1
+    finally:
+        sql_engine.close_connections(enable_log=False)
@@ -0,0 +1,114 @@
+from __future__ import unicode_literals
+
+from KGlobal.sql.cache import SQLResultCache, query_tables, normalize_query
+from pandas import DataFrame
+
+import pytest
+
+
+def frame():
+    return DataFrame({'a': [1, 2, 3], 'b': [10, 20, 30]})
+
+
+def test_query_tables_reads_unqualified_lower_case_names():
+    query_str = 'SELECT * FROM [dbo].[Orders] o JOIN "Sales"."Items" i ON o.id = i.order_id'
+
+    assert query_tables(query_str) == {'orders', 'items'}
+    assert normalize_query(' SELECT  1\n FROM t ; ') == 'SELECT 1 FROM t'
+
+
+def test_normalize_query_keeps_whitespace_inside_quotes():
+    assert normalize_query("SELECT  *  FROM [my  table] WHERE name = 'a  b' AND \"c  d\" = 'it''s  x'") == \
+        "SELECT * FROM [my  table] WHERE name = 'a  b' AND \"c  d\" = 'it''s  x'"
+
+
+def test_literals_that_differ_in_whitespace_are_cached_apart(sql_engine):
+    sql_engine.sql_execute("CREATE TABLE items (name TEXT)", execute=True)
+    sql_engine.sql_execute("INSERT INTO items VALUES ('a b')", execute=True)
+
+    def count(name):
+        query_str = "SELECT COUNT(*) AS c FROM items WHERE name = '%s'" % name
+        return sql_engine.sql_execute(query_str, cache=True).results[0]['c'][0]
+
+    assert count('a b') == 1
+    assert count('a  b') == 0
+
+
+def test_results_are_isolated_from_callers():
+    result_cache = SQLResultCache()
+    df = frame()
+    result_cache.put('k', [df])
+    df['b'] *= 100
+
+    hit = result_cache.get('k')[0]
+    assert hit['b'].tolist() == [10, 20, 30]
+
+    hit.loc[0, 'a'] = -1
+    assert result_cache.get('k')[0]['a'].tolist() == [1, 2, 3]
+
+
+def test_missing_and_expired_entries_are_misses():
+    result_cache = SQLResultCache()
+    result_cache.put('k', [frame()], ttl=-1)
+
+    assert result_cache.get('k') is None
+    assert result_cache.get('other') is None
+    assert result_cache.stats['misses'] == 2
+
+
+def test_least_recently_used_entries_are_evicted():
+    nbytes = int(frame().memory_usage(index=True, deep=True).sum())
+    result_cache = SQLResultCache(max_bytes=nbytes * 2)
+    result_cache.put('a', [frame()])
+    result_cache.put('b', [frame()])
+    result_cache.get('a')
+    result_cache.put('c', [frame()])
+
+    assert result_cache.get('b') is None
+    assert result_cache.get('a') is not None
+    assert result_cache.stats['evictions'] == 1
+
+
+def test_evicted_entries_are_spilled_and_read_back(tmp_path):
+    pytest.importorskip('pyarrow')
+    nbytes = int(frame().memory_usage(index=True, deep=True).sum())
+    result_cache = SQLResultCache(max_bytes=nbytes, spill_dir=str(tmp_path))
+    result_cache.put('a', [frame()])
+    result_cache.put('b', [frame()])
+
+    assert result_cache.stats['spills'] == 1
+    assert result_cache.get('a')[0]['b'].tolist() == [10, 20, 30]
+
+
+def test_entries_are_invalidated_by_table():
+    result_cache = SQLResultCache()
+    result_cache.put('orders', [frame()], query_str='SELECT * FROM dbo.orders')
+    result_cache.put('items', [frame()], query_str='SELECT * FROM items')
+    result_cache.invalidate('[dbo].[Orders]')
+
+    assert result_cache.get('orders') is None
+    assert result_cache.get('items') is not None
+
+
+def test_engine_cache_hits_do_not_share_frames(sql_engine):
+    sql_engine.sql_execute('CREATE TABLE t (a INTEGER, b INTEGER)', execute=True)
+    sql_engine.sql_execute('INSERT INTO t VALUES (1, 10), (2, 20)', execute=True)
+
+    first = sql_engine.sql_execute('SELECT a, b FROM t ORDER BY a', cache=True)
+    first.results[0]['b'] *= 100
+    second = sql_engine.sql_execute('SELECT a, b FROM t ORDER BY a', cache=True)
+    assert second.cached
+    assert second.results[0]['b'].tolist() == [10, 20]
+
+    second.results[0].loc[0, 'b'] = -1
+    assert sql_engine.sql_execute('SELECT a, b FROM t ORDER BY a', cache=True).results[0]['b'].tolist() == [10, 20]
+
+
+def test_executed_statements_invalidate_cached_reads(sql_engine):
+    sql_engine.sql_execute('CREATE TABLE t (a INTEGER)', execute=True)
+    sql_engine.sql_execute('SELECT a FROM t', cache=True)
+    sql_engine.sql_execute('INSERT INTO t VALUES (1)', execute=True)
+
+    cursor = sql_engine.sql_execute('SELECT a FROM t', cache=True)
+    assert not getattr(cursor, 'cached', False)
+    assert cursor.results[0]['a'].tolist() == [1]
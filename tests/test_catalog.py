@@ -0,0 +1,99 @@
+from __future__ import unicode_literals
+
+from KGlobal.sql.catalog import SchemaCatalog, split_table_name
+from KGlobal.sql.pool import SQLConnectionPool
+from collections import namedtuple
+from types import SimpleNamespace
+
+import pytest
+
+Table = namedtuple('Table', ['table_type', 'table_cat', 'table_schem', 'table_name'])
+Column = namedtuple('Column', ['table_schem', 'table_name', 'column_name', 'type_name', 'column_size', 'nullable',
+                               'ordinal_position'])
+
+
+class ODBCCursor(object):
+    """
+    pyodbc-like cursor with catalog functions over Server's tables and no sys.objects
+    """
+
+    def __init__(self, server):
+        self.server = server
+
+    def execute(self, query):
+        raise ValueError('Invalid object name sys.objects')
+
+    def tables(self):
+        self.server.calls.append('tables')
+        return [Table('TABLE', 'db', 'dbo', name) for name in self.server.tables]
+
+    def columns(self, table=None, schema=None):
+        self.server.calls.append('columns')
+        rows = [Column('dbo', name, 'id', 'int', 10, 0, 1) for name in self.server.tables
+                if table is None or name == table]
+        return SimpleNamespace(fetchall=lambda: rows)
+
+    def close(self):
+        pass
+
+
+class Server(object):
+    def __init__(self, *tables):
+        self.tables = list(tables)
+        self.calls = list()
+
+    def cursor(self):
+        return ODBCCursor(self)
+
+
+def engine_class(server):
+    conn_pool = SQLConnectionPool(lambda: [server, 1], lambda engine: [engine, 1], lambda engine: None)
+    return SimpleNamespace(sql_config=SimpleNamespace(config_key=('test',)), conn_pool=conn_pool)
+
+
+def test_split_table_name():
+    assert split_table_name('[Sales].[Orders]') == ['sales', 'orders']
+    assert split_table_name('Orders', schema='Sales') == ['sales', 'orders']
+    assert split_table_name('orders') == [None, 'orders']
+
+
+def test_lookups_are_served_from_memory():
+    server = Server('Orders', 'Items')
+    catalog = SchemaCatalog(engine_class(server))
+
+    assert catalog.has_table('dbo.orders')
+    assert not catalog.has_table('missing')
+    assert catalog.columns('Items') == [['id', 'int', 10, False]]
+    assert server.calls == ['tables', 'columns']
+
+
+def test_catalog_loaded_from_store_refreshes_on_first_use():
+    store, server = dict(), Server('Orders')
+    SchemaCatalog(engine_class(server), store=store).refresh()
+
+    server.tables = ['Items']
+    catalog = SchemaCatalog(engine_class(server), store=store)
+    assert catalog.loaded
+
+    assert catalog.has_table('items')
+    assert not catalog.has_table('orders')
+    assert server.calls == ['tables', 'tables']
+
+    server.tables = ['Orders']
+    assert catalog.has_table('items')
+
+
+def test_refresh_interval_refreshes_stale_catalogs():
+    server = Server('Orders')
+    catalog = SchemaCatalog(engine_class(server), refresh_interval=0)
+    catalog.has_table('orders')
+
+    server.tables = ['Items']
+    assert catalog.has_table('items')
+
+
+def test_unknown_tables_have_no_columns():
+    catalog = SchemaCatalog(engine_class(Server('Orders')))
+
+    with pytest.raises(ValueError, match='not in the SQL catalog'):
+        catalog.columns('missing')
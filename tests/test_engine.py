@@ -0,0 +1,129 @@
+from __future__ import unicode_literals
+
+from KGlobal.sql import SQLEngineClass, RetryPolicy
+from time import monotonic
+
+import pytest
+
+SLOW_QUERY = ('WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 2000000) '
+              'SELECT COUNT(*) AS c FROM n')
+LONG_QUERY = SLOW_QUERY.replace('2000000', '200000000')
+
+
+@pytest.fixture
+def items_engine(sql_engine):
+    sql_engine.sql_execute('CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)', execute=True)
+    sql_engine.sql_execute("INSERT INTO items (name) VALUES ('a'), ('b'), ('c')", execute=True)
+    return sql_engine
+
+
+def test_sql_execute_queries_and_executes(items_engine):
+    cursor = items_engine.sql_execute('SELECT id, name FROM items WHERE id > ?', params=(1,))
+
+    assert cursor.errors is None
+    assert cursor.results[0]['name'].tolist() == ['b', 'c']
+
+
+def test_failed_statement_reports_errors(items_engine):
+    cursor = items_engine.sql_execute('INSERT INTO missing VALUES (1)', execute=True)
+
+    assert cursor.errors
+    assert items_engine.sql_execute('SELECT COUNT(*) AS c FROM items').results[0]['c'][0] == 3
+
+
+def test_as_completed_yields_cursors_that_already_finished(items_engine):
+    futures = [items_engine.sql_execute('SELECT name FROM items WHERE id = %s' % i, queue_cursor=True)
+               for i in (1, 2, 3)]
+    cursors = [future.result(timeout=10) for future in futures]
+
+    completed = list(items_engine.as_completed(timeout=10))
+    assert len(completed) == 3
+    assert set(completed) == set(cursors)
+
+
+def test_as_completed_yields_finished_cursors_before_running_ones(items_engine):
+    fast = items_engine.sql_execute('SELECT name FROM items', queue_cursor=True).result(timeout=10)
+    slow = items_engine.sql_execute(SLOW_QUERY, queue_cursor=True)
+
+    completed = list(items_engine.as_completed(timeout=30))
+    assert completed == [fast, slow.result(timeout=30)]
+    assert completed[1].results[0]['c'][0] == 2000000
+
+
+def test_statements_past_the_timeout_are_cancelled(items_engine):
+    start = monotonic()
+    cursor = items_engine.sql_execute(LONG_QUERY, timeout=0.2)
+
+    assert monotonic() - start < 10
+    assert cursor.timed_out
+    assert cursor.errors[0] == 'HYT00'
+
+    # The main connection is pinged before the next statement runs on it
+    validations = items_engine.validation_stats['validations']
+    assert items_engine.sql_execute('SELECT COUNT(*) AS c FROM items').results[0]['c'][0] == 3
+    assert items_engine.validation_stats['validations'] == validations + 1
+
+
+def test_timed_out_pooled_connections_are_validated_on_checkin(items_engine, monkeypatch):
+    conn_pool, checkins = items_engine.conn_pool, list()
+    checkin = conn_pool.checkin
+
+    def spy(engine, validate=False, discard=False):
+        checkins.append((validate, discard))
+        checkin(engine, validate=validate, discard=discard)
+
+    monkeypatch.setattr(conn_pool, 'checkin', spy)
+    cursor = items_engine.sql_execute(LONG_QUERY, timeout=0.2, new_engine=True)
+
+    assert cursor.timed_out
+    assert cursor.errors[0] == 'HYT00'
+    assert checkins == [(True, False)]
+
+
+def test_wait_for_cursors_returns_every_result(items_engine):
+    for i in (1, 2):
+        items_engine.sql_execute('SELECT name FROM items WHERE id = %s' % i, queue_cursor=True)
+
+    results = items_engine.wait_for_cursors(timeout=10)
+    assert sorted(cursor.results[0]['name'][0] for cursor in results) == ['a', 'b']
+    assert items_engine.cursors == list()
+
+
+def test_as_completed_only_yields_cursors_once(items_engine):
+    first = items_engine.sql_execute('SELECT name FROM items WHERE id = 1', queue_cursor=True).result(timeout=10)
+    assert list(items_engine.as_completed(timeout=10)) == [first]
+
+    second = items_engine.sql_execute('SELECT name FROM items WHERE id = 2', queue_cursor=True)
+    assert list(items_engine.as_completed(timeout=10)) == [second.result(timeout=10)]
+    assert list(items_engine.as_completed(timeout=10)) == []
+
+    items_engine.sql_execute('SELECT name FROM items WHERE id = 3', queue_cursor=True).result(timeout=10)
+    items_engine.wait_for_cursors(timeout=10)
+    assert list(items_engine.as_completed(timeout=10)) == []
+
+
+@pytest.fixture
+def retry_engine(sqlite_config):
+    sql_engine = SQLEngineClass(sql_config=sqlite_config, conn_max_pool_size=4,
+                                retry_policy=RetryPolicy(max_attempts=3, base_delay=0.2, jitter=False))
+    # A CHECK constraint named deadlock fails every attempt with an error classified as a deadlock
+    sql_engine.sql_execute('CREATE TABLE items (id INTEGER CONSTRAINT deadlock CHECK (id > 0))', execute=True)
+    yield sql_engine
+    sql_engine.close_connections(enable_log=False)
+
+
+def test_queued_retries_stay_pending_until_the_last_attempt(retry_engine):
+    future = retry_engine.sql_execute('INSERT INTO items VALUES (0)', execute=True, queue_cursor=True)
+    results = retry_engine.wait_for_cursors(timeout=10)
+
+    assert future.done()
+    assert results == [future.result()]
+    assert 'deadlock' in str(results[0].errors)
+
+
+def test_as_completed_yields_the_last_retry_attempt(retry_engine):
+    future = retry_engine.sql_execute('INSERT INTO items VALUES (0)', execute=True, queue_cursor=True)
+    assert retry_engine.cursors and retry_engine.cursors[0].is_pending
+
+    assert list(retry_engine.as_completed(timeout=10)) == [future.result(timeout=10)]
+    assert retry_engine.cursor_results == [future.result()]
@@ -0,0 +1,67 @@
+from __future__ import unicode_literals
+
+from KGlobal.sql.executor import SQLExecutor
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event
+
+import pickle
+import pytest
+
+
+@pytest.fixture
+def executor():
+    executor = SQLExecutor(max_workers=1, max_queue=1, block=False, executor_id='test')
+    yield executor
+    executor.shutdown()
+
+
+def test_submit_returns_the_result_of_fn(executor):
+    assert executor.submit(lambda a, b: a + b, 1, b=2).result(timeout=10) == 3
+
+
+def test_saturated_executor_rejects_instead_of_dropping_work(executor):
+    release = Event()
+    running = executor.submit(release.wait, 10)
+    queued = executor.submit(lambda: 'queued')
+    rejected = executor.submit(lambda: 'rejected')
+
+    with pytest.raises(ValueError, match='saturated'):
+        rejected.result(timeout=10)
+
+    release.set()
+    assert running.result(timeout=10) is True
+    assert queued.result(timeout=10) == 'queued'
+    assert executor.submit(lambda: 'freed').result(timeout=10) == 'freed'
+
+
+def test_blocking_submit_times_out_when_saturated(executor):
+    release = Event()
+    executor.submit(release.wait, 10)
+    executor.submit(release.wait, 10)
+
+    with pytest.raises(ValueError, match='saturated'):
+        executor.submit(lambda: None, block=True, timeout=0.05).result(timeout=10)
+
+    release.set()
+
+
+def test_shared_executor_is_not_shut_down():
+    with ThreadPoolExecutor(max_workers=1) as shared:
+        executor = SQLExecutor(max_workers=1, executor=shared)
+        executor.shutdown()
+        assert shared.submit(lambda: 'alive').result(timeout=10) == 'alive'
+
+
+def test_executor_survives_pickling(executor):
+    executor.submit(lambda: None).result(timeout=10)
+    clone = pickle.loads(pickle.dumps(executor))
+
+    assert clone.submit(lambda: 'clone').result(timeout=10) == 'clone'
+    clone.shutdown()
+
+
+def test_invalid_sizes_are_rejected():
+    with pytest.raises(ValueError):
+        SQLExecutor(max_workers=0)
+    with pytest.raises(ValueError):
+        SQLExecutor(max_queue=-1)
@@ -0,0 +1,139 @@
+from __future__ import unicode_literals
+
+from KGlobal.sql.export import ResultExporter
+from pandas import DataFrame, read_csv
+
+import gzip
+import io
+import sqlite3
+import pytest
+
+ROWS = [(1, None, 'a'), (2, None, 'b'), (3, 'x', None), (4, 'y', 'd'), (5, None, 'e')]
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE items (id INTEGER, tag TEXT, name TEXT)')
+    conn.executemany('INSERT INTO items VALUES (?, ?, ?)', ROWS)
+    yield conn
+    conn.close()
+
+
+def export(conn, path, query='SELECT * FROM items ORDER BY id', **kwargs):
+    # fetch_size=2 spreads the rows over three batches
+    with ResultExporter(str(path), fetch_size=2, **kwargs) as exporter:
+        exporter.write_dataset(conn.execute(query))
+
+    return exporter.stats
+
+
+def read_text(path, export_format):
+    if export_format == 'gzip':
+        return gzip.open(path, 'rt', encoding='utf-8', newline='').read()
+    elif export_format == 'zstd':
+        import zstandard
+        return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb')).read().decode('utf-8')
+
+    return open(path, encoding='utf-8', newline='').read()
+
+
+def read_parquet(path):
+    import pyarrow.parquet as pq
+    return pq.read_table(path).to_pydict()
+
+
+@pytest.mark.parametrize('export_format, name', [('csv', 'out.csv'), ('gzip', 'out.csv.gz'), ('zstd', 'out.csv.zst')])
+def test_csv_formats_write_every_batch(conn, tmp_path, export_format, name):
+    if export_format == 'zstd':
+        pytest.importorskip('zstandard')
+
+    stats = export(conn, tmp_path / name)
+    df = read_csv(io.StringIO(read_text(tmp_path / name, export_format)), keep_default_na=False)
+
+    assert stats['format'] == export_format
+    assert stats['rows'] == 5
+    assert df['id'].tolist() == [1, 2, 3, 4, 5]
+    assert df['tag'].tolist() == ['', '', 'x', 'y', '']
+
+
+def test_parquet_keeps_columns_that_are_null_in_the_first_batch(conn, tmp_path):
+    stats = export(conn, tmp_path / 'out.parquet')
+    table = read_parquet(tmp_path / 'out.parquet')
+
+    assert stats['rows'] == 5
+    assert table == dict(id=[1, 2, 3, 4, 5], tag=[None, None, 'x', 'y', None], name=['a', 'b', None, 'd', 'e'])
+
+
+def test_parquet_writes_empty_result_sets(conn, tmp_path):
+    stats = export(conn, tmp_path / 'out.parquet', query='SELECT * FROM items WHERE id < 0')
+
+    assert stats['rows'] == 0
+    assert list(read_parquet(tmp_path / 'out.parquet')) == ['id', 'tag', 'name']
+
+
+def test_later_result_sets_go_to_their_own_parquet_file(conn, tmp_path):
+    with ResultExporter(str(tmp_path / 'out.parquet'), fetch_size=2) as exporter:
+        exporter.write_dataset(conn.execute('SELECT id FROM items'))
+        exporter.write_dataset(conn.execute('SELECT name FROM items WHERE id > 3'))
+
+    assert exporter.stats['paths'] == [str(tmp_path / 'out.parquet'), str(tmp_path / 'out_1.parquet')]
+    assert exporter.stats['rows'] == 7
+    assert read_parquet(tmp_path / 'out_1.parquet') == dict(name=['d', 'e'])
+
+
+def test_later_result_sets_are_appended_to_csv_with_their_header(conn, tmp_path):
+    with ResultExporter(str(tmp_path / 'out.csv'), fetch_size=2) as exporter:
+        exporter.write_dataset(conn.execute('SELECT id FROM items WHERE id < 3'))
+        exporter.write_dataset(conn.execute('SELECT name FROM items WHERE id > 3'))
+
+    lines = read_text(tmp_path / 'out.csv', 'csv').splitlines()
+    assert lines == ['"id"', '"1"', '"2"', '"name"', '"d"', '"e"']
+
+
+def test_csv_exports_append_to_existing_files(conn, tmp_path):
+    first = export(conn, tmp_path / 'out.csv')
+    second = export(conn, tmp_path / 'out.csv', query='SELECT * FROM items WHERE id = 1')
+
+    lines = read_text(tmp_path / 'out.csv', 'csv').splitlines()
+    assert len(lines) == 6 + 2
+    assert lines[6:] == ['"id","tag","name"', '"1","","a"']
+    assert first['bytes_written'] + second['bytes_written'] == (tmp_path / 'out.csv').stat().st_size
+
+
+def test_sql_execute_exports_to_parquet_path(sql_engine, tmp_path):
+    sql_engine.sql_execute('CREATE TABLE items (id INTEGER, tag TEXT)', execute=True)
+    sql_engine.sql_execute("INSERT INTO items VALUES (1, NULL), (2, 'x')", execute=True)
+    cursor = sql_engine.sql_execute('SELECT * FROM items ORDER BY id', parquet_path=str(tmp_path / 'out.parquet'))
+
+    assert cursor.errors is None
+    assert read_parquet(tmp_path / 'out.parquet') == dict(id=[1, 2], tag=[None, 'x'])
+
+
+@pytest.mark.parametrize('name', ['items.parquet', 'items.arrow'])
+def test_datasets_are_uploaded_batch_by_batch(sql_engine, tmp_path, monkeypatch, name):
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+    from KGlobal.sql import cursor
+    from KGlobal.sql.upload import iter_dataset_frames
+
+    frames = list()
+    monkeypatch.setattr(cursor, 'iter_dataset_frames',
+                        lambda source: [frames.append(f) or f for f in iter_dataset_frames(source, batch_rows=2)])
+    table = pa.Table.from_pandas(DataFrame({'name': list('abcde')}), preserve_index=False)
+
+    if name.endswith('.parquet'):
+        pq.write_table(table, tmp_path / name)
+    else:
+        feather.write_feather(table, str(tmp_path / name))
+
+    sql_engine.sql_execute("CREATE TABLE items (ID INTEGER, name TEXT)", execute=True)
+    sql_engine.sql_execute("INSERT INTO items VALUES (9, 'z')", execute=True)
+    upload_cursor = sql_engine.sql_upload(str(tmp_path / name), 'items', if_exists='replace')
+
+    assert upload_cursor.errors is None
+    assert [len(frame) for frame in frames] == [2, 2, 1]
+    items = sql_engine.sql_execute('SELECT ID, name FROM items ORDER BY ID').results[0]
+    assert items['ID'].tolist() == [0, 1, 2, 3, 4]
+    assert items['name'].tolist() == list('abcde')
@@ -0,0 +1,178 @@
+from __future__ import unicode_literals
+
+from KGlobal.sql.materializer import ColumnarMaterializer, ChunkBuilder, DtypeCache, materialize_dataframe
+from pandas import isna
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+BIG_INT = 9007199254740993
+
+
+class FakeCursor(object):
+    """
+    DB-API cursor over a list of rows with pyodbc style type codes in its description
+    """
+
+    def __init__(self, columns, rows):
+        self.description = [(name, type_code, None, None, None, None, True) for name, type_code in columns]
+        self.rows = list(rows)
+
+    def fetchmany(self, size):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+    def fetchall(self):
+        return self.fetchmany(len(self.rows))
+
+
+def values(series):
+    return [None if isna(v) else v for v in series]
+
+
+def build_chunks(builder):
+    return [builder.build_dataframe(rows) for rows in builder.fetch_batches()]
+
+
+def test_columnar_materializer_builds_typed_columns():
+    cursor = FakeCursor([('id', int), ('price', float), ('at', datetime), ('name', str)],
+                        [(1, 1.5, datetime(2020, 1, 1), 'a'), (2, None, None, 'b')])
+    df = ColumnarMaterializer(cursor, fetch_size=1).to_dataframe()
+
+    assert df['id'].dtype == np.int64
+    assert df['price'].isna().tolist() == [False, True]
+    assert df['at'].dtype.kind == 'M'
+    assert df['name'].tolist() == ['a', 'b']
+
+
+def test_materialize_dataframe_records_stats():
+    from KGlobal.sql.stats import CursorStats
+
+    stats = CursorStats()
+    df = materialize_dataframe(FakeCursor([('id', int)], [(i,) for i in range(5)]), fetch_size=2, stats=stats)
+
+    assert df['id'].tolist() == list(range(5))
+    assert stats.rows == 5
+    assert stats.bytes == 40
+
+
+def test_nullable_int_without_nulls_stays_exact_int64():
+    # pyodbc marks every nullable column null_ok, that alone must not turn integers into floats
+    builder = ChunkBuilder(FakeCursor([('id', int)], [(BIG_INT,), (2,), (3,)]), chunk_rows=2)
+    chunks = build_chunks(builder)
+
+    assert [chunk['id'].dtype for chunk in chunks] == [np.int64, np.int64]
+    assert chunks[0]['id'][0] == BIG_INT
+
+
+def test_int_column_switches_to_nullable_int64_on_the_first_null():
+    builder = ChunkBuilder(FakeCursor([('id', int)], [(BIG_INT,), (2,), (None,), (BIG_INT,), (5,)]), chunk_rows=2)
+    chunks = build_chunks(builder)
+
+    assert [str(chunk['id'].dtype) for chunk in chunks] == ['int64', 'Int64', 'Int64']
+    assert chunks[1]['id'].isna().tolist() == [True, False]
+    assert chunks[1]['id'][1] == BIG_INT
+
+
+def test_bit_column_with_nulls_is_nullable_boolean():
+    builder = ChunkBuilder(FakeCursor([('flag', bool)], [(True,), (None,), (False,)]), chunk_rows=3)
+    chunk = build_chunks(builder)[0]
+
+    assert str(chunk['flag'].dtype) == 'boolean'
+    assert chunk['flag'].isna().tolist() == [False, True, False]
+
+
+def test_values_that_do_not_fit_promote_the_column_to_object():
+    builder = ChunkBuilder(FakeCursor([('id', int)], [(1,), (2 ** 70,)]), chunk_rows=1)
+    chunks = build_chunks(builder)
+
+    assert chunks[0]['id'].dtype == np.int64
+    assert chunks[1]['id'].dtype == object
+    assert chunks[1]['id'][0] == 2 ** 70
+
+
+def test_untyped_columns_are_inferred_without_casting_other_types():
+    # sqlite3 reports no type codes, an int column must not truncate a later float
+    builder = ChunkBuilder(FakeCursor([('value', None)], [(1,), (2.5,)]), chunk_rows=1)
+    chunks = build_chunks(builder)
+
+    assert chunks[0]['value'].dtype == np.int64
+    assert chunks[1]['value'][0] == 2.5
+
+
+def test_chunks_keep_their_data_while_later_batches_are_built():
+    builder = ChunkBuilder(FakeCursor([('id', int), ('price', float)], [(i, i / 2.0) for i in range(6)]),
+                           chunk_rows=2)
+    chunks = build_chunks(builder)
+
+    assert [chunk['id'].tolist() for chunk in chunks] == [[0, 1], [2, 3], [4, 5]]
+    assert chunks[0]['price'].tolist() == [0.0, 0.5]
+
+
+def test_filled_buffers_are_handed_to_the_chunk_without_a_copy():
+    builder = ChunkBuilder(FakeCursor([('id', int)], [(i,) for i in range(4)]), chunk_rows=4)
+    rows = next(builder.fetch_batches())
+    builder.build_dataframe(rows[:1])
+    buffer = builder._ChunkBuilder__buffers[0]
+    chunk = builder.build_dataframe(rows)
+
+    assert np.shares_memory(chunk['id'].to_numpy(), buffer)
+    assert builder._ChunkBuilder__buffers[0] is not buffer
+
+
+def test_row_start_sets_the_index():
+    builder = ChunkBuilder(FakeCursor([('id', int)], [(1,), (2,)]), chunk_rows=2)
+    chunk = builder.build_dataframe(next(builder.fetch_batches()), row_start=10)
+
+    assert chunk.index.tolist() == [10, 11]
+
+
+def test_dtypes_are_cached_per_query_and_description():
+    dtype_cache = DtypeCache()
+    columns = [('id', int)]
+    first = ChunkBuilder(FakeCursor(columns, [(1,), (None,)]), chunk_rows=2, cache_key='q', dtype_cache=dtype_cache)
+    build_chunks(first)
+
+    # The next run starts from the nullable dtype even though its first chunk has no NULL
+    second = ChunkBuilder(FakeCursor(columns, [(1,), (2,)]), chunk_rows=2, cache_key='q', dtype_cache=dtype_cache)
+    assert str(build_chunks(second)[0]['id'].dtype) == 'Int64'
+    assert dtype_cache.hits == 1
+
+    other = ChunkBuilder(FakeCursor(columns, [(1,)]), chunk_rows=2, cache_key='other', dtype_cache=dtype_cache)
+    assert build_chunks(other)[0]['id'].dtype == np.int64
+
+
+def test_dtype_cache_evicts_least_recently_used():
+    dtype_cache = DtypeCache(max_entries=2)
+    dtype_cache.put('a', [np.dtype('int64')])
+    dtype_cache.put('b', [np.dtype('int64')])
+    dtype_cache.get('a')
+    dtype_cache.put('c', [np.dtype('int64')])
+
+    assert dtype_cache.get('b') is None
+    assert dtype_cache.get('a') == [np.dtype('int64')]
+    assert len(dtype_cache) == 2
+
+    with pytest.raises(ValueError):
+        DtypeCache(max_entries=0)
+
+
+def test_iter_query_and_handlers_keep_big_integers_exact(sql_engine):
+    sql_engine.sql_execute('CREATE TABLE numbers (id INTEGER PRIMARY KEY, value BIGINT)', execute=True)
+    sql_engine.sql_execute('INSERT INTO numbers (value) VALUES (?)', execute=True, many=True,
+                           params=[(BIG_INT,), (None,), (BIG_INT,)])
+
+    chunks = list(sql_engine.iter_query('SELECT value FROM numbers ORDER BY id', chunk_rows=1))
+    assert [values(chunk['value']) for chunk in chunks] == [[BIG_INT], [None], [BIG_INT]]
+    assert [chunk.index[0] for chunk in chunks] == [0, 1, 2]
+
+    handled = list()
+
+    @sql_engine.stream_execute(buffer=2)
+    def handler(df, row_start, row_end):
+        handled.append((values(df['value']), row_start, row_end))
+
+    cursor = sql_engine.sql_execute('SELECT value FROM numbers ORDER BY id')
+    assert cursor.errors is None
+    assert handled == [([BIG_INT, None], 0, 1), ([BIG_INT], 2, 2)]
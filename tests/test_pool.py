@@ -0,0 +1,104 @@
+from __future__ import unicode_literals
+
+from KGlobal.sql.pool import SQLConnectionPool
+from itertools import count
+from time import sleep
+
+import pytest
+
+
+class Connections(object):
+    """
+    connect/validate/close functions for SQLConnectionPool that record what the pool did
+    """
+
+    def __init__(self):
+        self.spids = count(1)
+        self.closed = list()
+        self.invalid = set()
+
+    def connect(self):
+        spid = next(self.spids)
+        return ['conn%s' % spid, spid]
+
+    def validate(self, engine):
+        return [None, None] if engine in self.invalid else [engine, int(engine[4:])]
+
+    def close(self, engine):
+        self.closed.append(engine)
+
+
+@pytest.fixture
+def conns():
+    return Connections()
+
+
+def make_pool(conns, **kwargs):
+    return SQLConnectionPool(conns.connect, conns.validate, conns.close, pool_id='test', **kwargs)
+
+
+def test_idle_connections_are_reused_most_recent_first(conns):
+    pool = make_pool(conns, max_size=3)
+    first, second = pool.checkout(), pool.checkout()
+    pool.checkin(first[0])
+    pool.checkin(second[0])
+
+    assert pool.checkout() == second
+    assert (pool.size, pool.idle_count, pool.checked_out_count) == (2, 1, 1)
+
+
+def test_checkout_times_out_when_the_pool_is_full(conns):
+    pool = make_pool(conns, max_size=1)
+    pool.checkout()
+
+    with pytest.raises(ValueError, match='timed out'):
+        pool.checkout(timeout=0.05)
+
+
+def test_connections_failing_validation_are_replaced(conns):
+    pool = make_pool(conns, max_size=1)
+    engine, spid = pool.checkout()
+    pool.checkin(engine, validate=True)
+    conns.invalid.add(engine)
+
+    assert pool.checkout() == ['conn2', 2]
+    assert conns.closed == ['conn1']
+    assert pool.size == 1
+
+
+def test_close_all_closes_checked_out_connections_when_they_return(conns):
+    pool = make_pool(conns, max_size=2)
+    busy, idle = pool.checkout(), pool.checkout()
+    pool.checkin(idle[0])
+
+    pool.close_all()
+    assert pool.closed
+    assert conns.closed == ['conn2']
+
+    pool.checkin(busy[0])
+    assert conns.closed == ['conn2', 'conn1']
+    assert (pool.size, pool.idle_count) == (0, 0)
+
+
+def test_pool_is_usable_after_close_all(conns):
+    pool = make_pool(conns, max_size=2)
+    busy = pool.checkout()
+    pool.close_all()
+
+    fresh = pool.checkout()
+    assert not pool.closed
+    pool.checkin(fresh[0])
+    pool.checkin(busy[0])
+
+    assert conns.closed == ['conn1']
+    assert pool.checkout() == fresh
+
+
+def test_aged_connections_are_closed_on_checkin(conns):
+    pool = make_pool(conns, max_size=1, max_age=0.01)
+    engine, spid = pool.checkout()
+    sleep(0.02)
+    pool.checkin(engine)
+
+    assert conns.closed == ['conn1']
+    assert pool.size == 0
@@ -0,0 +1,138 @@
+from __future__ import unicode_literals
+
+from KGlobal.sql.queue import BaseSQLQueue
+from threading import Thread
+from time import sleep, monotonic
+
+import pytest
+
+
+@pytest.fixture
+def elastic_queue(sqlite_config):
+    sql_queue = BaseSQLQueue('test', max_pool_size=1, elastic=True, idle_ttl=0.2)
+    sql_queue.register_sql_config(sqlite_config, min_size=1, max_size=3, conn_max_pool_size=2)
+    yield sql_queue
+    sql_queue.close_pool(enable_log=False)
+
+
+def wait_for(predicate, timeout=5):
+    end_time = monotonic() + timeout
+
+    while not predicate() and monotonic() < end_time:
+        sleep(0.02)
+
+    return predicate()
+
+
+def test_elastic_pool_grows_on_demand_up_to_max_size(elastic_queue):
+    assert elastic_queue.stats['idle'] == 1
+    engines = [elastic_queue.pop_sql_engine_from_pool(timeout=1) for _ in range(3)]
+
+    with pytest.raises(ValueError, match='timed out'):
+        elastic_queue.pop_sql_engine_from_pool(timeout=0.05)
+
+    stats = elastic_queue.stats
+    assert (stats['created'], stats['in_use'], stats['timeouts']) == (3, 3, 1)
+    assert (stats['engines_high_water'], stats['in_use_high_water']) == (3, 3)
+    assert stats['configs'][0]['size'] == 3
+
+    for sql_engine in engines:
+        elastic_queue.queue_sql_engine_to_pool(sql_engine)
+
+
+def test_idle_engines_shrink_to_min_size_without_further_pops(elastic_queue):
+    engines = [elastic_queue.pop_sql_engine_from_pool(timeout=1) for _ in range(3)]
+
+    for sql_engine in engines:
+        elastic_queue.queue_sql_engine_to_pool(sql_engine)
+
+    assert elastic_queue.stats['idle'] == 3
+    assert wait_for(lambda: elastic_queue.stats['idle'] == 1)
+
+    stats = elastic_queue.stats
+    assert (stats['pruned'], stats['configs'][0]['size']) == (2, 1)
+    sleep(0.3)
+    assert elastic_queue.stats['idle'] == 1
+
+
+def test_pruning_does_not_run_on_the_checkout_path(elastic_queue, monkeypatch):
+    calls = list()
+    monkeypatch.setattr(elastic_queue, 'prune', lambda: calls.append('prune'))
+    sql_engine = elastic_queue.pop_sql_engine_from_pool(timeout=1)
+
+    assert calls == list()
+    elastic_queue.queue_sql_engine_to_pool(sql_engine)
+
+
+@pytest.fixture
+def sql_queue(sqlite_config):
+    sql_queue = BaseSQLQueue('test', max_pool_size=2)
+    sql_queue.create_sql_engine_to_pool(sqlite_config, conn_max_pool_size=2)
+    yield sql_queue
+    sql_queue.close_pool(enable_log=False)
+
+
+def test_waiters_are_served_first_come_first_served(sql_queue):
+    sql_engine = sql_queue.pop_sql_engine_from_pool(timeout=1)
+    order = list()
+
+    def wait(i):
+        popped = sql_queue.pop_sql_engine_from_pool(timeout=5)
+        order.append(i)
+        sql_queue.queue_sql_engine_to_pool(popped)
+
+    threads = list()
+
+    for i in range(3):
+        threads.append(Thread(target=wait, args=(i,)))
+        threads[-1].start()
+        assert wait_for(lambda: sql_queue.waiters == i + 1)
+
+    sql_queue.queue_sql_engine_to_pool(sql_engine)
+
+    for thread in threads:
+        thread.join(5)
+
+    assert order == [0, 1, 2]
+    stats = sql_queue.stats
+    assert (stats['waits'], stats['waiters'], stats['waiters_high_water']) == (3, 0, 3)
+    assert stats['wait_time_max'] > 0 and stats['wait_time_total'] >= stats['wait_time_max']
+
+
+def test_timed_out_waiter_leaves_no_reservation(sql_queue):
+    sql_engine = sql_queue.pop_sql_engine_from_pool(timeout=1)
+
+    with pytest.raises(ValueError, match='timed out'):
+        sql_queue.pop_sql_engine_from_pool(timeout=0.05)
+
+    assert sql_queue.waiters == 0
+    sql_queue.queue_sql_engine_to_pool(sql_engine)
+
+    stats = sql_queue.stats
+    assert (stats['timeouts'], stats['idle'], stats['in_use']) == (1, 1, 0)
+    assert sql_queue.pop_sql_engine_from_pool(timeout=0.05) is sql_engine
+
+
+def test_timed_out_elastic_waiter_leaves_no_reservation(elastic_queue):
+    engines = [elastic_queue.pop_sql_engine_from_pool(timeout=1) for _ in range(3)]
+
+    with pytest.raises(ValueError, match='timed out'):
+        elastic_queue.pop_sql_engine_from_pool(timeout=0.05)
+
+    assert elastic_queue.stats['configs'][0]['size'] == 3
+    elastic_queue.queue_sql_engine_to_pool(engines[-1])
+    assert elastic_queue.pop_sql_engine_from_pool(timeout=0.05) is engines[-1]
+
+    for sql_engine in engines:
+        elastic_queue.queue_sql_engine_to_pool(sql_engine)
+
+
+def test_engine_context_manager_returns_the_engine_after_an_exception(sql_queue):
+    with pytest.raises(RuntimeError):
+        with sql_queue.engine(timeout=1) as sql_engine:
+            assert sql_queue.stats['in_use'] == 1
+            raise RuntimeError('boom')
+
+    stats = sql_queue.stats
+    assert (stats['idle'], stats['in_use'], stats['returns']) == (1, 0, 2)
+    assert sql_queue.pool_list == [sql_engine]
@@ -0,0 +1,48 @@
+from __future__ import unicode_literals
+
+from KGlobal.sql import SQLConfig, SQLEngineClass, SQLEngineRegistry, get_sql_engine, dispose_sql_engines
+
+import pytest
+
+
+def test_engines_are_shared_per_config(sqlite_config):
+    engine = get_sql_engine(sqlite_config)
+
+    assert get_sql_engine(SQLConfig(conn_type='alchemy', conn_str=sqlite_config.conn_str)) is engine
+    dispose_sql_engines(sqlite_config)
+    assert get_sql_engine(sqlite_config) is not engine
+
+
+def test_shared_pool_serves_the_combined_demand_of_every_engine(sqlite_config):
+    # Four engines with pools of four hold 20 connections, more than pool_size + a bounded overflow would allow
+    sql_engines = [SQLEngineClass(sql_config=sqlite_config, conn_max_pool_size=4) for _ in range(4)]
+    held = list()
+
+    try:
+        for sql_engine in sql_engines:
+            assert sql_engine.engine_spid[0] is not None
+
+            for _ in range(4):
+                held.append((sql_engine, sql_engine.conn_pool.checkout(timeout=5)[0]))
+
+        assert len(held) == 16
+        assert get_sql_engine(sqlite_config).pool.checkedout() == 20
+    finally:
+        for sql_engine, engine in held:
+            sql_engine.conn_pool.checkin(engine)
+
+        for sql_engine in sql_engines:
+            sql_engine.close_connections(enable_log=False)
+
+
+def test_sqlalchemy_errors_are_raised_as_value_errors(tmp_path):
+    sql_config = SQLConfig(conn_type='alchemy', conn_str='nosuchdialect://%s' % tmp_path)
+    sql_engine = SQLEngineClass(sql_config=sql_config)
+
+    try:
+        assert sql_engine.connect(test_conn=True) is False
+
+        with pytest.raises(ValueError):
+            sql_engine.connect()
+    finally:
+        SQLEngineRegistry.dispose(sql_config)
@@ -0,0 +1,91 @@
+from __future__ import unicode_literals
+
+from KGlobal.sql.retry import RetryPolicy, classify_error
+from concurrent.futures import Future
+from types import SimpleNamespace
+
+import pytest
+
+DEADLOCK = ['40001', 'Transaction (Process ID 52) was deadlocked on lock resources (1205)']
+DISCONNECT = ['08S01', 'Communication link failure']
+
+
+def attempts(*outcomes):
+    """
+    attempt_fn that returns a result with each outcome's errors in turn, or raises it when it is an exception
+    """
+
+    outcomes, calls = list(outcomes), list()
+
+    def attempt_fn():
+        outcome = outcomes[len(calls)]
+        calls.append(outcome)
+
+        if isinstance(outcome, Exception):
+            raise outcome
+
+        return SimpleNamespace(errors=outcome)
+
+    attempt_fn.calls = calls
+    return attempt_fn
+
+
+def test_classify_error():
+    assert classify_error(DEADLOCK) == 'deadlock'
+    assert classify_error(DISCONNECT) == 'disconnect'
+    assert classify_error(ValueError('Login timeout expired')) == 'disconnect'
+    assert classify_error(['42S02', 'Invalid object name']) is None
+    assert classify_error(None) is None
+
+
+def test_deadlocks_are_retried_until_success():
+    attempt_fn = attempts(DEADLOCK, DEADLOCK, None)
+    result = RetryPolicy(base_delay=0).run(attempt_fn)
+
+    assert result.errors is None
+    assert len(attempt_fn.calls) == 3
+
+
+def test_disconnects_are_only_retried_when_idempotent():
+    policy = RetryPolicy(base_delay=0)
+    assert policy.run(attempts(DISCONNECT, None)).errors == DISCONNECT
+    assert policy.run(attempts(DISCONNECT, None), idempotent=True).errors is None
+
+
+def test_attempts_stop_at_max_attempts_and_on_other_errors():
+    policy = RetryPolicy(max_attempts=2, base_delay=0)
+    attempt_fn = attempts(DEADLOCK, DEADLOCK, None)
+    assert policy.run(attempt_fn).errors == DEADLOCK
+    assert len(attempt_fn.calls) == 2
+
+    attempt_fn = attempts(['42S02', 'Invalid object name'], None)
+    assert policy.run(attempt_fn).errors
+    assert len(attempt_fn.calls) == 1
+
+
+def test_connection_errors_raised_as_value_error_are_retried():
+    attempt_fn = attempts(ValueError('Login timeout expired'), None)
+    assert RetryPolicy(base_delay=0).run(attempt_fn, idempotent=True).errors is None
+
+    with pytest.raises(ValueError, match='bad config'):
+        RetryPolicy(base_delay=0).run(attempts(ValueError('bad config')), idempotent=True)
+
+
+def test_backoff_doubles_up_to_max_delay():
+    policy = RetryPolicy(base_delay=1, max_delay=3, jitter=False)
+    assert [policy.delay(attempt) for attempt in (1, 2, 3)] == [1, 2, 3]
+
+    for attempt in (1, 2, 3):
+        assert 0 <= RetryPolicy(base_delay=1, max_delay=3).delay(attempt) <= 3
+
+
+def test_run_future_resolves_to_the_last_attempt():
+    attempt_fn = attempts(DEADLOCK, None)
+
+    def submit_fn():
+        future = Future()
+        future.set_result(attempt_fn())
+        return future
+
+    assert RetryPolicy(base_delay=0).run_future(submit_fn).result(timeout=10).errors is None
+    assert len(attempt_fn.calls) == 2
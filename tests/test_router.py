@@ -0,0 +1,65 @@
+from __future__ import unicode_literals
+
+from KGlobal.sql import SQLConfig, SQLEngineGroup, dispose_sql_engines
+from concurrent.futures import Future
+
+import pytest
+
+
+@pytest.fixture
+def engine_group(tmp_path):
+    # The replica reads the primary's database file through its own SQLConfig
+    db_path = tmp_path / 'kglobal.db'
+    primary = SQLConfig(conn_type='alchemy', conn_str='sqlite:///%s' % db_path)
+    replica = SQLConfig(conn_type='alchemy', conn_str='sqlite:///%s?timeout=5' % db_path)
+    engine_group = SQLEngineGroup(primary, [replica], conn_max_pool_size=2, group_id='test')
+    yield engine_group
+    engine_group.close_connections(enable_log=False)
+    dispose_sql_engines(primary)
+    dispose_sql_engines(replica)
+
+
+def test_writes_go_to_the_primary_and_reads_to_the_replica(engine_group):
+    cursor = engine_group.sql_execute('CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)', execute=True)
+    assert cursor.errors is None
+    cursor = engine_group.sql_execute("INSERT INTO items (name) VALUES ('a'), ('b')", execute=True)
+    assert cursor.errors is None
+
+    cursor = engine_group.sql_execute('SELECT id, name FROM items ORDER BY id')
+    assert cursor.errors is None
+    assert cursor.results[0]['name'].tolist() == ['a', 'b']
+
+    primary, replica = engine_group.stats
+    assert (primary['role'], primary['calls']) == ('primary', 2)
+    assert (replica['role'], replica['calls'], replica['errors']) == ('replica', 1, 0)
+
+
+def test_route_override_reads_from_the_primary(engine_group):
+    engine_group.sql_execute('CREATE TABLE items (id INTEGER)', execute=True)
+    engine_group.sql_execute('SELECT id FROM items', route='primary')
+
+    assert [node['calls'] for node in engine_group.stats] == [2, 0]
+    assert engine_group.route() is engine_group.replicas[0]
+    assert engine_group.route(write=True) is engine_group.primary
+
+
+def test_queued_reads_return_their_connections(engine_group):
+    engine_group.sql_execute('CREATE TABLE items (id INTEGER)', execute=True)
+    engine_group.sql_execute('INSERT INTO items VALUES (1), (2), (3)', execute=True)
+    futures = [engine_group.sql_execute('SELECT id FROM items', queue_cursor=True) for _ in range(4)]
+
+    for future in futures:
+        assert isinstance(future, Future)
+        cursor = future.result(timeout=10)
+        assert cursor.errors is None
+        assert cursor.results[0]['id'].tolist() == [1, 2, 3]
+
+    replica = engine_group.replicas[0]
+    assert replica.cursors == list()
+    assert replica.conn_pool.checked_out_count == 0
+    assert engine_group.stats[1]['in_flight'] == 0
+
+
+def test_invalid_route_is_rejected(engine_group):
+    with pytest.raises(ValueError):
+        engine_group.sql_execute('SELECT 1', route='secondary')
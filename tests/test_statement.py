@@ -0,0 +1,76 @@
+from __future__ import unicode_literals
+
+from KGlobal.sql.statement import SQLStatementCache
+
+import pytest
+
+
+class Cursor(object):
+    def __init__(self, name):
+        self.name = name
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_least_recently_used_cursors_are_evicted():
+    cache, engine = SQLStatementCache(max_statements=2), object()
+    first, second, third = Cursor('first'), Cursor('second'), Cursor('third')
+    cache.checkin(engine, 'q1', first)
+    cache.checkin(engine, 'q2', second)
+    cache.checkin(engine, 'q1', cache.checkout(engine, 'q1'))
+    cache.checkin(engine, 'q3', third)
+
+    assert len(cache) == 2
+    assert second.closed and not first.closed
+    assert cache.checkout(engine, 'q2') is None
+    assert cache.checkout(engine, 'q1') is first
+
+
+def test_cursors_are_only_reused_on_their_own_connection():
+    cache, engine, other = SQLStatementCache(), object(), object()
+    cursor = Cursor('q')
+    cache.checkin(engine, 'q', cursor)
+
+    assert cache.checkout(other, 'q') is None
+    assert cache.checkout(engine, 'q') is cursor
+    assert cache.checkout(engine, 'q') is None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_discard_closes_the_cursors_of_one_connection():
+    cache, engine, other = SQLStatementCache(), object(), object()
+    cursors = [Cursor('a'), Cursor('b'), Cursor('c')]
+    cache.checkin(engine, 'a', cursors[0])
+    cache.checkin(engine, 'b', cursors[1])
+    cache.checkin(other, 'a', cursors[2])
+    cache.discard(engine)
+
+    assert [cursor.closed for cursor in cursors] == [True, True, False]
+    assert cache.checkout(engine, 'a') is None
+    assert cache.checkout(other, 'a') is cursors[2]
+
+
+@pytest.fixture
+def items_engine(sql_engine):
+    sql_engine.sql_execute('CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)', execute=True)
+    sql_engine.sql_execute("INSERT INTO items (name) VALUES ('a'), ('b')", execute=True)
+    return sql_engine
+
+
+def test_closing_connections_purges_their_prepared_statements(items_engine):
+    cache = items_engine.statement_cache
+    items_engine.sql_execute('SELECT name FROM items WHERE id = ?', params=(1,))
+    items_engine.sql_execute('SELECT name FROM items WHERE id = ?', params=(2,), new_engine=True)
+    assert len(cache) == 2
+
+    items_engine.conn_pool.close_all()
+    assert len(cache) == 1
+
+    items_engine.close_connections(enable_log=False)
+    assert len(cache) == 0
+
+    cursor = items_engine.sql_execute('SELECT name FROM items WHERE id = ?', params=(2,))
+    assert cursor.results[0]['name'].tolist() == ['b']
+    assert cache.hits == 0
@@ -0,0 +1,53 @@
+from __future__ import unicode_literals
+
+from KGlobal.sql import SQLEngineClass
+from KGlobal.sql.stats import CursorStats
+
+import logging
+import pytest
+
+SLOW_QUERY = ('WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 2000000) '
+              'SELECT COUNT(*) AS c FROM n')
+
+
+@pytest.fixture
+def stats_engine(sqlite_config):
+    # One worker, so a second queued cursor waits for the first one
+    sql_engine = SQLEngineClass(sql_config=sqlite_config, conn_max_pool_size=2, executor_workers=1,
+                                slow_query_threshold=0.05)
+    sql_engine.sql_execute('CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)', execute=True)
+    sql_engine.sql_execute("INSERT INTO items (name) VALUES ('a'), ('b'), ('c')", execute=True)
+    sql_engine.query_stats.reset()
+    yield sql_engine
+    sql_engine.close_connections(enable_log=False)
+
+
+def test_phases_add_up_to_the_total(stats_engine):
+    stats = stats_engine.sql_execute(SLOW_QUERY).stats
+    phases = sum(getattr(stats, phase) for phase in CursorStats.PHASES)
+
+    assert stats.rows == 1
+    assert stats.execute > 0
+    assert phases <= stats.total
+    assert stats.total - phases < max(0.05, stats.total * 0.2)
+
+
+def test_queued_cursors_record_their_queue_wait(stats_engine):
+    slow = stats_engine.sql_execute(SLOW_QUERY, queue_cursor=True, new_engine=True)
+    fast = stats_engine.sql_execute('SELECT name FROM items', queue_cursor=True, new_engine=True)
+    slow, fast = slow.result(timeout=30), fast.result(timeout=30)
+
+    assert fast.stats.queue_wait >= slow.stats.execute * 0.5
+    assert stats_engine.query_stats.snapshot()['queue_wait'] >= fast.stats.queue_wait
+
+
+def test_slow_queries_are_logged_to_the_slow_logger(stats_engine, caplog):
+    with caplog.at_level(logging.WARNING, logger='KGlobal.sql.stats.slow'):
+        stats_engine.sql_execute('SELECT name FROM items')
+        stats_engine.sql_execute(SLOW_QUERY)
+
+    records = [r for r in caplog.records if r.name == 'KGlobal.sql.stats.slow']
+    assert len(records) == 1
+    assert 'Slow execute' in records[0].getMessage()
+    assert 'WITH RECURSIVE' in records[0].getMessage()
+    assert stats_engine.query_stats.snapshot()['slow'] == 1
@@ -0,0 +1,66 @@
+from __future__ import unicode_literals
+
+from pandas import DataFrame
+
+import pytest
+
+
+@pytest.fixture
+def items_engine(sql_engine):
+    sql_engine.sql_execute('CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)', execute=True)
+    return sql_engine
+
+
+def names(sql_engine):
+    return sql_engine.sql_execute('SELECT name FROM items ORDER BY id').results[0]['name'].tolist()
+
+
+def test_statements_and_uploads_commit_once(items_engine):
+    with items_engine.transaction() as tx:
+        tx.execute("INSERT INTO items (name) VALUES ('a')")
+        tx.upload(DataFrame({'name': ['b', 'c']}), 'items', index=False, method='fast_executemany')
+        result = tx.execute('SELECT COUNT(*) AS c FROM items')
+
+    assert result.results[0]['c'][0] == 3
+    assert not tx.active
+    assert names(items_engine) == ['a', 'b', 'c']
+
+
+def test_exception_rolls_everything_back(items_engine):
+    with pytest.raises(ValueError, match='boom'):
+        with items_engine.transaction() as tx:
+            tx.execute("INSERT INTO items (name) VALUES ('a')")
+            raise ValueError('boom')
+
+    assert names(items_engine) == []
+    assert items_engine.conn_pool.checked_out_count == 0
+
+
+def test_failed_savepoint_only_undoes_its_own_work(items_engine):
+    with items_engine.transaction() as tx:
+        tx.execute("INSERT INTO items (name) VALUES ('kept')")
+
+        with pytest.raises(Exception):
+            with tx.savepoint():
+                tx.execute("INSERT INTO items (name) VALUES ('undone')")
+                tx.execute('INSERT INTO missing VALUES (1)')
+
+        with tx.savepoint() as outer:
+            tx.execute("INSERT INTO items (name) VALUES ('outer')")
+            inner = tx.savepoint()
+            tx.execute("INSERT INTO items (name) VALUES ('inner')")
+            tx.rollback_savepoint(inner)
+            assert tx.savepoints == [outer]
+
+    assert names(items_engine) == ['kept', 'outer']
+
+
+def test_transaction_cannot_be_reused_after_commit(items_engine):
+    tx = items_engine.transaction().begin()
+    tx.execute("INSERT INTO items (name) VALUES ('a')")
+    tx.commit()
+
+    with pytest.raises(ValueError):
+        tx.execute("INSERT INTO items (name) VALUES ('b')")
+
+    assert names(items_engine) == ['a']
@@ -0,0 +1,132 @@
+from __future__ import unicode_literals
+
+from KGlobal.sql.upload import BulkUploader, UpsertUploader, csv_field, iter_csv_rows
+from sqlalchemy import create_engine
+from sqlalchemy.dialects import mssql
+from types import SimpleNamespace
+from pandas import DataFrame, Timestamp, array
+
+import io
+import pytest
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine('sqlite:///%s' % (tmp_path / 'upload.db'))
+    yield engine
+    engine.dispose()
+
+
+def frame():
+    return DataFrame({'num': array([1, None, 2 ** 53 + 1], dtype='Int64'), 'val': [1.5, 2.25, None],
+                      'txt': ['', None, 'a, "b"\nc'], 'flag': [True, False, True],
+                      'at': [Timestamp('2024-01-02 03:04:05'), None, Timestamp('2024-01-03')]})
+
+
+def fetch(engine, statement):
+    with engine.connect() as conn:
+        return [tuple(row) for row in conn.exec_driver_sql(statement)]
+
+
+def test_csv_fields_keep_empty_text_apart_from_null():
+    rows = [(None, '', 'x "y"\nz', 7, 2.5, True)]
+    staged = ''.join('%s\n' % ','.join(csv_field(v) for v in row) for row in rows)
+    assert staged.startswith(',"",')
+    assert list(iter_csv_rows(io.StringIO(staged))) == [[None, '', 'x "y"\nz', 7, 2.5, 1]]
+
+
+@pytest.mark.parametrize('method', BulkUploader.METHODS)
+def test_methods_keep_nulls_empty_text_and_types(engine, tmp_path, method):
+    uploader = BulkUploader(engine, frame(), 'items', index=False, method=method, stage_dir=str(tmp_path))
+    assert uploader.upload() == 3
+
+    rows = fetch(engine, 'SELECT num, typeof(num), val, typeof(val), txt, typeof(txt), flag, typeof(flag), '
+                         'typeof(at) FROM items ORDER BY rowid')
+    assert rows[0] == (1, 'integer', 1.5, 'real', '', 'text', 1, 'integer', 'text')
+    assert rows[1] == (None, 'null', 2.25, 'real', None, 'null', 0, 'integer', 'null')
+    assert rows[2][:6] == (2 ** 53 + 1, 'integer', None, 'null', 'a, "b"\nc', 'text')
+    assert list(tmp_path.glob('*.csv')) == []
+
+
+def test_csv_on_mssql_requires_a_stage_dir():
+    engine = SimpleNamespace(dialect=mssql.dialect())
+
+    with pytest.raises(ValueError, match='stage_dir'):
+        BulkUploader(engine, frame(), 'items', method='csv')
+
+
+def test_upsert_counts_inserted_updated_and_unchanged(engine):
+    with engine.connect() as conn:
+        conn.exec_driver_sql('CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)')
+        conn.exec_driver_sql("INSERT INTO items VALUES (1, 'a'), (2, 'b')")
+        conn.commit()
+
+        update = DataFrame({'id': [1, 2, 3], 'name': ['a', 'B', 'c']})
+        counts = UpsertUploader(conn, update, 'items', keys='id', index=False).upload()
+
+    assert counts == dict(inserted=1, updated=1, unchanged=1)
+    assert fetch(engine, 'SELECT id, name FROM items ORDER BY id') == [(1, 'a'), (2, 'B'), (3, 'c')]
+
+
+def test_upsert_counts_in_the_write_transaction_of_the_merge(engine):
+    statements = list()
+
+    with engine.connect() as conn:
+        conn.exec_driver_sql('CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)')
+        conn.commit()
+        conn.connection.dbapi_connection.set_trace_callback(statements.append)
+        UpsertUploader(conn, DataFrame({'id': [1], 'name': ['a']}), 'items', keys='id', index=False).upload()
+
+    begin = statements.index('BEGIN IMMEDIATE')
+    count = next(i for i, statement in enumerate(statements) if statement.startswith('SELECT COUNT(*)'))
+    merge = next(i for i, statement in enumerate(statements) if statement.startswith('INSERT INTO items AS t'))
+    assert begin < count < merge < statements.index('COMMIT', merge)
+
+
+def test_mssql_upsert_counts_come_from_the_merge_output():
+    uploader = UpsertUploader(SimpleNamespace(dialect=mssql.dialect()), DataFrame({'id': [1], 'name': ['a']}),
+                              'items', keys='id', index=False)
+    statement = uploader._UpsertUploader__merge_statement()
+
+    assert 'MERGE INTO items WITH (HOLDLOCK) AS t' in statement
+    assert 'OUTPUT $action INTO @actions' in statement
+    assert statement.index('MERGE') < statement.index('SELECT COUNT(CASE')
+
+
+# Partitions write through the DB-API connection, to_sql() transactions read before writing and deadlock on sqlite
+def test_partitioned_upload_loads_every_partition(sql_engine):
+    upload = sql_engine.sql_upload(DataFrame({'name': list('abcde')}), 'items', index=False, parallelism=2,
+                                   method='fast_executemany')
+
+    assert upload.errors is None
+    assert upload.results[0]['status'].tolist() == ['done', 'done']
+    assert sql_engine.sql_execute('SELECT COUNT(*) AS c FROM items').results[0]['c'][0] == 5
+
+
+def test_atomic_upload_moves_rows_and_drops_the_stage(sql_engine):
+    upload = sql_engine.sql_upload(DataFrame({'name': list('abcd')}), 'items', index=False, parallelism=2,
+                                   atomic=True, method='fast_executemany')
+
+    assert upload.errors is None
+    tables = sql_engine.sql_execute("SELECT name FROM sqlite_master WHERE type = 'table'").results[0]
+    assert tables['name'].tolist() == ['items']
+    assert sql_engine.sql_execute('SELECT COUNT(*) AS c FROM items').results[0]['c'][0] == 4
+
+
+def test_failed_atomic_upload_leaves_no_new_table_and_is_not_retried(sql_engine, monkeypatch):
+    sql_upload, calls = sql_engine.sql_upload, list()
+
+    def spy(**params):
+        calls.append(params)
+        return sql_upload(**params)
+
+    monkeypatch.setattr(sql_engine, 'sql_upload', spy)
+    # sqlite cannot bind a dict, so the second partition fails
+    upload = sql_upload(DataFrame({'name': ['a', 'b', {'c': 1}]}, dtype=object), 'items', index=False,
+                        parallelism=2, atomic=True, method='fast_executemany')
+
+    assert upload.errors
+    assert upload.results[0]['status'].tolist() == ['done', 'failed']
+    assert [params['retry'] for params in calls] == [False, False]
+    tables = sql_engine.sql_execute("SELECT name FROM sqlite_master WHERE type = 'table'").results[0]
+    assert tables['name'].tolist() == []
@@ -0,0 +1,52 @@
+from __future__ import unicode_literals
+
+from KGlobal.sql.validator import ConnectionValidator
+from KGlobal.sql.registry import get_sql_engine
+
+
+def test_sqlalchemy_sqlite_connection_is_pinged_with_select_1(sqlite_config):
+    # conn_str configs default to SELECT @@SPID, the sqlite driver under the pooled proxy must switch it to SELECT 1
+    validator = ConnectionValidator.for_config(sqlite_config)
+    engine = get_sql_engine(sqlite_config).connect()
+
+    try:
+        assert validator.validate(engine) == [engine, None]
+        assert validator.stats == dict(validations=1, cached=0, failures=0)
+    finally:
+        engine.close()
+
+
+def test_validation_is_cached_until_invalidated(sqlite_config):
+    validator = ConnectionValidator.for_config(sqlite_config, validate_interval=60)
+    engine = get_sql_engine(sqlite_config).connect()
+
+    try:
+        validator.validate(engine)
+        validator.validate(engine)
+        validator.invalidate(engine)
+        validator.validate(engine)
+        assert validator.stats == dict(validations=2, cached=1, failures=0)
+    finally:
+        engine.close()
+
+
+def test_dead_connection_fails_validation(sqlite_config):
+    validator = ConnectionValidator.for_config(sqlite_config, validate_interval=0)
+    engine = get_sql_engine(sqlite_config).connect()
+    engine.invalidate()
+    engine.close()
+
+    assert validator.validate(engine) == [None, None]
+    assert validator.stats['failures'] == 1
+
+
+def test_engine_connects_to_sqlite(sql_engine):
+    engine, spid = sql_engine.connect()
+
+    try:
+        assert engine is not None
+        assert spid is None
+    finally:
+        engine.close()
+
+    assert sql_engine.engine_spid[0] is not None